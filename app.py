@@ -1,25 +1,37 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-import json, os, re, urllib.parse, base64
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, g
+import json, os, re, urllib.parse, base64, hashlib, hmac, threading, time, atexit, functools
 from datetime import datetime, date
 import calendar
-
+import unicodedata
+from contextlib import contextmanager
 try:
-    import requests
-    import zipfile, io
-    _REQUESTS_OK = True
-except ImportError:
-    _REQUESTS_OK = False
+    import fcntl
+except ImportError:          # Windows
+    fcntl = None
+
+import importlib.util
+
+# requests / zipfile は XServer 連携・GitHub 同期で初めて使う時に import する（起動時間短縮）
+_REQUESTS_OK = importlib.util.find_spec('requests') is not None
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'melmaga-kanri-itashin-2026')
 
+# gunicorn で動かすときは app.logger を gunicorn のエラーログに流す（INFO も出す）
+import logging
+_gunicorn_logger = logging.getLogger('gunicorn.error')
+if _gunicorn_logger.handlers:
+    app.logger.handlers = _gunicorn_logger.handlers
+    app.logger.setLevel(_gunicorn_logger.level)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
+DATA_DIR = os.environ.get('DATA_DIR') or os.path.join(BASE_DIR, 'data')
 os.makedirs(DATA_DIR, exist_ok=True)
 
 CYCLES_FILE    = os.path.join(DATA_DIR, 'cycles.json')
 CONFIG_FILE    = os.path.join(DATA_DIR, 'config.json')
 TEMPLATES_FILE = os.path.join(DATA_DIR, 'email_templates.json')
+ISSUES_FILE    = os.path.join(DATA_DIR, 'issues.json')
 
 # ─── GitHub API によるデータ永続化（Render.com 等クラウド環境用） ──────────────
 # ローカル開発時は GITHUB_TOKEN が未設定のため、通常のファイル I/O のみ使用する。
@@ -27,41 +39,118 @@ _GH_TOKEN  = os.environ.get('GITHUB_TOKEN', '')
 _GH_REPO   = os.environ.get('GITHUB_REPO', 'kim777fk-max/mailmaga')
 _GH_BRANCH = os.environ.get('GITHUB_DATA_BRANCH', 'main')
 _GH_PREFIX = 'data'          # リポジトリ内のデータフォルダ
+_GH_API    = os.environ.get('GITHUB_API_URL', 'https://api.github.com').rstrip('/')
 _USE_GITHUB = bool(_GH_TOKEN and os.environ.get('RENDER'))  # Render.com 上のみ有効
 
+# GitHub 上の各ファイルの最新 SHA と、存在しないファイル名（プロセス内キャッシュ）。
+# 保存のたびに SHA を取り直す GET と、未作成ファイルへの繰り返しの 404 を省く。
+_gh_sha     = {}
+_gh_missing = set()
+
 def _gh_headers():
     return {'Authorization': f'token {_GH_TOKEN}',
             'Accept': 'application/vnd.github.v3+json'}
 
+def _gh_record(op, status, started):
+    """GitHub API 呼び出しの回数・所要時間・ステータスをメトリクスに記録する。"""
+    metric_inc('melmaga_github_requests_total', {'op': op, 'status': status})
+    metric_observe('melmaga_github_request_duration_seconds',
+                   time.perf_counter() - started, {'op': op})
+
 def _gh_read(filename):
     """GitHub から JSON ファイルを読み込む。(data, sha) を返す。"""
-    url = f'https://api.github.com/repos/{_GH_REPO}/contents/{_GH_PREFIX}/{filename}'
+    content, sha = _gh_read_bytes(filename)
+    if content is None:
+        return None, None
+    try:
+        return json_loads(content), sha
+    except ValueError:
+        return None, None
+
+def _gh_read_bytes(filename):
+    """GitHub からファイルをそのまま読み込む。(bytes, sha) を返す。"""
+    import requests
+    url = f'{_GH_API}/repos/{_GH_REPO}/contents/{_GH_PREFIX}/{filename}'
+    started = time.perf_counter()
+    status  = 'error'
     try:
         r = requests.get(url, headers=_gh_headers(),
                          params={'ref': _GH_BRANCH}, timeout=10)
+        status = str(r.status_code)
+        if r.status_code == 404:
+            _gh_missing.add(filename)
+            _gh_sha.pop(filename, None)
         if r.status_code == 200:
             body = r.json()
-            content = base64.b64decode(body['content']).decode('utf-8')
-            return json.loads(content), body['sha']
+            content = base64.b64decode(body['content'])
+            _gh_sha[filename] = body['sha']
+            _gh_missing.discard(filename)
+            return content, body['sha']
     except Exception:
         pass
+    finally:
+        _gh_record('read', status, started)
     return None, None
 
-def _gh_write(filename, data, sha=None):
-    """GitHub に JSON ファイルを書き込む（自動 commit）。"""
-    url = f'https://api.github.com/repos/{_GH_REPO}/contents/{_GH_PREFIX}/{filename}'
-    content = base64.b64encode(
-        json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
-    ).decode('utf-8')
+def _gh_list():
+    """data/ フォルダの一覧を 1 回の API 呼び出しで取得し {filename: sha} を返す。"""
+    import requests
+    url = f'{_GH_API}/repos/{_GH_REPO}/contents/{_GH_PREFIX}'
+    started = time.perf_counter()
+    status  = 'error'
+    try:
+        r = requests.get(url, headers=_gh_headers(),
+                         params={'ref': _GH_BRANCH}, timeout=10)
+        status = str(r.status_code)
+        if r.status_code == 200:
+            return {e['name']: e['sha'] for e in r.json() if e.get('type') == 'file'}
+    except Exception:
+        pass
+    finally:
+        _gh_record('list', status, started)
+    return None
+
+def _gh_write(filename, content, sha=None):
+    """
+    GitHub にファイルを書き込む（自動 commit）。content は base64 済みの文字列。
+    成功時は新しい SHA を返す。
+    """
+    import requests
+    url = f'{_GH_API}/repos/{_GH_REPO}/contents/{_GH_PREFIX}/{filename}'
     body = {'message': f'data: update {filename}',
             'content': content,
             'branch':  _GH_BRANCH}
     if sha:
         body['sha'] = sha
+    started = time.perf_counter()
+    status  = 'error'
     try:
-        requests.put(url, headers=_gh_headers(), json=body, timeout=10)
+        r = requests.put(url, headers=_gh_headers(), json=body, timeout=10)
+        status = str(r.status_code)
+        if r.status_code in (200, 201):
+            new_sha = r.json().get('content', {}).get('sha')
+            _gh_sha[filename] = new_sha
+            _gh_missing.discard(filename)
+            return new_sha
     except Exception:
         pass
+    finally:
+        _gh_record('write', status, started)
+    return None
+
+def _gh_sync(filename, payload):
+    """
+    GitHub に書き込む（payload は commit する形式にエンコード済みのバイト列）。
+    キャッシュ済みの SHA を使い、他ワーカーの更新で SHA が古くなっていた場合
+    （409/422）だけ取り直して 1 回再試行する。
+    """
+    content = base64.b64encode(payload).decode('ascii')
+    sha = _gh_sha.get(filename)
+    if sha is None and filename not in _gh_missing:
+        _, sha = _gh_read(filename)
+    if _gh_write(filename, content, sha) is None:
+        _, sha = _gh_read(filename)
+        _gh_write(filename, content, sha)
 
 DEPARTMENTS = [
     'はじめに',
@@ -162,15 +251,15 @@ def check_login():
 
         if request.endpoint == 'static':
             return
-        if request.path == '/robots.txt':
-            return
+        if request.path in ('/robots.txt', '/metrics'):
+            return   # /metrics はルート側でアクセスキー／管理者を確認する
         if not flask_session.get('entry_ok'):
             abort(404)
 
     # ── ログインチェック ──
     if not _AUTH_ENABLED:
         return
-    if request.endpoint in ('login', 'logout', 'static', 'robots'):
+    if request.endpoint in ('login', 'logout', 'static', 'robots', 'metrics'):
         return
     if not flask_session.get('role'):
         return redirect(url_for('login', next=request.path))
@@ -242,25 +331,553 @@ def robots():
     return app.send_static_file('robots.txt')
 
 
+# ─── テンプレートのバイトコードキャッシュ・静的ファイル ─────────────────────────
+# 各ワーカーがテンプレートを初回表示のたびにソースからコンパイルしないよう、
+# コンパイル結果を .jinja_cache/ に保存してワーカー間・再起動後も使い回す
+# （テンプレートのソースが変わればキャッシュは自動で作り直される）。
+# デプロイ時に `flask --app app precompile-templates` で作っておくと、起動直後の表示も速い。
+# 環境変数:
+#   JINJA_CACHE_DIR … キャッシュの保存先（既定 .jinja_cache）。off で無効
+
+import click
+from jinja2 import FileSystemBytecodeCache
+
+_JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR') or os.path.join(BASE_DIR, '.jinja_cache')
+
+def _jinja_bytecode_cache():
+    """書き込めるディレクトリがなければ None（キャッシュなしで動かす）"""
+    if _JINJA_CACHE_DIR == 'off':
+        return None
+    try:
+        os.makedirs(_JINJA_CACHE_DIR, exist_ok=True)
+    except OSError:
+        return None
+    if not os.access(_JINJA_CACHE_DIR, os.W_OK):
+        return None
+    return FileSystemBytecodeCache(_JINJA_CACHE_DIR)
+
+# jinja_env は初回参照時に作られるので、それより前に設定する
+app.jinja_options = {**app.jinja_options, 'bytecode_cache': _jinja_bytecode_cache()}
+
+@app.cli.command('precompile-templates')
+def precompile_templates():
+    """templates/ のテンプレートをすべてコンパイルしてバイトコードキャッシュに保存する"""
+    env = app.jinja_env
+    if env.bytecode_cache is None:
+        click.echo(f'バイトコードキャッシュが無効です（{_JINJA_CACHE_DIR}）', err=True)
+        return
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    click.echo(f'{len(names)} 件のテンプレートをコンパイルしました → {_JINJA_CACHE_DIR}')
+
+
+# 静的ファイルは内容のハッシュを ?v= に付けて参照し、ブラウザに長期間キャッシュさせる
+_STATIC_MAX_AGE = 365 * 24 * 3600
+
+@functools.lru_cache(maxsize=64)
+def _static_version(filename, mtime):
+    with open(os.path.join(app.static_folder, filename), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:10]
+
+@app.template_global()
+def static_url(filename):
+    """内容のハッシュ付きの静的ファイルの URL"""
+    path = os.path.join(app.static_folder, filename)
+    try:
+        v = _static_version(filename, os.path.getmtime(path))
+    except OSError:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=v)
+
+@app.after_request
+def _static_cache_headers(response):
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public  = True
+        response.cache_control.max_age = _STATIC_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+# ─── メトリクス（Prometheus テキスト形式） ────────────────────────────────────
+# gunicorn の各ワーカーは自分の値をメモリに集計し、data/metrics/<pid>.json へ
+# 一定間隔で書き出す。/metrics は全ワーカーのファイルを合算して返す。
+# 終了したワーカーの counter/histogram は data/metrics/archived.json に畳み込み、
+# <pid>.json は消す（ワーカーの終了時と、gunicorn 起動時の when_ready）。
+# 環境変数:
+#   METRICS_KEY … /metrics?key=xxx（または Authorization: Bearer xxx）で取得可能にする
+#                 未設定時は ACCESS_KEY を流用。いずれもなければ管理者ログインのみ
+
+_METRICS_DIR            = os.path.join(DATA_DIR, 'metrics')
+_METRICS_ARCHIVE        = 'archived.json'
+_METRICS_FLUSH_INTERVAL = 1.0   # 秒
+_METRICS_KEY            = os.environ.get('METRICS_KEY', '') or _ACCESS_KEY
+_LATENCY_BUCKETS        = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# name → (type, help)
+_METRIC_HELP = {
+    'melmaga_http_requests_total':            ('counter',   'HTTP リクエスト数'),
+    'melmaga_http_request_duration_seconds':  ('histogram', 'ルート別のレスポンス時間'),
+    'melmaga_github_requests_total':          ('counter',   'GitHub API 呼び出し数（op/status 別）'),
+    'melmaga_github_request_duration_seconds': ('histogram', 'GitHub API 呼び出し時間'),
+    'melmaga_xserver_fetches_total':          ('counter',   'XServer 一括取得の回数（結果別）'),
+    'melmaga_xserver_fetch_duration_seconds': ('histogram', 'XServer 一括取得の所要時間'),
+    'melmaga_xserver_fetch_bytes_total':      ('counter',   'XServer から取得した ZIP のバイト数'),
+    'melmaga_xserver_articles_total':         ('counter',   'XServer から取得した原稿数'),
+    'melmaga_docx_extract_total':             ('counter',   '.docx 本文抽出の件数（キャッシュ hit/miss 別）'),
+    'melmaga_scheduler_actions_total':        ('counter',   'スケジューラのアクション実行数（action/result 別）'),
+    'melmaga_smtp_messages_total':            ('counter',   'SMTP 送信の試行数（sent/retry/failed 別）'),
+    'melmaga_smtp_connections_total':         ('counter',   'SMTP 接続の確立数'),
+    'melmaga_batch_ops_total':                ('counter',   '一括更新 API で適用した操作数'),
+    'melmaga_xserver_list_responses_total':   ('counter',   'XServer 一覧 API の応答数（full/delta 別）'),
+    'melmaga_submission_index_updates_total': ('counter',   '提出状況の索引を更新した回数（取得元別）'),
+    'melmaga_cache_requests_total':           ('counter',   'キャッシュ参照数（hit/miss 別）'),
+    'melmaga_cache_hit_ratio':                ('gauge',     'キャッシュヒット率（全ワーカー合算）'),
+    'melmaga_save_queue_depth':               ('gauge',     '処理中の保存（ローカル書き込み＋GitHub 同期）の数'),
+    'melmaga_snapshot_responses_total':       ('counter',   '閲覧ロールへの応答数（スナップショット hit/stale/miss 別）'),
+    'melmaga_snapshot_build_duration_seconds': ('histogram', 'スナップショットの生成時間'),
+    'melmaga_snapshot_pages_built_total':     ('counter',   '作り直した画面の数（ダッシュボード＋変わった号）'),
+}
+
+_metrics_lock       = threading.Lock()
+_metrics_pid        = None
+_metrics_data       = None
+_metrics_last_flush = 0.0
+
+
+def _metrics_state():
+    """このプロセス用の集計領域を返す（fork 後は親の値を引き継がずに初期化する）。"""
+    global _metrics_pid, _metrics_data
+    pid = os.getpid()
+    if _metrics_pid != pid:
+        _metrics_pid  = pid
+        _metrics_data = {'counter': {}, 'gauge': {}, 'histogram': {}}
+    return _metrics_data
+
+def _metric_labels(labels):
+    """ラベル dict を Prometheus 形式の文字列（k="v",...）にする。"""
+    if not labels:
+        return ''
+    def esc(v):
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{k}="{esc(v)}"' for k, v in sorted(labels.items()))
+
+def metric_inc(name, labels=None, value=1):
+    with _metrics_lock:
+        series = _metrics_state()['counter'].setdefault(name, {})
+        key = _metric_labels(labels)
+        series[key] = series.get(key, 0) + value
+
+def metric_gauge_add(name, delta, labels=None):
+    with _metrics_lock:
+        series = _metrics_state()['gauge'].setdefault(name, {})
+        key = _metric_labels(labels)
+        series[key] = series.get(key, 0) + delta
+
+def metric_observe(name, value, labels=None):
+    with _metrics_lock:
+        series = _metrics_state()['histogram'].setdefault(name, {})
+        h = series.setdefault(_metric_labels(labels),
+                              {'buckets': [0] * len(_LATENCY_BUCKETS), 'sum': 0.0, 'count': 0})
+        for i, le in enumerate(_LATENCY_BUCKETS):
+            if value <= le:
+                h['buckets'][i] += 1
+        h['sum']   += value
+        h['count'] += 1
+
+def _metrics_flush(force=False):
+    """このワーカーの集計値を data/metrics/<pid>.json に書き出す（間引きあり）。"""
+    global _metrics_last_flush
+    now = time.monotonic()
+    if not force and now - _metrics_last_flush < _METRICS_FLUSH_INTERVAL:
+        return
+    with _metrics_lock:
+        _metrics_last_flush = now
+        payload = json.dumps(_metrics_state())
+        pid = _metrics_pid
+    try:
+        os.makedirs(_METRICS_DIR, exist_ok=True)
+        path = os.path.join(_METRICS_DIR, f'{pid}.json')
+        tmp  = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+@contextmanager
+def _metrics_locked():
+    """data/metrics/.lock の排他ロック（畳み込みと合算が重ならないように）。"""
+    os.makedirs(_METRICS_DIR, exist_ok=True)
+    with open(os.path.join(_METRICS_DIR, '.lock'), 'a') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _metrics_read(fname):
+    try:
+        with open(os.path.join(_METRICS_DIR, fname), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return None
+
+def _metrics_merge(total, data):
+    """data の counter/histogram を total に足し込む（gauge は現在値なので扱わない）。"""
+    for kind in ('counter', 'histogram'):
+        for name, series in data.get(kind, {}).items():
+            dst = total[kind].setdefault(name, {})
+            for key, v in series.items():
+                if kind == 'counter':
+                    dst[key] = dst.get(key, 0) + v
+                    continue
+                h = dst.setdefault(key, {'buckets': [0] * len(_LATENCY_BUCKETS),
+                                         'sum': 0.0, 'count': 0})
+                h['buckets'] = [a + b for a, b in zip(h['buckets'], v['buckets'])]
+                h['sum']   += v['sum']
+                h['count'] += v['count']
+
+def _metrics_fold(pids):
+    """終了したワーカーの <pid>.json を archived.json に足し込んで消す。"""
+    with _metrics_locked():
+        archive = _metrics_read(_METRICS_ARCHIVE) or {'counter': {}, 'histogram': {}}
+        folded  = []
+        for pid in pids:
+            data = _metrics_read(f'{pid}.json')
+            if data is not None:
+                _metrics_merge(archive, data)
+                folded.append(pid)
+        if not folded:
+            return
+        path = os.path.join(_METRICS_DIR, _METRICS_ARCHIVE)
+        try:
+            with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+                json.dump(archive, f)
+            os.replace(f'{path}.tmp', path)
+            for pid in folded:
+                os.remove(os.path.join(_METRICS_DIR, f'{pid}.json'))
+        except OSError:
+            pass
+
+def metrics_fold_dead():
+    """終了済みのプロセスが残した <pid>.json をまとめて畳み込む（gunicorn の when_ready から呼ぶ）。"""
+    try:
+        names = os.listdir(_METRICS_DIR)
+    except OSError:
+        return
+    pids = []
+    for fname in names:
+        if fname.endswith('.json') and fname[:-5].isdigit():
+            pid = int(fname[:-5])
+            if pid != os.getpid() and not _pid_alive(pid):
+                pids.append(pid)
+    if pids:
+        _metrics_fold(pids)
+
+def _metrics_exit():
+    """終了時に最後の値を書き出し、自分のファイルを archived.json に畳み込む。"""
+    _metrics_flush(True)
+    _metrics_fold([_metrics_pid])
+
+atexit.register(_metrics_exit)
+
+def _metrics_collect():
+    """全ワーカーのファイルと archived.json を読み込み、counter/gauge/histogram を合算する。"""
+    total = {'counter': {}, 'gauge': {}, 'histogram': {}}
+    with _metrics_locked():
+        try:
+            names = os.listdir(_METRICS_DIR)
+        except OSError:
+            names = []
+        archive = _metrics_read(_METRICS_ARCHIVE)
+        if archive:
+            _metrics_merge(total, archive)
+        for fname in names:
+            if not fname.endswith('.json') or not fname[:-5].isdigit():
+                continue
+            data = _metrics_read(fname)
+            if data is None:
+                continue
+            _metrics_merge(total, data)
+            # gauge は現在値なので、終了済みワーカーの値は捨てる
+            if _pid_alive(int(fname[:-5])):
+                for name, series in data.get('gauge', {}).items():
+                    dst = total['gauge'].setdefault(name, {})
+                    for key, v in series.items():
+                        dst[key] = dst.get(key, 0) + v
+
+    # キャッシュヒット率（cache ラベル別）
+    hits = {}
+    for key, v in total['counter'].get('melmaga_cache_requests_total', {}).items():
+        m = re.match(r'cache="([^"]*)",result="(hit|miss)"', key)
+        if m:
+            h = hits.setdefault(m.group(1), [0, 0])
+            h[0 if m.group(2) == 'hit' else 1] += v
+    if hits:
+        total['gauge']['melmaga_cache_hit_ratio'] = {
+            _metric_labels({'cache': c}): (h / (h + m) if h + m else 0.0)
+            for c, (h, m) in hits.items()
+        }
+    return total
+
+def _metrics_render(total):
+    """合算済みの値を Prometheus テキスト形式にする。"""
+    out = []
+    for kind in ('counter', 'gauge', 'histogram'):
+        for name in sorted(total[kind]):
+            mtype, help_text = _METRIC_HELP.get(name, (kind, name))
+            out.append(f'# HELP {name} {help_text}')
+            out.append(f'# TYPE {name} {mtype}')
+            for key, v in sorted(total[kind][name].items()):
+                if kind != 'histogram':
+                    out.append(f'{name}{{{key}}} {v}' if key else f'{name} {v}')
+                    continue
+                sep = ',' if key else ''
+                for le, n in zip(_LATENCY_BUCKETS, v['buckets']):
+                    out.append(f'{name}_bucket{{{key}{sep}le="{le}"}} {n}')
+                out.append(f'{name}_bucket{{{key}{sep}le="+Inf"}} {v["count"]}')
+                out.append(f'{name}_sum{{{key}}} {v["sum"]}' if key else f'{name}_sum {v["sum"]}')
+                out.append(f'{name}_count{{{key}}} {v["count"]}' if key else f'{name}_count {v["count"]}')
+    return '\n'.join(out) + '\n'
+
+
+@app.before_request
+def _metrics_start_timer():
+    g.metrics_started = time.perf_counter()
+
+@app.after_request
+def _metrics_record_request(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        route  = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = {'route': route, 'method': request.method}
+        metric_observe('melmaga_http_request_duration_seconds',
+                       time.perf_counter() - started, labels)
+        metric_inc('melmaga_http_requests_total',
+                   {**labels, 'status': str(response.status_code)})
+    _metrics_flush()
+    return response
+
+
+def _metrics_authorized():
+    """/metrics の取得を許可するか。アクセスキー一致、または管理者セッション。"""
+    auth = request.headers.get('Authorization', '')
+    key  = auth[7:].strip() if auth.startswith('Bearer ') else request.args.get('key', '')
+    if _METRICS_KEY and key and hmac.compare_digest(key, _METRICS_KEY):
+        return True
+    if _ACCESS_KEY and not flask_session.get('entry_ok'):
+        return False
+    return is_admin()
+
+@app.route('/metrics')
+def metrics():
+    from flask import abort
+    if not _metrics_authorized():
+        abort(404)
+    _metrics_flush(force=True)
+    return (_metrics_render(_metrics_collect()), 200,
+            {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+
+# ─── リクエスト単位のプロファイリング（管理者のみ） ──────────────────────────
+# ?_profile=1 または X-Profile: 1 ヘッダー付きのリクエストを cProfile で計測し、
+# data/profiles/ に保存する。保持件数は PROFILE_KEEP（既定 20 件）。
+
+_PROFILE_DIR  = os.path.join(DATA_DIR, 'profiles')
+_PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '20'))
+_PROFILE_NAME = re.compile(r'^[0-9]{8}_[0-9]{6}_[A-Za-z0-9_.-]+$')
+
+
+@app.before_request
+def _profile_start():
+    if request.args.get('_profile') != '1' and request.headers.get('X-Profile') != '1':
+        return
+    if not is_admin():
+        return
+    import cProfile
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:
+        return   # 別のプロファイラが動作中
+    g.profiler        = prof
+    g.profile_started = time.perf_counter()
+
+@app.after_request
+def _profile_finish(response):
+    prof = g.pop('profiler', None)
+    if prof is None:
+        return response
+    prof.disable()
+    elapsed = time.perf_counter() - g.pop('profile_started')
+    try:
+        name = _profile_save(prof, elapsed, response.status_code)
+        response.headers['X-Profile-Id'] = name
+    except OSError:
+        pass
+    return response
+
+def _profile_save(prof, elapsed, status):
+    """計測結果を .prof（pstats 形式）・.txt（上位関数）・.json（概要）で保存する。"""
+    import io as _io, pstats
+    os.makedirs(_PROFILE_DIR, exist_ok=True)
+    endpoint = re.sub(r'[^A-Za-z0-9_.-]', '_', request.endpoint or 'unmatched')
+    name = f'{datetime.now():%Y%m%d_%H%M%S}_{endpoint}_{os.getpid()}_{int(elapsed * 1000)}ms'
+    base = os.path.join(_PROFILE_DIR, name)
+
+    prof.dump_stats(base + '.prof')
+    out = _io.StringIO()
+    pstats.Stats(prof, stream=out).sort_stats('cumulative').print_stats(60)
+    with open(base + '.txt', 'w', encoding='utf-8') as f:
+        f.write(out.getvalue())
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'name':       name,
+                   'method':     request.method,
+                   'path':       request.full_path.rstrip('?'),
+                   'endpoint':   request.endpoint,
+                   'status':     status,
+                   'elapsed_ms': round(elapsed * 1000, 1),
+                   'created_at': datetime.now().isoformat(timespec='seconds')},
+                  f, ensure_ascii=False)
+
+    _profile_prune()
+    return name
+
+def _profile_prune():
+    """保持件数を超えた古いプロファイルを削除する。"""
+    metas = sorted(f for f in os.listdir(_PROFILE_DIR) if f.endswith('.json'))
+    for meta in metas[:max(0, len(metas) - _PROFILE_KEEP)]:
+        for ext in ('.json', '.prof', '.txt'):
+            try:
+                os.remove(os.path.join(_PROFILE_DIR, meta[:-5] + ext))
+            except OSError:
+                pass
+
+def list_profiles():
+    """保存済みプロファイルの概要を新しい順に返す。"""
+    result = []
+    if not os.path.isdir(_PROFILE_DIR):
+        return result
+    for fname in sorted(os.listdir(_PROFILE_DIR), reverse=True):
+        if not fname.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(_PROFILE_DIR, fname), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            meta['size_kb'] = round(
+                os.path.getsize(os.path.join(_PROFILE_DIR, fname[:-5] + '.prof')) / 1024, 1)
+        except (OSError, ValueError):
+            continue
+        result.append(meta)
+    return result
+
+
+@app.route('/admin/profiles')
+@admin_required
+def profiles():
+    return render_template('profiles.html', profiles=list_profiles(), keep=_PROFILE_KEEP)
+
+
+@app.route('/admin/profiles/<name>')
+@admin_required
+def profile_view(name):
+    from flask import abort
+    path = os.path.join(_PROFILE_DIR, name + '.txt')
+    if not _PROFILE_NAME.match(name) or not os.path.exists(path):
+        abort(404)
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+
+@app.route('/admin/profiles/<name>/download')
+@admin_required
+def profile_download(name):
+    from flask import abort, send_file
+    path = os.path.join(_PROFILE_DIR, name + '.prof')
+    if not _PROFILE_NAME.match(name) or not os.path.exists(path):
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=name + '.prof',
+                     mimetype='application/octet-stream')
+
+
+# ─── JSON シリアライズ ────────────────────────────────────────────────────────
+# orjson があれば使い、なければ標準の json で同じ出力を作る。
+# ・canonical … GitHub に commit する形式（indent=2・キーは挿入順）。差分が読みやすい
+# ・compact   … 空白なし。GitHub が正本のクラウド環境ではローカルはキャッシュなのでこちら
+# ローカルの形式は DATA_FORMAT（compact / canonical）で変えられる。既定は
+# GitHub 同期ありなら compact、なし（data/ を git で管理するローカル開発）なら canonical。
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_LOCAL_COMPACT = os.environ.get('DATA_FORMAT',
+                                'compact' if _USE_GITHUB else 'canonical') == 'compact'
+
+def json_loads(raw):
+    """bytes / str の JSON を読み込む。"""
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def json_dumps_compact(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def json_dumps_canonical(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+def json_dumps_local(data):
+    return json_dumps_compact(data) if _LOCAL_COMPACT else json_dumps_canonical(data)
+
+
 # ─── Data helpers ────────────────────────────────────────────────────────────
 
+def _write_local_bytes(filepath, payload):
+    """一時ファイルに書いてから置き換える（他ワーカーが書きかけを読まないように）。"""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp = f'{filepath}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp, filepath)
+
+def _write_local_json(filepath, data):
+    _write_local_bytes(filepath, json_dumps_local(data))
+
 def load_json(filepath, default):
     """
     ローカルファイルから JSON を読み込む。
     クラウド環境（RENDER=true）かつローカルファイルがなければ GitHub から復元する。
     """
     if os.path.exists(filepath):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        metric_inc('melmaga_cache_requests_total', {'cache': 'data_file', 'result': 'hit'})
+        with open(filepath, 'rb') as f:
+            return json_loads(f.read())
 
-    if _USE_GITHUB:
-        filename = os.path.basename(filepath)
+    metric_inc('melmaga_cache_requests_total', {'cache': 'data_file', 'result': 'miss'})
+    filename = os.path.basename(filepath)
+    if _USE_GITHUB and filename not in _gh_missing:
         data, _ = _gh_read(filename)
         if data is not None:
             # ローカルにキャッシュして次回以降のAPIコールを省く
-            os.makedirs(os.path.dirname(filepath), exist_ok=True)
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            _write_local_json(filepath, data)
             return data
 
     return default() if callable(default) else default
@@ -269,14 +886,43 @@ def save_json(filepath, data):
     """
     ローカルに保存し、クラウド環境では GitHub にも同期する。
     """
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    metric_gauge_add('melmaga_save_queue_depth', 1)
+    try:
+        # 形式ごとに 1 回だけエンコードする（同じ形式ならローカルと GitHub で共用）
+        local = json_dumps_local(data)
+        _write_local_bytes(filepath, local)
+        snapshot_mark_dirty()
+        if _USE_GITHUB:
+            remote = json_dumps_canonical(data) if _LOCAL_COMPACT else local
+            _gh_sync(os.path.basename(filepath), remote)
+    finally:
+        metric_gauge_add('melmaga_save_queue_depth', -1)
+
+def warm_data_cache():
+    """
+    起動直後のウォームアップ。GitHub の data/ 一覧を 1 回で取得し、
+    ローカルにないファイルを並列に取得して data/ と SHA キャッシュを埋める。
+    gunicorn.conf.py の when_ready から、ワーカー起動前に 1 度だけ呼ばれる。
+    """
+    if not _USE_GITHUB:
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    targets = [os.path.basename(p) for p in (CYCLES_FILE, CONFIG_FILE, TEMPLATES_FILE)]
+    listing = _gh_list()
+    if listing is not None:
+        _gh_sha.update({k: v for k, v in listing.items() if k in targets})
+        _gh_missing.update(t for t in targets if t not in listing)
+        targets = [t for t in targets if t in listing]
+    targets = [t for t in targets if not os.path.exists(os.path.join(DATA_DIR, t))]
+
+    def fetch(filename):
+        data, _ = _gh_read(filename)
+        if data is not None:
+            _write_local_json(os.path.join(DATA_DIR, filename), data)
 
-    if _USE_GITHUB:
-        filename = os.path.basename(filepath)
-        _, sha = _gh_read(filename)   # 既存ファイルの SHA を取得（更新に必要）
-        _gh_write(filename, data, sha)
+    with ThreadPoolExecutor(max_workers=max(1, len(targets))) as pool:
+        list(pool.map(fetch, targets))
+    _rev_restore_log()
 
 def load_cycles():   return load_json(CYCLES_FILE, [])
 def save_cycles(c):  save_json(CYCLES_FILE, c)
@@ -442,11 +1088,10 @@ def get_default_templates():
 def load_templates():
     return load_json(TEMPLATES_FILE, get_default_templates)
 
-def render_vars(text, cycle, config):
-    if not text:
-        return ''
+def template_vars(cycle, config):
+    """テンプレートの差し込み変数（号・設定ごとに 1 回作れば使い回せる）"""
     sched = cycle.get('schedule', {})
-    vars = {
+    return {
         'vol':               cycle.get('vol', ''),
         'delivery_year':     cycle.get('delivery_year', ''),
         'delivery_month':    cycle.get('delivery_month', ''),
@@ -463,10 +1108,38 @@ def render_vars(text, cycle, config):
         'contact_email':     config.get('contact_email', ''),
         'sender_name':       config.get('sender_name', ''),
         'sender_email':      config.get('sender_email', ''),
+        'missing_departments': '、'.join(missing_departments(cycle, config)),
     }
+
+@functools.lru_cache(maxsize=128)
+def _compile_template(text):
+    """
+    テンプレートを (固定文字列, 変数名) の並びに分解しておく。
+    書式指定や属性参照を含む場合・書式が壊れている場合は None（str.format に任せる）。
+    """
+    import string
     try:
-        return text.format(**vars)
-    except (KeyError, ValueError):
+        parts = list(string.Formatter().parse(text))
+    except ValueError:
+        return None
+    compiled = []
+    for literal, field, spec, conv in parts:
+        if field is not None and (spec or conv or not field.isidentifier()):
+            return None
+        compiled.append((literal, field))
+    return tuple(compiled)
+
+def render_vars(text, cycle, config, vars=None):
+    if not text:
+        return ''
+    if vars is None:
+        vars = template_vars(cycle, config)
+    compiled = _compile_template(text)
+    try:
+        if compiled is None:
+            return text.format(**vars)
+        return ''.join(lit + ('' if f is None else str(vars[f])) for lit, f in compiled)
+    except (KeyError, ValueError, IndexError):
         return text
 
 
@@ -486,32 +1159,208 @@ def scan_submissions(folder_path):
             if ext not in ('.txt', '.docx', '.doc'):
                 continue
 
-            dept = None
-            if ext == '.txt':
-                # YYYYMMDD_HHMMSS_部署名.txt
-                parts = fname[:-4].split('_')
-                if len(parts) >= 3:
-                    dept = '_'.join(parts[2:])
-            else:
-                # テンプレート_（部署名）.docx
-                m = re.search(r'[（(]([^）)]+)[）)]', fname)
-                if m:
-                    dept = m.group(1)
-
-            key = dept or fname
+            key = submission_dept_from_filename(fname) or fname
             if key not in result:
                 result[key] = []
+            mtime = datetime.fromtimestamp(os.path.getmtime(fpath))
             result[key].append({
-                'filename': fname,
-                'path':     fpath,
-                'size_kb':  round(os.path.getsize(fpath) / 1024, 1),
-                'modified': datetime.fromtimestamp(os.path.getmtime(fpath)).strftime('%m/%d %H:%M'),
-                'ext':      ext,
+                'filename':    fname,
+                'path':        fpath,
+                'size_kb':     round(os.path.getsize(fpath) / 1024, 1),
+                'modified':    mtime.strftime('%m/%d %H:%M'),
+                'modified_at': mtime.isoformat(timespec='seconds'),
+                'ext':         ext,
             })
     except Exception:
         pass
     return result
 
+def submission_dept_from_filename(fname):
+    """提出ファイル名から部署名を取り出す（取り出せなければ空文字）"""
+    base, ext = os.path.splitext(fname)
+    if ext.lower() == '.txt':
+        # YYYYMMDD_HHMMSS_部署名.txt
+        parts = base.split('_')
+        return '_'.join(parts[2:]) if len(parts) >= 3 else ''
+    # テンプレート_（部署名）.docx
+    m = re.search(r'[（(]([^）)]+)[）)]', fname)
+    return m.group(1) if m else ''
+
+
+# ─── 部署名の正規化と提出状況の索引 ────────────────────────────────────────────
+# 号ごとに「正式な部署名 → 最新の提出（版・ファイル名・提出日時）」を cycle['submission_index'] に持つ。
+# フォルダのスキャン・XServer からの取得のたびに差分だけ更新するので、
+# 未提出の部署はファイルを読まずにすぐ分かる。部署名に当てはまらなかったものは
+# cycle['submission_unmatched'] に残し、設定で別名を登録すると次の参照から反映される。
+
+# 設定画面の別名（config['dept_aliases']）に加えて常に使う別名
+DEFAULT_DEPT_ALIASES = {
+    '会長':       '会長挨拶',
+    'BCP':        '板橋区簡易型BCP策定支援事業',
+    '簡易型BCP':  '板橋区簡易型BCP策定支援事業',
+}
+
+# 未提出の部署だけに送れるステップ
+MISSING_TARGET_STEPS = ('deadline_reminder', 'deadline')
+
+def _dept_key(name):
+    """比較用の部署名（NFKC・空白除去・括弧除去・小文字）"""
+    s = unicodedata.normalize('NFKC', name or '')
+    s = re.sub(r'\s+', '', s).strip('【】[]「」『』()<>')
+    return s.lower()
+
+@functools.lru_cache(maxsize=8)
+def _dept_lookup(aliases):
+    """比較用の名前 → 正式な部署名。aliases は (別名, 部署名) のタプル。"""
+    lookup = {}
+    for d in DEPARTMENTS:
+        # 「研修部」は「研修」、「コンプライアンス室」は「コンプライアンス」でも当てる
+        if d[-1] in '部室' and len(d) > 2:
+            lookup.setdefault(_dept_key(d[:-1]), d)
+    for alias, dept in list(DEFAULT_DEPT_ALIASES.items()) + list(aliases):
+        if dept in DEPARTMENTS:
+            lookup[_dept_key(alias)] = dept
+    for d in DEPARTMENTS:
+        lookup[_dept_key(d)] = d
+    return lookup
+
+def normalize_dept(name, config=None):
+    """部署名（表記ゆれ・別名を含む）を DEPARTMENTS の正式名にする。当てはまらなければ None。"""
+    aliases = tuple(sorted((config or {}).get('dept_aliases', {}).items()))
+    return _dept_lookup(aliases).get(_dept_key(name))
+
+def _submission_time(filename, fallback):
+    """YYYYMMDD_HHMMSS_ で始まるファイル名ならその日時、なければ fallback"""
+    m = re.match(r'(\d{8})_(\d{6})_', filename or '')
+    if m:
+        try:
+            return datetime.strptime(m.group(1) + m.group(2), '%Y%m%d%H%M%S').isoformat()
+        except ValueError:
+            pass
+    return fallback
+
+def index_submissions(cycle, items, source, config=None):
+    """
+    提出物を号の索引に反映する。変更があれば True（保存は呼び出し側）。
+    items = [{dept, filename, rev?, modified_at?}, ...]。dept は原稿の見出しやファイル名から
+    取り出した名前のままでよい（ここで正式名に寄せる）。
+    """
+    index     = cycle.setdefault('submission_index', {})
+    unmatched = cycle.setdefault('submission_unmatched', {})
+    now       = datetime.now().isoformat(timespec='seconds')
+    changed   = False
+    for item in items:
+        filename = item.get('filename', '')
+        raw      = item.get('dept') or ''
+        dept     = (normalize_dept(raw, config)
+                    or normalize_dept(submission_dept_from_filename(filename), config))
+        entry = {'filename':     filename,
+                 'rev':          item.get('rev', ''),
+                 'source':       source,
+                 'submitted_at': _submission_time(filename, item.get('modified_at') or now)}
+        if dept is None:
+            key = raw or filename
+            old = unmatched.get(key)
+            if old is None or (old['submitted_at'], old['filename']) < (entry['submitted_at'], filename):
+                unmatched[key] = entry
+                changed = True
+            continue
+        if unmatched.pop(raw or filename, None) is not None:
+            changed = True   # 別名の登録で部署が分かるようになった
+
+        old = index.get(dept)
+        if old and old['filename'] == filename:
+            # 同じファイル: 版が分かった・変わった時だけ更新（フォルダのスキャンは版を持たない）
+            if entry['rev'] and entry['rev'] != old.get('rev'):
+                index[dept] = {**old, 'rev': entry['rev'], 'source': source}
+                changed = True
+            continue
+        if old is None or (old['submitted_at'], old['filename']) < (entry['submitted_at'], filename):
+            if raw and raw != dept:
+                entry['raw_dept'] = raw
+            index[dept] = entry
+            changed = True
+    return changed
+
+def record_submissions(cycle_id, items, source):
+    """index_submissions を号データに反映して保存する（変更がなければ保存しない）。"""
+    cycles = load_cycles()
+    cycle  = next((c for c in cycles if c['id'] == cycle_id), None)
+    if cycle and index_submissions(cycle, items, source, load_config()):
+        save_cycles(cycles)
+        metric_inc('melmaga_submission_index_updates_total', {'source': source})
+
+def overlay_folder_submissions(cycle, config, submissions=None):
+    """
+    提出フォルダの中身を号の索引に重ねる（メモリ上だけ）。GET の画面・API 用で保存はしない。
+    保存は refresh_submissions（管理者の再スキャン・スケジューラ）と XServer 取得で行う。
+    """
+    if submissions is None:
+        submissions = scan_submissions(cycle.get('submissions_folder', ''))
+    index_submissions(cycle, scanned_submission_items(submissions), 'folder', config)
+    return submissions
+
+def refresh_submissions(cycle_id):
+    """提出フォルダを読み直し、原稿の版と提出状況の索引を保存する。変更があれば True。"""
+    cycles = load_cycles()
+    cycle  = next((c for c in cycles if c['id'] == cycle_id), None)
+    if not cycle:
+        return False
+    items = scanned_submission_items(scan_submissions(cycle.get('submissions_folder', '')))
+    # 読める原稿は本文の版（rev）も索引に残す（同じファイルの項目に版が付く）
+    items += record_revisions(cycle_id, load_assemble_articles(cycle), 'folder')
+    if not index_submissions(cycle, items, 'folder', load_config()):
+        return False
+    save_cycles(cycles)
+    metric_inc('melmaga_submission_index_updates_total', {'source': 'folder'})
+    return True
+
+def scanned_submission_items(submissions):
+    """scan_submissions の結果を index_submissions に渡す形にする"""
+    return [{'dept': key, 'filename': f['filename'], 'modified_at': f.get('modified_at')}
+            for key, files in submissions.items() for f in files]
+
+def submission_status(cycle, config=None):
+    """
+    提出済み {部署: 索引の項目}・未提出の部署（DEPARTMENTS 順）・部署に当てはまらない提出物を返す。
+    別名を後から登録した場合に備えて、当てはまらなかったものもここで引き直す。
+    """
+    submitted = dict(cycle.get('submission_index', {}))
+    unmatched = {}
+    for raw, entry in cycle.get('submission_unmatched', {}).items():
+        dept = normalize_dept(raw, config)
+        if dept is None:
+            unmatched[raw] = entry
+        elif dept not in submitted or submitted[dept]['submitted_at'] < entry['submitted_at']:
+            submitted[dept] = {**entry, 'raw_dept': raw}
+    missing = [d for d in DEPARTMENTS if d not in submitted]
+    return {'submitted': submitted, 'missing': missing, 'unmatched': unmatched}
+
+def missing_departments(cycle, config=None):
+    return submission_status(cycle, config)['missing']
+
+def missing_recipients_text(cycle, config):
+    """未提出の部署の連絡先（config['dept_contacts']）を宛先リストの形で返す"""
+    contacts = config.get('dept_contacts', {})
+    return '\n'.join(contacts[d] for d in missing_departments(cycle, config) if contacts.get(d))
+
+def parse_dept_settings(text):
+    """
+    「名前 = 部署名」「部署名: 連絡先」のような 1 行 1 件の設定を {左辺: 右辺} にする。
+    戻り値: (dict, 解釈できなかった行)
+    """
+    result, invalid = {}, []
+    for line in (text or '').splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        m = re.match(r'^(.+?)\s*[=＝:：]\s*(.+)$', line)
+        if not m:
+            invalid.append(line)
+            continue
+        result[m.group(1).strip()] = m.group(2).strip()
+    return result, invalid
+
 
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 
@@ -552,16 +1401,31 @@ def suggest_next_cycle(cycles):
 
 # ─── Routes ───────────────────────────────────────────────────────────────────
 
-@app.route('/')
-def dashboard():
-    cycles = load_cycles()
-    cycles.sort(key=lambda c: (c['delivery_year'], c['delivery_month']), reverse=True)
+# 閲覧用の JSON（?format=json）に含める号の項目
+SUMMARY_FIELDS = ('id', 'vol', 'delivery_year', 'delivery_month', 'schedule', 'steps', 'progress')
+
+def cycle_summary(cycle):
+    return {k: cycle.get(k) for k in SUMMARY_FIELDS}
+
+
+def dashboard_page(cycles, fmt=None):
+    """読み込み済みの号からダッシュボード（fmt='json' なら JSON）を作る。保存はしない。"""
+    cycles = sorted(cycles, key=lambda c: (c['delivery_year'], c['delivery_month']), reverse=True)
     for c in cycles:
         add_progress(c)
     current = get_current_cycle(cycles)
     today   = date.today().strftime('%Y/%m/%d')
+    flags   = due_flags(current) if current else []
+    if fmt == 'json':
+        return jsonify({'today': today, 'current': current['id'] if current else None,
+                        'flags': flags, 'cycles': [cycle_summary(c) for c in cycles]})
     return render_template('dashboard.html', cycles=cycles, current=current,
-                           steps=STEPS, today=today)
+                           steps=STEPS, today=today, flags=flags)
+
+
+@app.route('/')
+def dashboard():
+    return dashboard_page(load_cycles(), request.args.get('format'))
 
 
 @app.route('/cycle/new', methods=['GET', 'POST'])
@@ -592,6 +1456,7 @@ def cycle_new():
         }
         cycles.append(new_cycle)
         save_cycles(cycles)
+        scheduler_reschedule(new_cycle)
         return redirect(url_for('cycle_detail', cycle_id=cycle_id))
 
     cycles = load_cycles()
@@ -632,39 +1497,56 @@ def cycle_edit_info(cycle_id):
     cycle['schedule']       = calc_schedule(new_year, new_month)
 
     save_cycles(cycles)
+    scheduler_reschedule(cycle, old_id=cycle_id)
     flash('号情報を更新しました', 'success')
     return redirect(url_for('cycle_detail', cycle_id=new_id))
 
 
 @app.route('/cycle/<cycle_id>')
 def cycle_detail(cycle_id):
-    cycles = load_cycles()
-    cycle  = next((c for c in cycles if c['id'] == cycle_id), None)
+    cycle = next((c for c in load_cycles() if c['id'] == cycle_id), None)
     if not cycle:
         flash('指定の号が見つかりません', 'error')
         return redirect(url_for('dashboard'))
+    return cycle_detail_page(cycle, load_config(), load_templates(),
+                             list_revisions(cycle_id), request.args.get('format'))
 
-    add_progress(cycle)
-    config      = load_config()
+
+def cycle_detail_page(cycle, config, templates, history, fmt=None):
+    """
+    読み込み済みのデータから号の詳細（fmt='json' なら JSON）を作る。保存はしない。
+    history は list_revisions(cycle_id) の結果。
+    """
     today       = date.today().strftime('%Y/%m/%d')
-    submissions = scan_submissions(cycle.get('submissions_folder', ''))
-    templates   = load_templates()
+    submissions = overlay_folder_submissions(cycle, config)
+    add_progress(cycle)
+    if fmt == 'json':
+        return jsonify({'today': today, 'cycle': {**cycle_summary(cycle), 'notes': cycle.get('notes', '')},
+                        'submissions': submission_status(cycle, config)})
 
     # Build email previews for steps that have templates
     email_previews = {}
+    vars = template_vars(cycle, config)
     for step in STEPS:
         if step['has_email'] and step['key'] in templates:
             tmpl = templates[step['key']]
             email_previews[step['key']] = {
-                'subject': render_vars(tmpl.get('subject', ''), cycle, config),
-                'to':      render_vars(tmpl.get('to',      ''), cycle, config),
-                'cc':      render_vars(tmpl.get('cc',      ''), cycle, config),
+                'subject': render_vars(tmpl.get('subject', ''), cycle, config, vars),
+                'to':      render_vars(tmpl.get('to',      ''), cycle, config, vars),
+                'cc':      render_vars(tmpl.get('cc',      ''), cycle, config, vars),
             }
 
+    # 版の比較は 2 版以上ある部署だけ
+    revisions = {d: h for d, h in history.items() if len(h) > 1}
+
+    # フォルダ内のファイルの部署名（正式名に寄せたもの。当てはまらなければ None）
+    dept_names = {key: normalize_dept(key, config) for key in submissions}
+
     return render_template('cycle_detail.html', cycle=cycle, config=config,
                            steps=STEPS, departments=DEPARTMENTS,
                            submissions=submissions, email_previews=email_previews,
-                           today=today)
+                           dept_names=dept_names, status=submission_status(cycle, config),
+                           revisions=revisions, today=today)
 
 
 @app.route('/cycle/<cycle_id>/step/<step_key>/toggle', methods=['POST'])
@@ -695,6 +1577,79 @@ def cycle_update(cycle_id):
     return redirect(url_for('cycle_detail', cycle_id=cycle_id))
 
 
+# 一括更新 API で変更できる号の項目
+BATCH_FIELDS = ('notes', 'submissions_folder', 'xserver_url')
+
+def _validate_batch_op(op, cycles_by_id):
+    """操作 1 件を検査し、問題があればエラー文字列を返す。"""
+    if not isinstance(op, dict):
+        return 'operation must be an object'
+    if op.get('cycle_id') not in cycles_by_id:
+        return f'unknown cycle: {op.get("cycle_id")}'
+    kind = op.get('op')
+    if kind == 'set_step':
+        if op.get('step') not in {s['key'] for s in STEPS}:
+            return f'unknown step: {op.get("step")}'
+        if not isinstance(op.get('completed'), bool):
+            return 'completed must be true or false'
+    elif kind == 'set_field':
+        if op.get('field') not in BATCH_FIELDS:
+            return f'field must be one of {", ".join(BATCH_FIELDS)}'
+        if not isinstance(op.get('value'), str):
+            return 'value must be a string'
+    else:
+        return f'unknown op: {kind}'
+    return None
+
+def _apply_batch_op(op, cycle, now):
+    if op['op'] == 'set_step':
+        step = cycle['steps'].setdefault(op['step'], {})
+        if step.get('completed', False) != op['completed']:
+            step['completed']    = op['completed']
+            step['completed_at'] = now if op['completed'] else None
+    else:
+        cycle[op['field']] = op['value'].strip() if op['field'] == 'xserver_url' else op['value']
+
+def _batch_state(cycle):
+    add_progress(cycle)
+    return {'steps': cycle['steps'], 'progress': cycle['progress'],
+            **{f: cycle.get(f, '') for f in BATCH_FIELDS}}
+
+
+@app.route('/api/batch', methods=['POST'])
+@admin_required
+def api_batch():
+    """
+    複数の操作を 1 回の読み込み・1 回の保存でまとめて適用する。
+    {"ops": [{"cycle_id", "op": "set_step", "step", "completed"},
+             {"cycle_id", "op": "set_field", "field", "value"}, ...]}
+    1 件でも不正な操作があれば何も適用せず 400 を返す。
+    """
+    data = request.get_json(silent=True) or {}
+    ops  = data.get('ops')
+    if not isinstance(ops, list) or not ops:
+        return jsonify({'error': 'ops must be a non-empty list'}), 400
+
+    cycles = load_cycles()
+    by_id  = {c['id']: c for c in cycles}
+    errors = []
+    for i, op in enumerate(ops):
+        err = _validate_batch_op(op, by_id)
+        if err:
+            errors.append({'index': i, 'error': err})
+    if errors:
+        return jsonify({'error': 'invalid operations', 'errors': errors}), 400
+
+    now = datetime.now().isoformat()
+    for op in ops:
+        _apply_batch_op(op, by_id[op['cycle_id']], now)
+    save_cycles(cycles)
+    metric_inc('melmaga_batch_ops_total', value=len(ops))
+    touched = dict.fromkeys(op['cycle_id'] for op in ops)
+    return jsonify({'ok': True, 'applied': len(ops),
+                    'cycles': {cid: _batch_state(by_id[cid]) for cid in touched}})
+
+
 @app.route('/cycle/<cycle_id>/email/<step_key>')
 def email_compose(cycle_id, step_key):
     cycles = load_cycles()
@@ -706,10 +1661,11 @@ def email_compose(cycle_id, step_key):
     templates = load_templates()
     tmpl      = templates.get(step_key, {})
 
-    subject  = render_vars(tmpl.get('subject', ''), cycle, config)
-    body     = render_vars(tmpl.get('body',    ''), cycle, config)
-    to_text  = render_vars(tmpl.get('to',      ''), cycle, config)
-    cc_text  = render_vars(tmpl.get('cc',      ''), cycle, config)
+    vars     = template_vars(cycle, config)
+    subject  = render_vars(tmpl.get('subject', ''), cycle, config, vars)
+    body     = render_vars(tmpl.get('body',    ''), cycle, config, vars)
+    to_text  = render_vars(tmpl.get('to',      ''), cycle, config, vars)
+    cc_text  = render_vars(tmpl.get('cc',      ''), cycle, config, vars)
 
     step_label = next((s['label'] for s in STEPS if s['key'] == step_key), step_key)
 
@@ -720,11 +1676,25 @@ def email_compose(cycle_id, step_key):
     )
     mailto = f'mailto:?{qs}'
 
+    # SMTP 送信の宛先: 前回の宛先リスト、なければ To/Cc に書かれたアドレス
+    recipients_text = config.get('recipients', {}).get(step_key) or '\n'.join(
+        re.findall(r'[^@\s<>,、]+@[^@\s<>,、]+\.[A-Za-z]{2,}', f'{to_text}\n{cc_text}'))
+
+    # リマインド・締切は未提出の部署を表示し、その連絡先だけを宛先にできるようにする
+    missing = missing_recipients = None
+    if step_key in MISSING_TARGET_STEPS:
+        overlay_folder_submissions(cycle, config)
+        missing            = missing_departments(cycle, config)
+        missing_recipients = missing_recipients_text(cycle, config)
+
     return render_template('email_compose.html', cycle=cycle,
                            step_key=step_key, step_label=step_label,
                            subject=subject, body=body,
                            to_text=to_text, cc_text=cc_text, mailto=mailto,
-                           tmpl=tmpl)
+                           tmpl=tmpl, smtp_enabled=smtp_enabled(),
+                           recipients_text=recipients_text,
+                           missing=missing, missing_recipients=missing_recipients,
+                           delivery=delivery_status(cycle, step_key))
 
 
 @app.route('/settings', methods=['GET', 'POST'])
@@ -737,11 +1707,26 @@ def settings():
         config['contact_email'] = request.form.get('contact_email', '')
         config['sender_name']   = request.form.get('sender_name', '')
         config['sender_email']  = request.form.get('sender_email', '')
+
+        # 部署名の別名（別名 = 部署名）と部署の連絡先（部署名: アドレス, アドレス）
+        aliases, bad = parse_dept_settings(request.form.get('dept_aliases', ''))
+        bad += [f'{a} = {d}' for a, d in aliases.items() if d not in DEPARTMENTS]
+        config['dept_aliases'] = {a: d for a, d in aliases.items() if d in DEPARTMENTS}
+        contacts, bad_c = parse_dept_settings(request.form.get('dept_contacts', ''))
+        config['dept_contacts'] = {}
+        for name, addrs in contacts.items():
+            dept = normalize_dept(name, config)
+            if dept:
+                config['dept_contacts'][dept] = addrs
+            else:
+                bad_c.append(name)
         save_config(config)
+        if bad or bad_c:
+            flash('部署名が分からない行は保存しませんでした: ' + '、'.join(bad + bad_c), 'error')
         flash('設定を保存しました', 'success')
         return redirect(url_for('settings'))
     return render_template('settings.html', config=config,
-                           templates=templates, steps=STEPS)
+                           templates=templates, steps=STEPS, departments=DEPARTMENTS)
 
 
 @app.route('/settings/template/<step_key>', methods=['POST'])
@@ -782,23 +1767,253 @@ def _nc_decode_text(raw_bytes):
             continue
     return raw_bytes.decode('utf-8', errors='replace')
 
+def parse_xserver_zip(zip_bytes):
+    """
+    XServer から取得した ZIP を展開し、.txt / .docx 原稿をパースして返す。
+    戻り値: (articles_list, error_str)
+    """
+    import io, zipfile
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(zip_bytes))
+    except zipfile.BadZipFile:
+        return None, 'ZIPファイルの展開に失敗しました'
+
+    dept_order = {d: i for i, d in enumerate(DEPARTMENTS)}
+    entries = []
+
+    for entry in zf.namelist():
+        # ディレクトリはスキップ
+        if entry.endswith('/'):
+            continue
+        # .txt / .docx 以外はスキップ
+        ext = os.path.splitext(entry)[1].lower()
+        if ext not in ('.txt', '.docx'):
+            continue
+        info = zf.getinfo(entry)
+        if info.file_size == 0:
+            continue
+        entries.append((entry, ext, info, zf.read(entry)))
+
+    docx_text = iter(extract_docx_batch([raw for _, ext, _, raw in entries if ext == '.docx']))
+    articles  = []
+    for entry, ext, info, raw in entries:
+        filename = urllib.parse.unquote(entry.split('/')[-1])
+        if ext == '.docx':
+            dept, body = parse_article(next(docx_text))
+            dept = dept or docx_dept_from_filename(filename)
+        else:
+            dept, body = parse_article(_nc_decode_text(raw))
+
+        articles.append({
+            'filename':    filename,
+            'path_in_zip': entry,
+            'dept':        dept or filename,
+            'body':        body,
+            'preview':     body[:80].replace('\n', ' '),
+            'size_kb':     round(info.file_size / 1024, 1),
+            'modified_at': datetime(*info.date_time).isoformat(),
+        })
+
+    articles.sort(key=lambda a: dept_order.get(a['dept'], 999))
+    return articles, None
+
+def _nc_share_path(url):
+    """共有URLの ?path=/サブフォルダ を取り出す（なければ空文字）"""
+    q = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    path = (q.get('path') or [''])[0].strip()
+    return '' if path in ('', '/') else path
+
+_NC_RTOKEN_RE = re.compile(r'name="requesttoken"\s+value="([^"]+)"')
+
+def _nc_password_rejected(html):
+    """認証後のページに再びパスワードフォームが存在 → パスワード誤り"""
+    return bool(_NC_RTOKEN_RE.search(html)) and 'id="password"' in html
+
+def _nc_is_zip(content_type):
+    # テキスト系ならページが返ってきている（認証失敗の可能性）
+    return 'zip' in content_type or 'octet' in content_type
+
+
+def parse_xserver_shares(text):
+    """
+    共有URL欄を共有のリストにする。1行に1つ（# で始まる行は無視）。
+    戻り値: [{url, label}, ...]。label は共有トークン（サブフォルダ指定があれば付加）。
+    """
+    shares = []
+    for line in (text or '').splitlines():
+        url = line.strip()
+        if not url or url.startswith('#'):
+            continue
+        _, token = _nc_parse_share_url(url)
+        path = _nc_share_path(url)
+        label = (token or url) + (path if path else '')
+        shares.append({'url': url, 'label': label})
+    return shares
+
+
 def xserver_fetch_all(share_url, password=''):
     """
     Nextcloud 公開共有リンクにセッション認証してZIPで一括取得し、
-    .txt 原稿ファイルをパースして返す。
+    .txt 原稿ファイルをパースして返す。共有URLが複数行なら各共有をまとめて取得する。
 
     戻り値: (articles_list, error_str)
     articles_list = [{filename, dept, body, preview, size_kb, path_in_zip}, ...]
+    すべての共有で失敗した時だけ error_str を返す（共有ごとの結果は xserver_fetch_shares）。
+    """
+    shares = parse_xserver_shares(share_url)
+    if not shares:
+        return None, 'URLを入力してください'
+    articles, reports = xserver_fetch_shares(shares, password)
+    if all(r['error'] for r in reports):
+        return None, ' / '.join(_xs_report_error(r, len(reports)) for r in reports)
+    return articles, None
+
+def _xs_report_error(report, n_shares):
+    return report['error'] if n_shares == 1 else f'{report["label"]}: {report["error"]}'
+
+
+# ── 複数の共有・サブフォルダの並行取得 ──
+# 部署グループごとの共有や前号の参照用フォルダなど、複数の共有を asyncio で同時に取得する。
+# httpx があれば接続プールを共有した非同期クライアント、なければ requests をスレッドで並べる。
+# 同じホストへの同時接続数は XSERVER_HOST_CONCURRENCY で制限する。
+_HTTPX_OK = importlib.util.find_spec('httpx') is not None
+XSERVER_HOST_CONCURRENCY = max(1, int(os.environ.get('XSERVER_HOST_CONCURRENCY', '4')))
+XSERVER_MAX_CONNECTIONS  = max(1, int(os.environ.get('XSERVER_MAX_CONNECTIONS', '16')))
+_NC_USER_AGENT = 'Mozilla/5.0 (compatible; melmaga-kanri)'
+
+def xserver_fetch_shares(shares, password=''):
     """
+    複数の共有を並行して取得し、記事を DEPARTMENTS 順にまとめて返す。
+    戻り値: (articles, reports)
+    reports = [{url, label, count, seconds, error}, ...]（入力順、error は成功時 None）
+    共有が 2 つ以上のときは path_in_zip の先頭に共有の label を付けて一意にする。
+    """
+    import asyncio
+    results = asyncio.run(_xserver_fetch_shares_async(shares, password))
+
+    multi    = len(shares) > 1
+    articles = []
+    reports  = []
+    for share, (arts, err, seconds) in zip(shares, results):
+        reports.append({'url': share['url'], 'label': share['label'],
+                        'count': len(arts or []), 'seconds': round(seconds, 3), 'error': err})
+        for a in arts or []:
+            a['share'] = share['label']
+            if multi:
+                a['path_in_zip'] = f'{share["label"]}/{a["path_in_zip"]}'
+            articles.append(a)
+
+    # 各共有内は部署順に並んでいる。共有をまたいで部署順にそろえる（同じ部署は共有の順）
+    dept_order = {d: i for i, d in enumerate(DEPARTMENTS)}
+    articles.sort(key=lambda a: dept_order.get(a['dept'], 999))
+    return articles, reports
+
+async def _xserver_fetch_shares_async(shares, password):
+    import asyncio
+    host_limits = {}
+
+    def limit_for(url):
+        host = _nc_parse_share_url(url)[0] or ''
+        if host not in host_limits:
+            host_limits[host] = asyncio.Semaphore(XSERVER_HOST_CONCURRENCY)
+        return host_limits[host]
+
+    async def timed(share, fetch):
+        started = time.perf_counter()
+        async with limit_for(share['url']):
+            articles, err = await fetch
+        seconds = time.perf_counter() - started
+        metric_inc('melmaga_xserver_fetches_total', {'result': 'error' if err else 'ok'})
+        metric_observe('melmaga_xserver_fetch_duration_seconds', seconds)
+        if articles:
+            metric_inc('melmaga_xserver_articles_total', value=len(articles))
+        return articles, err, seconds
+
+    if not _HTTPX_OK:
+        return await asyncio.gather(*(
+            timed(s, asyncio.to_thread(_xserver_fetch_all, s['url'], password)) for s in shares))
+
+    import httpx
+    # 接続プールはすべての共有で共有し、Cookie（共有ごとの認証セッション）はクライアントごとに分ける
+    transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+        max_connections=XSERVER_MAX_CONNECTIONS,
+        max_keepalive_connections=XSERVER_MAX_CONNECTIONS))
+    try:
+        return await asyncio.gather(*(
+            timed(s, _xserver_fetch_share_async(transport, s['url'], password)) for s in shares))
+    finally:
+        await transport.aclose()
+
+async def _xserver_fetch_share_async(transport, share_url, password=''):
+    """_xserver_fetch_all の httpx 版。transport（接続プール）は呼び出し側が閉じる。"""
+    import asyncio
+    import httpx
+
+    host, token = _nc_parse_share_url(share_url)
+    if not token:
+        return None, 'URLの形式が正しくありません（/s/TOKEN の形式が必要です）'
+    path = _nc_share_path(share_url)
+
+    class SharedTransport(httpx.AsyncBaseTransport):
+        """共有の接続プールに委ねる。クライアントを閉じてもプールは閉じない（aclose は何もしない）。"""
+        async def handle_async_request(self, request):
+            return await transport.handle_async_request(request)
+
+    client = httpx.AsyncClient(transport=SharedTransport(), follow_redirects=True, timeout=15,
+                               headers={'User-Agent': _NC_USER_AGENT})
+    try:
+        # ── STEP 1: 共有ページを取得して CSRF トークンを得る ──
+        r1 = await client.get(f'{host}/index.php/s/{token}')
+        if r1.status_code != 200:
+            return None, f'共有ページにアクセスできません（HTTP {r1.status_code}）'
+        m = _NC_RTOKEN_RE.search(r1.text)
+
+        # ── STEP 2: パスワード認証 ──
+        if m:
+            r2 = await client.post(
+                f'{host}/index.php/s/{token}/authenticate/showShare',
+                data={'requesttoken': m.group(1), 'password': password},
+                headers={'Referer': f'{host}/index.php/s/{token}'},
+            )
+            if _nc_password_rejected(r2.text):
+                return None, 'パスワードが違います'
+
+        # ── STEP 3: ZIP一括ダウンロード（サブフォルダ指定があればそのフォルダだけ） ──
+        r3 = await client.get(f'{host}/index.php/s/{token}/download',
+                              params={'path': path} if path else None, timeout=60)
+        if r3.status_code != 200:
+            return None, f'ZIPのダウンロードに失敗しました（HTTP {r3.status_code}）'
+        if not _nc_is_zip(r3.headers.get('Content-Type', '')):
+            return None, 'パスワードが違うか、ダウンロードに失敗しました'
+
+        zip_bytes = r3.content
+        metric_inc('melmaga_xserver_fetch_bytes_total', value=len(zip_bytes))
+
+        # ── STEP 4: ZIPの展開とパースはスレッドで（その間も他の共有のダウンロードを進める） ──
+        return await asyncio.to_thread(parse_xserver_zip, zip_bytes)
+
+    except httpx.ConnectError:
+        return None, 'サーバーに接続できませんでした。URLを確認してください'
+    except httpx.TimeoutException:
+        return None, 'タイムアウトしました'
+    except Exception as e:
+        return None, f'エラー: {e}'
+    finally:
+        await client.aclose()
+
+def _xserver_fetch_all(share_url, password=''):
+    """1 つの共有を requests で取得する（httpx がない環境用）。"""
     if not _REQUESTS_OK:
         return None, 'requests ライブラリが未インストールです（pip install requests）'
+    import requests
 
     host, token = _nc_parse_share_url(share_url)
     if not token:
         return None, 'URLの形式が正しくありません（/s/TOKEN の形式が必要です）'
+    path = _nc_share_path(share_url)
 
     session = requests.Session()
-    session.headers.update({'User-Agent': 'Mozilla/5.0 (compatible; melmaga-kanri)'})
+    session.headers.update({'User-Agent': _NC_USER_AGENT})
 
     try:
         # ── STEP 1: 共有ページを取得して CSRF トークンを得る ──
@@ -806,7 +2021,7 @@ def xserver_fetch_all(share_url, password=''):
         if r1.status_code != 200:
             return None, f'共有ページにアクセスできません（HTTP {r1.status_code}）'
 
-        m = re.search(r'name="requesttoken"\s+value="([^"]+)"', r1.text)
+        m = _NC_RTOKEN_RE.search(r1.text)
         if not m:
             # パスワード不要の共有ページ（認証フォームなし）
             rtoken = None
@@ -822,64 +2037,27 @@ def xserver_fetch_all(share_url, password=''):
                 allow_redirects=True,
                 timeout=15,
             )
-            # 認証後のページに再びパスワードフォームが存在 → パスワード誤り
-            if re.search(r'name="requesttoken"\s+value="', r2.text) and \
-               'id="password"' in r2.text:
+            if _nc_password_rejected(r2.text):
                 return None, 'パスワードが違います'
 
         # ── STEP 3: ZIP一括ダウンロード ──
         r3 = session.get(
             f'{host}/index.php/s/{token}/download',
+            params={'path': path} if path else None,
             timeout=60,
             stream=True,
         )
         if r3.status_code != 200:
             return None, f'ZIPのダウンロードに失敗しました（HTTP {r3.status_code}）'
 
-        content_type = r3.headers.get('Content-Type', '')
-        if 'zip' not in content_type and 'octet' not in content_type:
-            # テキスト系ならページが返ってきている（認証失敗の可能性）
+        if not _nc_is_zip(r3.headers.get('Content-Type', '')):
             return None, 'パスワードが違うか、ダウンロードに失敗しました'
 
         zip_bytes = r3.content
+        metric_inc('melmaga_xserver_fetch_bytes_total', value=len(zip_bytes))
 
         # ── STEP 4: ZIPを展開して .txt を読む ──
-        articles = []
-        try:
-            zf = zipfile.ZipFile(io.BytesIO(zip_bytes))
-        except zipfile.BadZipFile:
-            return None, 'ZIPファイルの展開に失敗しました'
-
-        dept_order = {d: i for i, d in enumerate(DEPARTMENTS)}
-
-        for entry in zf.namelist():
-            # ディレクトリはスキップ
-            if entry.endswith('/'):
-                continue
-            # .txt 以外はスキップ
-            if not entry.lower().endswith('.txt'):
-                continue
-
-            filename = urllib.parse.unquote(entry.split('/')[-1])
-            info = zf.getinfo(entry)
-            if info.file_size == 0:
-                continue
-
-            raw = zf.read(entry)
-            content = _nc_decode_text(raw)
-            dept, body = parse_article(content)
-
-            articles.append({
-                'filename':    filename,
-                'path_in_zip': entry,
-                'dept':        dept or filename,
-                'body':        body,
-                'preview':     body[:80].replace('\n', ' '),
-                'size_kb':     round(info.file_size / 1024, 1),
-            })
-
-        articles.sort(key=lambda a: dept_order.get(a['dept'], 999))
-        return articles, None
+        return parse_xserver_zip(zip_bytes)
 
     except requests.exceptions.ConnectionError:
         return None, 'サーバーに接続できませんでした。URLを確認してください'
@@ -905,18 +2083,80 @@ def xserver_save_url(cycle_id):
 
 @app.route('/api/cycle/<cycle_id>/xserver-list', methods=['POST'])
 def api_xserver_list(cycle_id):
-    """XServer からZIPで一括取得してパース済み記事リストを返す"""
+    """
+    XServer からZIPで一括取得してパース済み記事リストを返す。
+    known（クライアントが持っている {key: rev}）を渡すと、そこからの追加・変更・削除だけを返す。
+    previews_only を指定すると本文を含めない（本文は /revisions/<rev> で個別に取得）。
+    一覧・差分の応答そのものは何も保存しない。版と提出状況の取り込みは管理者の時だけ行う。
+    """
+    cycle = next((c for c in load_cycles() if c['id'] == cycle_id), None)
+    if not cycle:
+        return jsonify({'error': 'not found'}), 404
     data     = request.get_json()
     url      = data.get('url', '').strip()
     password = data.get('password', '')
-    if not url:
+    known    = data.get('known')
+    # 本文を /revisions/<rev> から取れるのは版を記録した時（管理者）だけ
+    previews = bool(data.get('previews_only')) and is_admin()
+    shares   = parse_xserver_shares(url)
+    if not shares:
         return jsonify({'error': 'URLを入力してください'}), 400
 
-    articles, err = xserver_fetch_all(url, password)
-    if err:
-        return jsonify({'error': err}), 400
-
-    return jsonify({'articles': articles, 'count': len(articles)})
+    # 共有URLは1行に1つ。各共有を並行して取得し、共有ごとの件数・所要時間・エラーも返す
+    articles, reports = xserver_fetch_shares(shares, password)
+    if all(r['error'] for r in reports):
+        return jsonify({'error': ' / '.join(_xs_report_error(r, len(reports)) for r in reports),
+                        'shares': reports}), 400
+
+    if is_admin():
+        record_revisions(cycle_id, articles, 'xserver')
+        record_submissions(cycle_id, articles, 'xserver')
+    for a in articles:
+        a.setdefault('rev', revision_hash(a['body']))
+    entries = [_xs_list_entry(a) for a in articles]
+    version = xserver_list_version(entries)
+    bodies  = {a['path_in_zip']: a['body'] for a in articles}
+
+    def out(e):
+        return e if previews else {**e, 'body': bodies[e['key']]}
+
+    # 一部の共有が失敗した時は、その共有の記事が「削除」に見えないよう差分にしない
+    partial = any(r['error'] for r in reports)
+    if not known or not isinstance(known, dict) or partial:
+        metric_inc('melmaga_xserver_list_responses_total', {'kind': 'full'})
+        return jsonify({'version': version, 'full': True, 'shares': reports,
+                        'articles': [out(e) for e in entries], 'count': len(entries)})
+
+    added, changed, removed = xserver_list_delta(known, entries)
+    metric_inc('melmaga_xserver_list_responses_total', {'kind': 'delta'})
+    return jsonify({'version': version, 'full': False, 'shares': reports,
+                    'added':   [out(e) for e in added],
+                    'changed': [out(e) for e in changed],
+                    'removed': removed,
+                    'count':   len(entries)})
+
+
+def _xs_list_entry(art):
+    return {'key':      art['path_in_zip'],
+            'filename': art['filename'],
+            'dept':     art['dept'],
+            'rev':      art['rev'],
+            'preview':  art['preview'],
+            'size_kb':  art['size_kb']}
+
+def xserver_list_version(entries):
+    """一覧の内容（ファイルと本文のハッシュの組）から version を作る。"""
+    pairs = sorted((e['key'], e['rev'], e['dept']) for e in entries)
+    return hashlib.sha256(json.dumps(pairs, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+def xserver_list_delta(known, new):
+    """クライアントの一覧 {key: rev} と新しい一覧の差分を (追加, 変更, 削除された key) で返す。"""
+    before = {str(k): str(v) for k, v in known.items()}
+    after  = {e['key']: e for e in new}
+    added   = [e for k, e in after.items() if k not in before]
+    changed = [e for k, e in after.items() if k in before and before[k] != e['rev']]
+    removed = [k for k in before if k not in after]
+    return added, changed, removed
 
 
 @app.route('/api/cycle/<cycle_id>/submissions')
@@ -925,7 +2165,29 @@ def api_submissions(cycle_id):
     cycle  = next((c for c in cycles if c['id'] == cycle_id), None)
     if not cycle:
         return jsonify({'error': 'not found'}), 404
-    return jsonify(scan_submissions(cycle.get('submissions_folder', '')))
+    return jsonify(overlay_folder_submissions(cycle, load_config()))
+
+
+@app.route('/api/cycle/<cycle_id>/submissions/refresh', methods=['POST'])
+@admin_required
+def api_submissions_refresh(cycle_id):
+    """提出フォルダを再スキャンして提出状況の索引を保存する。"""
+    if not any(c['id'] == cycle_id for c in load_cycles()):
+        return jsonify({'error': 'not found'}), 404
+    return jsonify({'changed': refresh_submissions(cycle_id)})
+
+
+@app.route('/api/cycle/<cycle_id>/submissions/missing')
+def api_missing_departments(cycle_id):
+    """提出状況の索引から、未提出の部署・提出済みの部署（最新の版と日時）を返す（ファイルは読まない）"""
+    cycle = next((c for c in load_cycles() if c['id'] == cycle_id), None)
+    if not cycle:
+        return jsonify({'error': 'not found'}), 404
+    config = load_config()
+    overlay_folder_submissions(cycle, config)
+    status = submission_status(cycle, config)
+    status['missing_recipients'] = missing_recipients_text(cycle, config)
+    return jsonify(status)
 
 
 # ─── Phase 2: 組版ツール ──────────────────────────────────────────────────────
@@ -940,6 +2202,105 @@ def read_article_file(filepath):
             continue
     return '（ファイルの読み込みに失敗しました）'
 
+# ─── Word (.docx) 原稿の読み込み ─────────────────────────────────────────────
+# word/document.xml を ZIP からストリームで読み、iterparse で段落ごとに処理する
+# （DOM を作らない）。抽出結果はファイルのハッシュをキーにキャッシュし、
+# 件数が多いときはプロセスプールで並列に処理する。
+
+import xml.etree.ElementTree as ET
+
+_W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DOCX_POOL_MIN     = int(os.environ.get('DOCX_POOL_MIN', '32'))     # これ未満なら直列で処理（プロセス起動のほうが高くつく）
+DOCX_POOL_WORKERS = int(os.environ.get('DOCX_POOL_WORKERS', '2'))
+_DOCX_CACHE_MAX   = 256
+_docx_cache = {}   # sha256 -> text（挿入順で古いものから捨てる）
+_docx_lock  = threading.Lock()
+
+def _is_no_wrap_line(line):
+    """URL またはメールアドレスを含む行は改行しない（melmaga.html の isNoWrapLine と同じ）"""
+    return bool(re.search(r'https?://', line) or
+                re.search(r'[a-zA-Z0-9._%+\-]+@[a-zA-Z0-9.\-]+\.[a-zA-Z]{2,}', line))
+
+def wrap_at_20(text):
+    """20文字改行（melmaga.html の wrapAt20 と同じ）"""
+    out = []
+    for line in text.split('\n'):
+        if len(line) <= 20 or _is_no_wrap_line(line):
+            out.append(line)
+        else:
+            out.extend(line[i:i + 20] for i in range(0, len(line), 20))
+    return '\n'.join(out)
+
+def extract_docx_text(data):
+    """.docx のバイト列から本文テキストを取り出す（段落ごとに改行、20文字改行済み）"""
+    import io, zipfile
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(data))
+        stream = zf.open('word/document.xml')
+    except (zipfile.BadZipFile, KeyError):
+        return '（ファイルの読み込みに失敗しました）'
+    paras, buf = [], []
+    try:
+        with stream:
+            for event, el in ET.iterparse(stream, events=('end',)):
+                tag = el.tag
+                if tag == _W_NS + 't':
+                    buf.append(el.text or '')
+                elif tag == _W_NS + 'tab':
+                    buf.append('\t')
+                elif tag in (_W_NS + 'br', _W_NS + 'cr'):
+                    buf.append('\n')
+                elif tag == _W_NS + 'p':
+                    paras.append(''.join(buf))
+                    buf = []
+                    el.clear()   # 処理済みの段落は捨ててメモリを抑える
+    except ET.ParseError:
+        return '（ファイルの読み込みに失敗しました）'
+    return wrap_at_20('\n'.join(paras).strip('\n'))
+
+def extract_docx_batch(blobs):
+    """複数の .docx を抽出してテキストのリストを返す（キャッシュ済みは再抽出しない）"""
+    keys  = [hashlib.sha256(b).hexdigest() for b in blobs]
+    texts = [None] * len(blobs)
+    todo  = []
+    with _docx_lock:
+        for i, k in enumerate(keys):
+            if k in _docx_cache:
+                texts[i] = _docx_cache[k]
+            else:
+                todo.append(i)
+    if len(blobs) > len(todo):
+        metric_inc('melmaga_docx_extract_total', {'cache': 'hit'}, len(blobs) - len(todo))
+    if not todo:
+        return texts
+
+    metric_inc('melmaga_docx_extract_total', {'cache': 'miss'}, len(todo))
+    results = None
+    workers = min(DOCX_POOL_WORKERS, os.cpu_count() or 1, len(todo))
+    if len(todo) >= DOCX_POOL_MIN and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunk   = -(-len(todo) // workers)
+                results = list(pool.map(extract_docx_text, [blobs[i] for i in todo], chunksize=chunk))
+        except Exception as e:
+            app.logger.warning('docx process pool failed, falling back to serial: %s', e)
+    if results is None:
+        results = [extract_docx_text(blobs[i]) for i in todo]
+
+    with _docx_lock:
+        for i, text in zip(todo, results):
+            texts[i] = text
+            _docx_cache[keys[i]] = text
+        while len(_docx_cache) > _DOCX_CACHE_MAX:
+            _docx_cache.pop(next(iter(_docx_cache)))
+    return texts
+
+def docx_dept_from_filename(filename):
+    """テンプレート_（部署名）.docx から部署名を取り出す"""
+    m = re.search(r'[（(]([^）)]+)[）)]', filename)
+    return m.group(1) if m else ''
+
 def parse_article(content):
     """
     melmaga.html 出力形式のテキストをパースする。
@@ -955,28 +2316,36 @@ def parse_article(content):
     return dept, body
 
 def load_assemble_articles(cycle):
-    """提出フォルダから .txt 原稿を全件読み込み、記事リストを返す"""
+    """提出フォルダから .txt / .docx 原稿を全件読み込み、記事リストを返す"""
     folder = cycle.get('submissions_folder', '')
     submissions = scan_submissions(folder)
     dept_order  = {d: i for i, d in enumerate(DEPARTMENTS)}
     articles = []
 
-    for dept_name, files in submissions.items():
-        for f in files:
-            if f['ext'] != '.txt':
-                continue
-            raw     = read_article_file(f['path'])
-            parsed_dept, body = parse_article(raw)
-            display_dept = parsed_dept or dept_name
-            articles.append({
-                'id':       f['filename'],
-                'filename': f['filename'],
-                'dept':     display_dept,
-                'body':     body,
-                'preview':  body[:80].replace('\n', ' '),
-                'modified': f['modified'],
-                'size_kb':  f['size_kb'],
-            })
+    # .docx はまとめて抽出する（件数が多ければプロセスプールで並列）
+    files = [(dept_name, f) for dept_name, fs in submissions.items()
+             for f in fs if f['ext'] in ('.txt', '.docx')]
+    docx  = [f for _, f in files if f['ext'] == '.docx']
+    blobs = []
+    for f in docx:
+        with open(f['path'], 'rb') as fh:
+            blobs.append(fh.read())
+    docx_text = dict(zip((f['path'] for f in docx), extract_docx_batch(blobs)))
+
+    for dept_name, f in files:
+        raw = docx_text[f['path']] if f['ext'] == '.docx' else read_article_file(f['path'])
+        parsed_dept, body = parse_article(raw)
+        display_dept = parsed_dept or dept_name
+        articles.append({
+            'id':       f['filename'],
+            'filename': f['filename'],
+            'dept':     display_dept,
+            'body':     body,
+            'preview':  body[:80].replace('\n', ' '),
+            'modified': f['modified'],
+            'modified_at': f.get('modified_at'),
+            'size_kb':  f['size_kb'],
+        })
 
     articles.sort(key=lambda a: dept_order.get(a['dept'], 999))
     return articles
@@ -990,12 +2359,14 @@ def assemble(cycle_id):
         flash('見つかりません', 'error')
         return redirect(url_for('dashboard'))
 
-    config   = load_config()
-    articles = load_assemble_articles(cycle)
-    sep      = '━' * 20
+    config    = load_config()
+    # 表示だけなので版は記録しない（記録は refresh_submissions で行う）
+    articles  = load_assemble_articles(cycle)
+    sep       = '━' * 20
+    revisions = list_revisions(cycle_id)
 
     return render_template('assemble.html', cycle=cycle, config=config,
-                           articles=articles, sep=sep)
+                           articles=articles, sep=sep, revisions=revisions)
 
 
 @app.route('/api/cycle/<cycle_id>/build-newsletter', methods=['POST'])
@@ -1127,7 +2498,1570 @@ def build_newsletter_api(cycle_id):
         SEP_MID,
     ]
 
-    return jsonify({'text': '\n'.join(P)})
+    text = '\n'.join(P)
+    return jsonify({'text': text})
+
+
+@app.route('/api/cycle/<cycle_id>/archive', methods=['POST'])
+@admin_required
+def archive_newsletter_api(cycle_id):
+    """確定した組版結果を過去号のアーカイブに登録する（プレビューの組版ごとには保存しない）。"""
+    cycle = next((c for c in load_cycles() if c['id'] == cycle_id), None)
+    if not cycle:
+        return jsonify({'error': 'not found'}), 404
+    text = (request.get_json(silent=True) or {}).get('text', '')
+    if not text.strip():
+        return jsonify({'error': 'text is required'}), 400
+    entry = archive_issue(cycle, text)
+    return jsonify({'sections': len(entry['sections']), 'archived_at': entry['archived_at']})
+
+
+# ─── 原稿リビジョンのアーカイブ（内容アドレス方式） ──────────────────────────
+# 原稿本文を SHA-256 をキーに 1 度だけ保存する。本文は圧縮して
+# data/revisions/seg-NNNNNN.pack に追記し（追記専用・一定サイズで次のファイルへ）、
+# index.json に {hash: [segment, offset, length, codec, raw_size]} を、
+# log.json に号・部署ごとの提出履歴を記録する。
+# 複数ワーカーからの同時追記は .lock ファイルの flock で直列化する。
+# クラウド環境（GitHub 同期が有効）では、Render の再起動でローカルの data/ が消えても
+# 履歴が残るよう、log.json と各版の記録（data/revisions/<hash>.rev、圧縮済みの 1 件分）を
+# GitHub に書き込む。パックと index.json はローカルの読み出し用で、GitHub にしかない版は
+# 初めて読むときに取得してパックに追記する。
+#
+# 圧縮は zstandard がインストールされていれば zstd、なければ zlib。
+
+import struct
+try:
+    import zstandard as _zstd
+except ImportError:
+    _zstd = None
+
+REVISIONS_DIR       = os.path.join(DATA_DIR, 'revisions')
+_REV_SEGMENT_MAX    = 8 * 1024 * 1024
+_REV_HEADER         = struct.Struct('>2sc32sI')   # magic, codec, sha256, payload length
+_REV_MAGIC          = b'MR'
+_rev_index_cache    = {'mtime': None, 'index': {}}
+_rev_thread_locks   = {'.lock': threading.Lock(), '.sync.lock': threading.Lock()}
+
+def _rev_path(name):
+    return os.path.join(REVISIONS_DIR, name)
+
+@contextmanager
+def _rev_locked(name='.lock'):
+    """data/revisions/.lock（GitHub への書き込みは .sync.lock）の排他ロック（プロセス間・スレッド間）。"""
+    os.makedirs(REVISIONS_DIR, exist_ok=True)
+    with _rev_thread_locks[name], open(_rev_path(name), 'a') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _rev_read_json(name, default):
+    try:
+        with open(_rev_path(name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def _rev_load_index():
+    """index.json を読み込む（更新時刻が変わっていなければメモリ上の値を使う）。"""
+    try:
+        mtime = os.stat(_rev_path('index.json')).st_mtime_ns
+    except OSError:
+        return {}
+    if _rev_index_cache['mtime'] != mtime:
+        _rev_index_cache['index'] = _rev_read_json('index.json', {})
+        _rev_index_cache['mtime'] = mtime
+    return _rev_index_cache['index']
+
+def _rev_compress(raw):
+    if _zstd:
+        return b's', _zstd.ZstdCompressor(level=10).compress(raw)
+    import zlib
+    return b'z', zlib.compress(raw, 9)
+
+def _rev_decompress(codec, payload):
+    if codec == b's':
+        if not _zstd:
+            raise RuntimeError('zstandard がインストールされていません（pip install zstandard）')
+        return _zstd.ZstdDecompressor().decompress(payload)
+    import zlib
+    return zlib.decompress(payload)
+
+def revision_hash(body):
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+def _rev_append(body, index):
+    """
+    本文を未保存なら現在のセグメントに追記し、index を更新する（ロック内で呼ぶ）。
+    (ハッシュ, 追記した記録のバイト列。既にあれば None) を返す。
+    """
+    raw    = body.encode('utf-8')
+    digest = hashlib.sha256(raw).digest()
+    h      = digest.hex()
+    if h in index:
+        return h, None
+    codec, payload = _rev_compress(raw)
+    return h, _rev_append_record(h, _REV_HEADER.pack(_REV_MAGIC, codec, digest, len(payload)) + payload,
+                                 codec, len(raw), index)
+
+def _rev_append_record(h, record, codec, raw_size, index):
+    """圧縮済みの記録（ヘッダー＋本文）を現在のセグメントに追記する（ロック内で呼ぶ）。"""
+    segs = sorted(f for f in os.listdir(REVISIONS_DIR) if f.endswith('.pack'))
+    seg  = segs[-1] if segs else 'seg-000001.pack'
+    if segs and os.path.getsize(_rev_path(seg)) + len(record) > _REV_SEGMENT_MAX:
+        seg = f'seg-{int(seg[4:10]) + 1:06d}.pack'
+    with open(_rev_path(seg), 'ab') as f:
+        offset = f.tell()
+        f.write(record)
+    index[h] = [seg, offset, len(record), codec.decode(), raw_size]
+    return record
+
+def _rev_write_json(name, data):
+    tmp = _rev_path(f'{name}.{os.getpid()}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, _rev_path(name))
+
+def record_revisions(cycle_id, articles, source):
+    """
+    記事リストの本文をアーカイブし、号・部署ごとの履歴に追記する。
+    各 article に 'rev'（本文のハッシュ）を付けて返す。直前の版と同じ本文の再取得は記録しない。
+    """
+    if not articles:
+        return articles
+    added = {}
+    with _rev_locked():
+        _rev_restore_log()
+        index   = dict(_rev_read_json('index.json', {}))
+        log     = _rev_read_json('log.json', {})
+        changed = False
+        now     = datetime.now().isoformat(timespec='seconds')
+        for art in articles:
+            h, record = _rev_append(art.get('body', ''), index)
+            art['rev'] = h
+            if record is not None:
+                added[h] = record
+                changed = True
+            history = log.setdefault(cycle_id, {}).setdefault(art.get('dept') or art['filename'], [])
+            if history and history[-1]['hash'] == h:
+                continue   # 前回と同じ本文（以前の版に戻した場合は記録する）
+            history.append({'hash':        h,
+                            'filename':    art.get('filename', ''),
+                            'source':      source,
+                            'size':        len(art.get('body', '')),
+                            'recorded_at': now})
+            changed = True
+        if changed:
+            _rev_write_json('index.json', index)
+            _rev_write_json('log.json', log)
+    if changed:
+        _rev_sync(added)
+        snapshot_mark_dirty()   # 版の比較リンクが増える
+    return articles
+
+def _rev_sync(records):
+    """
+    新しい版の記録と log.json を GitHub に書き込む（クラウド環境のみ）。
+    log.json は .sync.lock の中で最新のローカルファイルを読んで送るので、
+    ワーカー間で書き込みの順序が入れ替わっても古い履歴で上書きしない。
+    """
+    if not _USE_GITHUB:
+        return
+    for h, record in records.items():
+        _gh_sync(f'revisions/{h}.rev', record)
+    with _rev_locked('.sync.lock'):
+        try:
+            with open(_rev_path('log.json'), 'rb') as f:
+                log = json_loads(f.read())
+        except (OSError, ValueError):
+            return
+        _gh_sync('revisions/log.json', json_dumps_canonical(log))
+
+def _rev_restore_log():
+    """ローカルに log.json がなければ GitHub から復元する（再起動直後）。"""
+    if (not _USE_GITHUB or os.path.exists(_rev_path('log.json'))
+            or 'revisions/log.json' in _gh_missing):
+        return
+    log, _ = _gh_read('revisions/log.json')
+    if log is not None:
+        os.makedirs(REVISIONS_DIR, exist_ok=True)
+        _rev_write_json('log.json', log)
+
+def _rev_fetch(h):
+    """GitHub にしかない版を取得してパックに追記する。取得できなければ False。"""
+    if not _USE_GITHUB:
+        return False
+    record, _ = _gh_read_bytes(f'revisions/{h}.rev')
+    if not record or len(record) < _REV_HEADER.size:
+        return False
+    magic, codec, digest, n = _REV_HEADER.unpack_from(record)
+    if magic != _REV_MAGIC or digest.hex() != h:
+        return False
+    raw_size = len(_rev_decompress(codec, record[_REV_HEADER.size:_REV_HEADER.size + n]))
+    with _rev_locked():
+        index = dict(_rev_read_json('index.json', {}))
+        if h not in index:
+            _rev_append_record(h, record, codec, raw_size, index)
+            _rev_write_json('index.json', index)
+    return True
+
+def load_revision(h):
+    """ハッシュから本文を取り出す。見つからなければ None。"""
+    entry = _rev_load_index().get(h)
+    if not entry and _rev_fetch(h):
+        entry = _rev_load_index().get(h)
+    if not entry:
+        return None
+    seg, offset, length = entry[:3]
+    with open(_rev_path(seg), 'rb') as f:
+        f.seek(offset)
+        record = f.read(length)
+    magic, codec, digest, n = _REV_HEADER.unpack_from(record)
+    if magic != _REV_MAGIC or digest.hex() != h:
+        return None
+    return _rev_decompress(codec, record[_REV_HEADER.size:_REV_HEADER.size + n]).decode('utf-8')
+
+def list_revisions(cycle_id):
+    """号の提出履歴 {dept: [{hash, filename, source, size, recorded_at}, ...]}（古い順）"""
+    _rev_restore_log()
+    return _rev_read_json('log.json', {}).get(cycle_id, {})
+
+
+def cycle_revision_hashes(cycle_id):
+    """号の履歴に出てくる版のハッシュの集合（他の号の版を引かせないための確認用）"""
+    return {r['hash'] for history in list_revisions(cycle_id).values() for r in history}
+
+
+@app.route('/api/cycle/<cycle_id>/revisions')
+def api_revisions(cycle_id):
+    return jsonify(list_revisions(cycle_id))
+
+
+@app.route('/api/cycle/<cycle_id>/revisions/<rev>')
+def api_revision(cycle_id, rev):
+    if not re.fullmatch(r'[0-9a-f]{64}', rev):
+        return jsonify({'error': 'invalid revision'}), 400
+    if rev not in cycle_revision_hashes(cycle_id):
+        return jsonify({'error': 'not found'}), 404
+    body = load_revision(rev)
+    if body is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify({'hash': rev, 'body': body})
+
+
+# ─── リビジョン間の差分 ───────────────────────────────────────────────────────
+# 原稿は 1 行 20 文字で折り返されているため、行単位で比べると 1 文字の追加で
+# 以降の行がすべて変更扱いになる。そこで折り返しを段落に戻してから段落単位で
+# 比較し、変更のあった段落どうしは文字単位で比較する。
+# 比較は線形メモリの Myers 法（middle snake による分割統治）。
+# 結果はリビジョンハッシュの組をキーにメモリ上にキャッシュする。
+
+def unwrap_paragraphs(body):
+    """20文字折り返しの本文を段落のリストに戻す（全角スペース始まり・空行を段落の区切りとみなす）。"""
+    paras, cur = [], None
+    for line in body.splitlines():
+        if not line.strip():
+            if cur is not None:
+                paras.append(cur)
+            cur = None
+            paras.append('')
+        elif cur is None or line.startswith('　'):
+            if cur is not None:
+                paras.append(cur)
+            cur = line
+        else:
+            cur += line
+    if cur is not None:
+        paras.append(cur)
+    while paras and paras[-1] == '':
+        paras.pop()
+    return paras
+
+def _middle_snake(a, a0, a1, b, b0, b1):
+    """a[a0:a1] と b[b0:b1] の最短編集経路の中央の snake を (x, y, u, v) で返す（相対座標）。"""
+    n, m  = a1 - a0, b1 - b0
+    delta = n - m
+    odd   = delta & 1
+    dmax  = (n + m + 1) // 2
+    off   = dmax + 1
+    vf = [0] * (2 * dmax + 3)
+    vb = [0] * (2 * dmax + 3)
+    for d in range(dmax + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[off + k - 1] < vf[off + k + 1]):
+                x = vf[off + k + 1]
+            else:
+                x = vf[off + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            vf[off + k] = x
+            if odd and -(d - 1) <= delta - k <= d - 1 and x + vb[off + delta - k] >= n:
+                return x0, y0, x, y
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vb[off + k - 1] < vb[off + k + 1]):
+                x = vb[off + k + 1]
+            else:
+                x = vb[off + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[a1 - 1 - x] == b[b1 - 1 - y]:
+                x += 1
+                y += 1
+            vb[off + k] = x
+            if not odd and -d <= delta - k <= d and x + vf[off + delta - k] >= n:
+                return n - x, m - y, n - x0, m - y0
+    return 0, 0, 0, 0   # 到達しない
+
+def diff_sequences(a, b):
+    """
+    2 つの列（文字列またはリスト）の差分を [(op, a_start, a_end, b_start, b_end), ...] で返す。
+    op は 'equal' / 'delete' / 'insert'。隣接する同種の操作はまとめる。
+    """
+    ops = []
+
+    def emit(op, i0, i1, j0, j1):
+        if i0 == i1 and j0 == j1:
+            return
+        if ops and ops[-1][0] == op and ops[-1][2] == i0 and ops[-1][4] == j0:
+            ops[-1] = (op, ops[-1][1], i1, ops[-1][3], j1)
+        else:
+            ops.append((op, i0, i1, j0, j1))
+
+    def rec(a0, a1, b0, b1):
+        p = 0
+        while a0 + p < a1 and b0 + p < b1 and a[a0 + p] == b[b0 + p]:
+            p += 1
+        emit('equal', a0, a0 + p, b0, b0 + p)
+        a0, b0 = a0 + p, b0 + p
+        q = 0
+        while a0 < a1 - q and b0 < b1 - q and a[a1 - 1 - q] == b[b1 - 1 - q]:
+            q += 1
+        a1s, b1s = a1 - q, b1 - q
+        if a0 == a1s:
+            emit('insert', a0, a0, b0, b1s)
+        elif b0 == b1s:
+            emit('delete', a0, a1s, b0, b0)
+        else:
+            x, y, u, v = _middle_snake(a, a0, a1s, b, b0, b1s)
+            rec(a0, a0 + x, b0, b0 + y)
+            emit('equal', a0 + x, a0 + u, b0 + y, b0 + v)
+            rec(a0 + u, a1s, b0 + v, b1s)
+        emit('equal', a1s, a1, b1s, b1)
+
+    rec(0, len(a), 0, len(b))
+    return ops
+
+def _char_segments(old, new):
+    """段落内の文字差分を [(op, text)] と一致率で返す。"""
+    segs, same = [], 0
+    for op, i0, i1, j0, j1 in diff_sequences(old, new):
+        if op == 'equal':
+            segs.append(('equal', old[i0:i1]))
+            same += i1 - i0
+        elif op == 'delete':
+            segs.append(('delete', old[i0:i1]))
+        else:
+            segs.append(('insert', new[j0:j1]))
+    ratio = 2 * same / (len(old) + len(new)) if old or new else 1.0
+    return segs, ratio
+
+def diff_article_bodies(old, new):
+    """
+    2 つの原稿本文の差分をブロックのリストで返す。
+    [{'op': 'equal'|'delete'|'insert', 'text': 段落}, {'op': 'change', 'segments': [(op, text)]}]
+    """
+    pa, pb = unwrap_paragraphs(old), unwrap_paragraphs(new)
+    blocks, stats = [], {'inserted': 0, 'deleted': 0}
+    # equal 以外の連続区間（削除と追加が並ぶところ）をまとめる
+    runs = []
+    for op, i0, i1, j0, j1 in diff_sequences(pa, pb):
+        if op != 'equal' and runs and runs[-1][0] == 'change':
+            runs[-1] = ('change', runs[-1][1], i1, runs[-1][3], j1)
+        else:
+            runs.append(('equal' if op == 'equal' else 'change', i0, i1, j0, j1))
+    for op, i0, i1, j0, j1 in runs:
+        if op == 'equal':
+            blocks += [{'op': 'equal', 'text': t} for t in pa[i0:i1]]
+            continue
+        # 似ている段落どうしは文字単位の変更として対にする
+        dels, inss = pa[i0:i1], pb[j0:j1]
+        for k in range(max(len(dels), len(inss))):
+            d = dels[k] if k < len(dels) else None
+            i = inss[k] if k < len(inss) else None
+            if d is not None and i is not None:
+                segs, ratio = _char_segments(d, i)
+                if ratio >= 0.4:
+                    blocks.append({'op': 'change', 'segments': segs})
+                    stats['deleted']  += sum(len(t) for o, t in segs if o == 'delete')
+                    stats['inserted'] += sum(len(t) for o, t in segs if o == 'insert')
+                    continue
+            if d is not None:
+                blocks.append({'op': 'delete', 'text': d})
+                stats['deleted'] += len(d)
+            if i is not None:
+                blocks.append({'op': 'insert', 'text': i})
+                stats['inserted'] += len(i)
+    return {'blocks': blocks, 'stats': stats}
+
+@functools.lru_cache(maxsize=256)
+def revision_diff(old_hash, new_hash):
+    """2 つのリビジョンの差分（キャッシュ付き）。リビジョンがなければ KeyError。"""
+    old, new = load_revision(old_hash), load_revision(new_hash)
+    if old is None or new is None:
+        raise KeyError(old_hash if old is None else new_hash)
+    return diff_article_bodies(old, new)
+
+
+@app.route('/api/cycle/<cycle_id>/diff')
+def api_revision_diff(cycle_id):
+    a, b = request.args.get('a', ''), request.args.get('b', '')
+    if not (re.fullmatch(r'[0-9a-f]{64}', a) and re.fullmatch(r'[0-9a-f]{64}', b)):
+        return jsonify({'error': 'invalid revision'}), 400
+    if not {a, b} <= cycle_revision_hashes(cycle_id):
+        return jsonify({'error': 'not found'}), 404
+    try:
+        result = revision_diff(a, b)
+    except KeyError:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify({'a': a, 'b': b, **result})
+
+
+# ─── 過去号の全文検索 ─────────────────────────────────────────────────────────
+# 組版した完成テキストを部署セクションごとに data/issues.json へ保存し（GitHub 同期対象）、
+# そこから SQLite FTS5（trigram トークナイザ）の索引 data/search.db を作る。
+# 索引は issues.json から再生成できる派生データなので、ファイルが更新されたら作り直す。
+# 本文は 20 文字ごとの折り返しを含むので、索引・検索には改行を除いた写し（flat）を使い、
+# 折り返したままの本文（body）は表示用にだけ持つ。
+# trigram は 3 文字未満の語を引けないので、flat の 1 文字・2 文字の並び（unigram・bigram）を
+# 空白区切りにした別の FTS5 表（grams、rowid は sections と同じ）も作り、短い語はそちらで引く。
+
+SEARCH_DB = os.path.join(DATA_DIR, 'search.db')
+_SEARCH_SNIPPET_CHARS = 24
+_SEARCH_SCHEMA = 3                     # 索引の列構成を変えたら上げる（既存の search.db を作り直す）
+
+def load_issues():   return load_json(ISSUES_FILE, [])
+
+def split_newsletter_sections(text):
+    """
+    組版済みテキストを [{dept, body}, ...] に分割する。
+    「◆　はじめに」「◆　会長挨拶」と、各部活動紹介内の【部署名】を区切りとし、
+    ヘッダー（最初の ◆ より前）とフッター（==== 以降）は含めない。
+    """
+    sections, cur = [], None
+    for line in text.splitlines():
+        if re.match(r'^={10,}$', line):
+            break
+        m = re.match(r'^◆[\s　]*(\S+?)[\s　]+-+$', line)
+        if m:
+            name = m.group(1)
+            cur = {'dept': name, 'lines': []} if name in SPECIAL_DEPTS else None
+            if cur:
+                sections.append(cur)
+            continue
+        m = re.match(r'^【(.+)】$', line)
+        if m:
+            cur = {'dept': m.group(1), 'lines': []}
+            sections.append(cur)
+            continue
+        if cur is not None:
+            cur['lines'].append(line)
+    result = []
+    for sec in sections:
+        lines = sec['lines']
+        # はじめに・会長挨拶の末尾の署名行（字下げされた「（広報部　…）」）は本文に含めない
+        while lines and not lines[-1].strip():
+            lines.pop()
+        if lines and re.match(r'^[\s　]{4,}（[^）]*）$', lines[-1]):
+            lines.pop()
+        body = '\n'.join(lines).strip()
+        if body and body != '（未提出）':
+            result.append({'dept': sec['dept'], 'body': body})
+    return result
+
+def archive_issue(cycle, text, source='build'):
+    """完成テキストを号ごとにアーカイブする（同じ号は最新で置き換え、変化がなければ保存しない）。"""
+    issues = load_issues()
+    current = next((i for i in issues if i['cycle_id'] == cycle['id']), None)
+    if current and current.get('text') == text:
+        return current
+    entry = {
+        'cycle_id':       cycle['id'],
+        'vol':            cycle.get('vol', ''),
+        'delivery_year':  cycle.get('delivery_year', ''),
+        'delivery_month': cycle.get('delivery_month', ''),
+        'archived_at':    datetime.now().isoformat(timespec='seconds'),
+        'source':         source,
+        'sections':       split_newsletter_sections(text),
+        'text':           text,
+    }
+    issues = [i for i in issues if i['cycle_id'] != cycle['id']] + [entry]
+    issues.sort(key=lambda i: (i['delivery_year'], i['delivery_month']))
+    save_json(ISSUES_FILE, issues)
+    return entry
+
+def _search_connect():
+    """索引 DB を開き、issues.json より古ければ作り直してから返す。"""
+    import sqlite3
+    conn = sqlite3.connect(SEARCH_DB, timeout=10)
+    conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    try:
+        st = os.stat(ISSUES_FILE)
+        signature = f'{_SEARCH_SCHEMA}:{st.st_mtime_ns}:{st.st_size}'
+    except OSError:
+        signature = f'{_SEARCH_SCHEMA}:none'
+    query = "SELECT value FROM meta WHERE key = 'signature'"
+    row = conn.execute(query).fetchone()
+    if not row or row[0] != signature:
+        # 他ワーカーと同時に作り直さないよう、書き込みロックを取ってから再確認する
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(query).fetchone()
+        if not row or row[0] != signature:
+            _search_rebuild(conn)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (signature,))
+        conn.commit()
+    return conn
+
+def _search_rebuild(conn):
+    conn.execute('DROP TABLE IF EXISTS sections')
+    conn.execute("""CREATE VIRTUAL TABLE sections USING fts5(
+                        flat, body UNINDEXED, dept UNINDEXED, cycle_id UNINDEXED, vol UNINDEXED,
+                        delivery_year UNINDEXED, delivery_month UNINDEXED,
+                        tokenize = 'trigram')""")
+    conn.execute('DROP TABLE IF EXISTS grams')
+    conn.execute('CREATE VIRTUAL TABLE grams USING fts5(gram)')
+    rows = [(sec['body'].replace('\n', ''), sec['body'], sec['dept'], iss['cycle_id'], iss['vol'],
+             iss['delivery_year'], iss['delivery_month'])
+            for iss in load_issues() for sec in iss.get('sections', [])]
+    conn.executemany('INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.executemany('INSERT INTO grams (rowid, gram) VALUES (?, ?)',
+                     ((i, _search_grams(row[0])) for i, row in enumerate(rows, 1)))
+
+def _search_grams(flat):
+    """空白で区切られた各部分の 1 文字・2 文字の並びを空白区切りで返す（grams 表の中身）。"""
+    grams = []
+    for run in re.split(r'[\s　]+', flat):
+        grams.extend(run)
+        grams.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return ' '.join(grams)
+
+def _search_snippet_html(body, terms):
+    """最初に一致した語の前後を切り出し、一致箇所を <mark> で囲んだ HTML を返す。"""
+    from markupsafe import escape
+    flat = body.replace('\n', '')
+    pos = min((flat.find(t) for t in terms if t in flat), default=0)
+    start = max(0, pos - _SEARCH_SNIPPET_CHARS)
+    end   = min(len(flat), pos + _SEARCH_SNIPPET_CHARS * 2)
+    html = str(escape(flat[start:end]))
+    for t in sorted(set(terms), key=len, reverse=True):
+        et = str(escape(t))
+        html = html.replace(et, f'<mark>{et}</mark>')
+    return ('…' if start else '') + html + ('…' if end < len(flat) else '')
+
+def search_issues(query, limit=30):
+    """
+    過去号を全文検索し、関連度順に [{cycle_id, vol, dept, snippet_html, ...}] を返す。
+    3 文字以上の語は sections（trigram）、2 文字以下は grams（unigram・bigram）の MATCH で
+    絞り込み（AND 検索）、両方の bm25 の和で並べる。
+    """
+    terms = [t for t in re.split(r'[\s　]+', query.strip()) if t]
+    if not terms:
+        return []
+    long_terms  = [t for t in terms if len(t) >= 3]
+    short_terms = [t for t in terms if len(t) < 3]
+
+    def phrases(ts):
+        return ' AND '.join('"' + t.replace('"', '""') + '"' for t in ts)
+
+    where, params, rank = [], [], []
+    if long_terms:
+        where.append('sections MATCH ?')
+        params.append(phrases(long_terms))
+        rank.append('bm25(sections)')
+    if short_terms:
+        where.append('grams MATCH ?')
+        params.append(phrases(short_terms))
+        rank.append('bm25(grams)')
+    sql = (f'SELECT body, dept, cycle_id, vol, delivery_year, delivery_month '
+           f'FROM sections JOIN grams ON grams.rowid = sections.rowid '
+           f'WHERE {" AND ".join(where)} '
+           f'ORDER BY {" + ".join(rank)}, delivery_year DESC, delivery_month DESC LIMIT ?')
+
+    conn = _search_connect()
+    try:
+        rows = conn.execute(sql, params + [limit]).fetchall()
+    finally:
+        conn.close()
+    return [{'cycle_id':       cycle_id,
+             'vol':            vol,
+             'delivery_year':  year,
+             'delivery_month': month,
+             'dept':           dept,
+             'snippet_html':   _search_snippet_html(body, terms)}
+            for body, dept, cycle_id, vol, year, month in rows]
+
+
+@app.route('/search')
+def search_page():
+    q = request.args.get('q', '').strip()
+    started = time.perf_counter()
+    results = search_issues(q) if q else []
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    return render_template('search.html', q=q, results=results, elapsed_ms=elapsed_ms,
+                           issues=load_issues())
+
+
+@app.route('/api/search')
+def api_search():
+    q = request.args.get('q', '').strip()
+    try:
+        limit = min(int(request.args.get('limit', 30)), 200)
+    except ValueError:
+        limit = 30
+    started = time.perf_counter()
+    results = search_issues(q, limit) if q else []
+    return jsonify({'query': q, 'count': len(results), 'results': results,
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)})
+
+
+@app.route('/search/import', methods=['POST'])
+@admin_required
+def search_import():
+    """過去号の完成テキスト（.txt）をアーカイブに取り込む。"""
+    f = request.files.get('file')
+    try:
+        vol   = int(request.form['vol'])
+        year  = int(request.form['delivery_year'])
+        month = int(request.form['delivery_month'])
+    except (KeyError, ValueError):
+        flash('Vol番号・年・月を入力してください', 'error')
+        return redirect(url_for('search_page'))
+    if not f or not f.filename:
+        flash('ファイルを選択してください', 'error')
+        return redirect(url_for('search_page'))
+
+    text = _nc_decode_text(f.read())
+    cycle = {'id': f'{year}-{month:02d}', 'vol': vol,
+             'delivery_year': year, 'delivery_month': month}
+    entry = archive_issue(cycle, text, source='import')
+    flash(f'vol.{vol} を取り込みました（{len(entry["sections"])}セクション）', 'success')
+    return redirect(url_for('search_page'))
+
+
+# ─── SMTP 送信 ────────────────────────────────────────────────────────────────
+# ステップのメールを宛先ごとに 1 通ずつ SMTP で送る。
+# 送信スレッド（SMTP_POOL_SIZE 本）がそれぞれ接続を張ったまま使い回し、
+# 送信間隔はトークンバケットで SMTP_RATE 通/秒（バースト SMTP_BURST 通）に抑える。
+# 一時エラー（4xx・切断）は間隔を倍々にあけて SMTP_MAX_RETRIES 回まで再送する。
+# 宛先ごとの結果は号データの deliveries[step_key] に記録する。
+# キューはメモリ上だけにあるので、再起動などで失われた送信待ち・再送待ちの宛先は、
+# キューが生きていれば更新されているはずの時間（_mail_lifetime）を過ぎると「中断」として扱い、
+# 「未送信の宛先だけ」で送り直せるようにする。
+# ※ smtplib は PIPELINING に対応していないため、コマンドは 1 つずつ往復する。
+#
+# 環境変数:
+#   SMTP_HOST / SMTP_PORT（既定 587）/ SMTP_USER / SMTP_PASSWORD
+#   SMTP_SECURITY   … starttls（既定）/ ssl / none
+#   SMTP_FROM       … 差出人アドレス（未設定なら設定画面の送信者メール）
+#   SMTP_RATE       … 1 秒あたりの送信数（既定 1）
+#   SMTP_BURST      … 連続で送ってよい通数（既定 5）
+#   SMTP_POOL_SIZE  … 同時接続数（既定 2）
+#   SMTP_MAX_RETRIES… 一時エラー時の再送回数（既定 3）
+#   SMTP_RETRY_DELAY… 初回再送までの秒数（既定 30）
+
+import heapq, smtplib
+from email.message import EmailMessage
+from email.utils import formataddr, formatdate, make_msgid, getaddresses
+
+_SMTP_HOST        = os.environ.get('SMTP_HOST', '')
+_SMTP_PORT        = int(os.environ.get('SMTP_PORT', '587'))
+_SMTP_USER        = os.environ.get('SMTP_USER', '')
+_SMTP_PASSWORD    = os.environ.get('SMTP_PASSWORD', '')
+_SMTP_SECURITY    = os.environ.get('SMTP_SECURITY', 'starttls').lower()
+_SMTP_FROM        = os.environ.get('SMTP_FROM', '')
+_SMTP_RATE        = float(os.environ.get('SMTP_RATE', '1'))
+_SMTP_BURST       = int(os.environ.get('SMTP_BURST', '5'))
+_SMTP_POOL_SIZE   = int(os.environ.get('SMTP_POOL_SIZE', '2'))
+_SMTP_MAX_RETRIES = int(os.environ.get('SMTP_MAX_RETRIES', '3'))
+_SMTP_RETRY_DELAY = float(os.environ.get('SMTP_RETRY_DELAY', '30'))
+_SMTP_IDLE        = 60     # これ以上使われなかった接続は閉じる（秒）
+
+_ADDR_RE = re.compile(r'^[^@\s<>,]+@[^@\s<>,]+\.[^@\s<>,]+$')
+
+_mail_heap    = []                  # [(ready_at, seq, job)]  ready_at は time.monotonic()
+_mail_seq     = 0
+_mail_cond    = threading.Condition()
+_mail_threads = []
+_mail_bucket  = {'tokens': float(_SMTP_BURST), 'at': time.monotonic()}
+_mail_bucket_lock = threading.Lock()
+_mail_pending = {}                  # (cycle_id, step_key) -> {addr: 更新内容}（未保存の結果）
+_mail_open    = {}                  # (cycle_id, step_key) -> 送信待ち・再送待ちの件数
+_mail_flushed = {}                  # (cycle_id, step_key) -> 最終保存時刻
+_mail_saving  = {}                  # (cycle_id, step_key) -> 保存中の結果（保存が終わるまで表示に重ねる）
+_mail_live    = set()               # このプロセスのキューにある (cycle_id, step_key, addr)
+_mail_flush_lock = threading.Lock()
+_mail_save_lock  = threading.Lock() # 号データの読み込み〜保存を直列にする（_mail_flush_lock の外）
+
+
+def smtp_enabled():
+    return bool(_SMTP_HOST)
+
+def parse_recipients(text):
+    """宛先リスト（改行・カンマ区切り、「名前 <addr>」可）を ([(name, addr)], [不正な行]) にする。"""
+    valid, invalid, seen = [], [], set()
+    for chunk in re.split(r'[\n,、;]+', text or ''):
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        name, addr = getaddresses([chunk])[0]
+        if not _ADDR_RE.match(addr):
+            invalid.append(chunk)
+        elif addr.lower() not in seen:
+            seen.add(addr.lower())
+            valid.append((name, addr))
+    return valid, invalid
+
+def _smtp_connect():
+    if _SMTP_SECURITY == 'ssl':
+        conn = smtplib.SMTP_SSL(_SMTP_HOST, _SMTP_PORT, timeout=30)
+    else:
+        conn = smtplib.SMTP(_SMTP_HOST, _SMTP_PORT, timeout=30)
+        if _SMTP_SECURITY == 'starttls':
+            conn.starttls()
+    if _SMTP_USER:
+        conn.login(_SMTP_USER, _SMTP_PASSWORD)
+    metric_inc('melmaga_smtp_connections_total')
+    return conn
+
+def _smtp_close(conn):
+    try:
+        conn.quit()
+    except (smtplib.SMTPException, OSError):
+        conn.close()
+
+def _mail_take_token():
+    """トークンバケットから 1 通分を取る（足りなければ待つ）。"""
+    if _SMTP_RATE <= 0:
+        return
+    while True:
+        with _mail_bucket_lock:
+            now = time.monotonic()
+            b = _mail_bucket
+            b['tokens'] = min(float(_SMTP_BURST), b['tokens'] + (now - b['at']) * _SMTP_RATE)
+            b['at'] = now
+            if b['tokens'] >= 1:
+                b['tokens'] -= 1
+                return
+            wait = (1 - b['tokens']) / _SMTP_RATE
+        time.sleep(wait)
+
+def _mail_push(job, delay=0.0):
+    global _mail_seq
+    with _mail_cond:
+        _mail_seq += 1
+        heapq.heappush(_mail_heap, (time.monotonic() + delay, _mail_seq, job))
+        _mail_cond.notify()
+
+def _mail_record(job, final, **fields):
+    """宛先の結果を記録する。号データへの保存はまとめて行う。"""
+    key = (job['cycle_id'], job['step_key'])
+    fields['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    with _mail_flush_lock:
+        _mail_pending.setdefault(key, {}).setdefault(job['addr'], {}).update(fields)
+        if final:
+            _mail_open[key] = _mail_open.get(key, 1) - 1
+            _mail_live.discard((*key, job['addr']))
+        due = _mail_open.get(key, 0) <= 0 or time.time() - _mail_flushed.get(key, 0) > 5
+    if due:
+        _mail_flush(key)
+
+def _mail_flush(key):
+    # 号データの読み込み・保存（GitHub への書き込みを含む）は _mail_flush_lock の外で行い、
+    # その間も送信スレッドが結果を記録できるようにする
+    with _mail_save_lock:
+        with _mail_flush_lock:
+            updates = _mail_pending.pop(key, None)
+            if not updates:
+                return
+            _mail_saving[key] = updates
+        try:
+            cycles = load_cycles()
+            cycle  = next((c for c in cycles if c['id'] == key[0]), None)
+            if cycle is not None:
+                recs = cycle.setdefault('deliveries', {}).setdefault(key[1], {}).setdefault('recipients', {})
+                for addr, fields in updates.items():
+                    recs.setdefault(addr, {}).update(fields)
+                save_cycles(cycles)
+        finally:
+            with _mail_flush_lock:
+                _mail_saving.pop(key, None)
+                _mail_flushed[key] = time.time()
+
+def _mail_lifetime(waiting):
+    """
+    送信待ち・再送待ちの記録が、キューが生きていれば更新されているはずの秒数。
+    waiting 件を送り終えるまでの時間＋最も長い再送間隔に余裕を足したもの。
+    """
+    drain = waiting / _SMTP_RATE if _SMTP_RATE > 0 else 0
+    return drain + _SMTP_RETRY_DELAY * 2 ** max(0, _SMTP_MAX_RETRIES - 1) + 300
+
+def _mail_send_one(conn, job):
+    """1 通送る。戻り値: (接続, 'sent' | 'retry' | 'failed', エラー文字列)"""
+    try:
+        if conn is None:
+            conn = _smtp_connect()
+        conn.send_message(job['msg'], job['from'], [job['addr']])
+        return conn, 'sent', None
+    except smtplib.SMTPRecipientsRefused as e:
+        code, msg = next(iter(e.recipients.values()))
+        err = f'{code} {msg.decode("utf-8", "replace") if isinstance(msg, bytes) else msg}'
+        return conn, 'retry' if 400 <= code < 500 else 'failed', err
+    except smtplib.SMTPResponseException as e:
+        msg = e.smtp_error.decode('utf-8', 'replace') if isinstance(e.smtp_error, bytes) else str(e.smtp_error)
+        try:
+            conn.rset()
+        except (smtplib.SMTPException, OSError, AttributeError):
+            conn = None
+        return conn, 'retry' if 400 <= e.smtp_code < 500 else 'failed', f'{e.smtp_code} {msg}'
+    except (smtplib.SMTPException, OSError) as e:
+        # 切断・タイムアウトなどは接続を作り直して再送する
+        if conn is not None:
+            conn.close()
+        return None, 'retry', f'{type(e).__name__}: {e}'
+
+def _mail_worker():
+    conn, last_used = None, 0.0
+    while True:
+        with _mail_cond:
+            while True:
+                now = time.monotonic()
+                if _mail_heap and _mail_heap[0][0] <= now:
+                    _, _, job = heapq.heappop(_mail_heap)
+                    break
+                timeout = _mail_heap[0][0] - now if _mail_heap else _SMTP_IDLE
+                if not _mail_cond.wait(timeout) and conn is not None and now - last_used > _SMTP_IDLE:
+                    _smtp_close(conn)
+                    conn = None
+        _mail_take_token()
+        if conn is not None and time.monotonic() - last_used > _SMTP_IDLE / 2:
+            # しばらく使っていない接続は生きているか確認してから使う
+            try:
+                conn.noop()
+            except (smtplib.SMTPException, OSError):
+                conn.close()
+                conn = None
+        job['attempts'] += 1
+        conn, result, err = _mail_send_one(conn, job)
+        last_used = time.monotonic()
+        metric_inc('melmaga_smtp_messages_total', {'result': result})
+
+        now_iso = datetime.now().isoformat(timespec='seconds')
+        if result == 'retry' and job['attempts'] <= _SMTP_MAX_RETRIES:
+            _mail_record(job, False, status='retrying', attempts=job['attempts'], error=err)
+            _mail_push(job, _SMTP_RETRY_DELAY * 2 ** (job['attempts'] - 1))
+        elif result == 'sent':
+            _mail_record(job, True, status='sent', attempts=job['attempts'], error=None, sent_at=now_iso)
+        else:
+            _mail_record(job, True, status='failed', attempts=job['attempts'], error=err)
+
+def _mail_start():
+    with _mail_cond:
+        while len(_mail_threads) < max(1, _SMTP_POOL_SIZE):
+            t = threading.Thread(target=_mail_worker, name=f'smtp-{len(_mail_threads)}', daemon=True)
+            _mail_threads.append(t)
+            t.start()
+
+def _new_message(config, subject, body):
+    msg = EmailMessage()
+    msg['From']       = formataddr((config.get('sender_name', ''), _SMTP_FROM or config.get('sender_email', '')))
+    msg['Subject']    = subject
+    msg['Date']       = formatdate(localtime=True)
+    msg['Message-ID'] = make_msgid()
+    msg.set_content(body)
+    return msg
+
+def build_step_message(cycle, step_key, config, to_name, to_addr):
+    """ステップのテンプレートを宛先 1 件分の EmailMessage にする。"""
+    tmpl = load_templates().get(step_key, {})
+    vars = template_vars(cycle, config)
+    msg  = _new_message(config, render_vars(tmpl.get('subject', ''), cycle, config, vars),
+                        render_vars(tmpl.get('body', ''), cycle, config, vars))
+    msg['To'] = formataddr((to_name, to_addr))
+    return msg
+
+def queue_step_email(cycle_id, step_key, recipients):
+    """
+    ステップのメールを宛先ごとに送信キューに積む。
+    recipients = [(name, addr), ...]。戻り値は積んだ件数。
+    """
+    cycles = load_cycles()
+    cycle  = next((c for c in cycles if c['id'] == cycle_id), None)
+    if cycle is None:
+        return 0
+    config    = load_config()
+    from_addr = _SMTP_FROM or config.get('sender_email', '')
+    delivery  = cycle.setdefault('deliveries', {}).setdefault(step_key, {})
+    delivery['started_at'] = datetime.now().isoformat(timespec='seconds')
+    recs = delivery.setdefault('recipients', {})
+
+    jobs = []
+    for name, addr in recipients:
+        recs[addr] = {'name': name, 'status': 'queued', 'attempts': 0, 'error': None, 'sent_at': None,
+                      'updated_at': delivery['started_at']}
+        jobs.append({'cycle_id': cycle_id, 'step_key': step_key, 'addr': addr, 'from': from_addr,
+                     'attempts': 0, 'msg': build_step_message(cycle, step_key, config, name, addr)})
+    save_cycles(cycles)
+
+    key = (cycle_id, step_key)
+    with _mail_flush_lock:
+        _mail_open[key] = _mail_open.get(key, 0) + len(jobs)
+        _mail_live.update((cycle_id, step_key, job['addr']) for job in jobs)
+    _mail_start()
+    for job in jobs:
+        _mail_push(job)
+    return len(jobs)
+
+def delivery_status(cycle, step_key):
+    """
+    号データの送信記録に未保存の結果を重ねて返す。
+    キューが失われたとみられる送信待ち・再送待ちの宛先は 'interrupted'（中断）にする。
+    """
+    key      = (cycle['id'], step_key)
+    delivery = dict(cycle.get('deliveries', {}).get(step_key, {}))
+    recs = {a: dict(r) for a, r in delivery.get('recipients', {}).items()}
+    with _mail_flush_lock:
+        for overlay in (_mail_saving.get(key, {}), _mail_pending.get(key, {})):
+            for addr, fields in overlay.items():
+                recs.setdefault(addr, {}).update(fields)
+        live = {a for c, s, a in _mail_live if (c, s) == key}
+    waiting = [a for a, r in recs.items() if r.get('status') in ('queued', 'retrying') and a not in live]
+    if waiting:
+        limit = datetime.now() - timedelta(seconds=_mail_lifetime(len(waiting)))
+        for a in waiting:
+            try:
+                updated = datetime.fromisoformat(recs[a].get('updated_at') or delivery.get('started_at', ''))
+            except ValueError:
+                updated = None
+            if updated is None or updated < limit:
+                recs[a]['status'] = 'interrupted'
+    counts = {}
+    for r in recs.values():
+        counts[r.get('status')] = counts.get(r.get('status'), 0) + 1
+    delivery['recipients'] = recs
+    delivery['counts'] = counts
+    return delivery
+
+
+@app.route('/cycle/<cycle_id>/email/<step_key>/send', methods=['POST'])
+@admin_required
+def email_send(cycle_id, step_key):
+    back = redirect(url_for('email_compose', cycle_id=cycle_id, step_key=step_key))
+    if not smtp_enabled():
+        flash('SMTP が設定されていません（環境変数 SMTP_HOST）', 'error')
+        return back
+    if step_key not in load_templates():
+        flash('テンプレートが見つかりません', 'error')
+        return back
+
+    text = request.form.get('recipients', '')
+    recipients, invalid = parse_recipients(text)
+    if request.form.get('only_unsent'):
+        cycle = next((c for c in load_cycles() if c['id'] == cycle_id), None)
+        # 中断（キューが失われた）と失敗の宛先は送り直す
+        done  = {a for a, r in delivery_status(cycle, step_key)['recipients'].items()
+                 if r.get('status') in ('sent', 'queued', 'retrying')} if cycle else set()
+        recipients = [(n, a) for n, a in recipients if a not in done]
+    if invalid:
+        flash('宛先の形式が正しくありません: ' + '、'.join(invalid), 'error')
+        return back
+    if not recipients:
+        flash('送信する宛先がありません', 'error')
+        return back
+
+    # 次回のために宛先リストを保存
+    config = load_config()
+    saved  = config.setdefault('recipients', {})
+    if saved.get(step_key) != text.strip():
+        saved[step_key] = text.strip()
+        save_config(config)
+
+    n = queue_step_email(cycle_id, step_key, recipients)
+    flash(f'{n}件を送信キューに追加しました', 'success')
+    return back
+
+
+@app.route('/api/cycle/<cycle_id>/email/<step_key>/deliveries')
+@admin_required
+def api_email_deliveries(cycle_id, step_key):
+    cycle = next((c for c in load_cycles() if c['id'] == cycle_id), None)
+    if not cycle:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(delivery_status(cycle, step_key))
+
+
+# ─── 号のメール一式の書き出し（.eml の ZIP / mbox） ────────────────────────────
+# テンプレートのあるステップのメールと組版済みのメルマガ本文を、
+# 号・設定・テンプレートを 1 回だけ読んで順に生成し、そのままストリームで返す。
+# .eml には X-Unsent: 1 を付けるので、Outlook などでは下書きとして開ける。
+
+class _ChunkBuffer:
+    """zipfile の書き込み先。書かれた分を drain() で取り出す（シーク不可のストリーム扱い）。"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        out, self._chunks = b''.join(self._chunks), []
+        return out
+
+def export_cycle_messages(cycle):
+    """号のメール（ステップ順）とメルマガ本文を (ファイル名, EmailMessage) で順に返す。"""
+    config    = load_config()
+    templates = load_templates()
+    vars      = template_vars(cycle, config)
+    saved     = config.get('recipients', {})
+
+    n = 0
+    for step in STEPS:
+        tmpl = templates.get(step['key'])
+        if not step['has_email'] or not tmpl:
+            continue
+        def render(field):
+            return render_vars(tmpl.get(field, ''), cycle, config, vars)
+        msg = _new_message(config, render('subject'), render('body'))
+        # To/Cc はテンプレート上は宛名の説明なので、保存済みの宛先リストがあればそれを使う
+        to_addrs, _ = parse_recipients(saved.get(step['key'], ''))
+        if to_addrs:
+            msg['To'] = ', '.join(formataddr(a) for a in to_addrs)
+        for field, header in (('to', 'X-Melmaga-To'), ('cc', 'X-Melmaga-Cc')):
+            text = ' '.join(render(field).split())
+            if text:
+                msg[header] = text
+        msg['X-Melmaga-Step'] = step['key']
+        msg['X-Unsent'] = '1'
+        n += 1
+        yield f'{n:02d}_{step["key"]}.eml', msg
+
+    issue = next((i for i in load_issues() if i['cycle_id'] == cycle['id']), None)
+    if issue:
+        msg = _new_message(config,
+                           f'メルマガいたしん vol.{cycle.get("vol", "")}'
+                           f'（{cycle.get("delivery_year", "")}年{cycle.get("delivery_month", "")}月号）',
+                           issue['text'])
+        msg['X-Melmaga-Step'] = 'newsletter'
+        msg['X-Unsent'] = '1'
+        yield f'{n + 1:02d}_newsletter.eml', msg
+
+def _stream_zip(items):
+    import zipfile
+    buf = _ChunkBuffer()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, msg in items:
+            zf.writestr(name, msg.as_bytes())
+            yield buf.drain()
+    yield buf.drain()
+
+def _stream_mbox(items):
+    for _, msg in items:
+        sender = _SMTP_FROM or 'MAILER-DAEMON'
+        body   = msg.as_bytes(unixfrom=False).replace(b'\r\n', b'\n')
+        body   = re.sub(rb'^(>*From )', rb'>\1', body, flags=re.M)   # mboxrd のエスケープ
+        yield f'From {sender} {time.asctime()}\n'.encode('ascii') + body.rstrip(b'\n') + b'\n\n'
+
+
+@app.route('/cycle/<cycle_id>/export')
+def cycle_export(cycle_id):
+    from flask import Response, stream_with_context
+    cycle = next((c for c in load_cycles() if c['id'] == cycle_id), None)
+    if not cycle:
+        return jsonify({'error': 'not found'}), 404
+    fmt  = request.args.get('format', 'zip')
+    base = f'melmaga_vol{cycle.get("vol", "")}_{cycle_id}'
+    if fmt == 'mbox':
+        body, mimetype, name = _stream_mbox(export_cycle_messages(cycle)), 'application/mbox', base + '.mbox'
+    elif fmt == 'zip':
+        body, mimetype, name = _stream_zip(export_cycle_messages(cycle)), 'application/zip', base + '.zip'
+    else:
+        return jsonify({'error': 'format must be zip or mbox'}), 400
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{name}"'})
+
+
+# ─── 締切スケジューラ ─────────────────────────────────────────────────────────
+# calc_schedule の日程（スケジュール案内・原稿依頼・リマインド・〆切・発行…）を
+# 全号分ヒープに積み、次の予定時刻まで Condition で待つ（ポーリングしない）。
+# 号の作成・年月変更のたびに該当号の予定を入れ替え、再起動時はデータから組み直す。
+# 発火は data/scheduler/ のマーカー（O_EXCL）と号の 'fired' 記録で
+# gunicorn の複数ワーカーをまたいで 1 回だけになるようにする。
+#
+# 環境変数:
+#   SCHEDULER_ENABLED      … 0 で無効（既定 1）
+#   SCHEDULER_ACTIONS      … 実行するアクション（カンマ区切り、既定 dashboard_flag,webhook）
+#   SCHEDULER_WEBHOOK_URL  … webhook アクションの送信先（未設定なら何もしない）
+#   SCHEDULER_FIRE_HOUR    … 予定日の何時に発火するか（既定 9）
+#   SCHEDULER_CATCHUP_HOURS… 停止中に過ぎた予定を何時間前まで発火するか（既定 12）
+
+SCHEDULER_DIR        = os.path.join(DATA_DIR, 'scheduler')
+OUTBOX_FILE          = os.path.join(DATA_DIR, 'outbox.json')
+_SCHED_ENABLED       = os.environ.get('SCHEDULER_ENABLED', '1') != '0'
+_SCHED_ACTIONS       = [a.strip() for a in
+                        os.environ.get('SCHEDULER_ACTIONS', 'dashboard_flag,webhook').split(',')
+                        if a.strip()]
+_SCHED_WEBHOOK_URL   = os.environ.get('SCHEDULER_WEBHOOK_URL', '')
+_SCHED_FIRE_HOUR     = int(os.environ.get('SCHEDULER_FIRE_HOUR', '9'))
+_SCHED_CATCHUP       = timedelta(hours=int(os.environ.get('SCHEDULER_CATCHUP_HOURS', '12')))
+
+SCHEDULE_LABELS = {
+    'schedule_mail':     'スケジュール案内',
+    'request_mail':      '原稿依頼',
+    'deadline_reminder': 'リマインド',
+    'deadline':          '原稿〆切',
+    'review_request':    '確認依頼',
+    'review_deadline':   '確認〆切',
+    'test_distribution': 'テスト配信',
+    'test_deadline':     'テスト配信確認〆切',
+    'publish':           'メルマガ発行',
+}
+
+_sched_heap   = []                   # [(due, cycle_id, key, date_str, gen)]
+_sched_gen    = {}                   # cycle_id -> 世代（古い予定を無効化するため）
+_sched_cond   = threading.Condition()
+_sched_thread = None
+_sched_actions = {}                  # name -> fn(cycle, key, date_str) -> 結果文字列
+
+
+def scheduler_action(name):
+    """スケジューラのアクションを登録するデコレータ。"""
+    def deco(fn):
+        _sched_actions[name] = fn
+        return fn
+    return deco
+
+def _sched_due(date_str):
+    d = datetime.strptime(date_str, '%Y/%m/%d')
+    return d.replace(hour=_SCHED_FIRE_HOUR)
+
+def _sched_push_cycle(cycle, now):
+    """号の予定をヒープに積む（_sched_cond を保持して呼ぶこと）。"""
+    gen   = _sched_gen[cycle['id']] = _sched_gen.get(cycle['id'], 0) + 1
+    fired = cycle.get('fired', {})
+    for key, date_str in cycle.get('schedule', {}).items():
+        if fired.get(key, {}).get('date') == date_str:
+            continue
+        try:
+            due = _sched_due(date_str)
+        except ValueError:
+            continue
+        if due < now - _SCHED_CATCHUP:
+            continue
+        heapq.heappush(_sched_heap, (due, cycle['id'], key, date_str, gen))
+
+def scheduler_rebuild():
+    """保存データから予定を組み直す（起動時）。"""
+    now = datetime.now()
+    with _sched_cond:
+        _sched_heap.clear()
+        _sched_gen.clear()
+        for c in load_cycles():
+            _sched_push_cycle(c, now)
+        _sched_cond.notify()
+
+def scheduler_reschedule(cycle, old_id=None):
+    """号の作成・日程変更後に、その号の予定だけを入れ替える。"""
+    if _sched_thread is None:
+        return   # 未起動なら起動時に組み直される
+    with _sched_cond:
+        if old_id and old_id != cycle['id']:
+            _sched_gen[old_id] = _sched_gen.get(old_id, 0) + 1
+        _sched_push_cycle(cycle, datetime.now())
+        _sched_cond.notify()
+
+def scheduler_upcoming(limit=20):
+    """有効な予定を時刻順に返す。"""
+    with _sched_cond:
+        live = [e for e in _sched_heap if _sched_gen.get(e[1]) == e[4]]
+    return [{'due': due.isoformat(), 'cycle_id': cid, 'key': key,
+             'label': SCHEDULE_LABELS.get(key, key), 'date': date_str}
+            for due, cid, key, date_str, _ in heapq.nsmallest(limit, live)]
+
+def _sched_claim(cycle_id, key, date_str):
+    """このプロセスが発火権を得たら True（マーカーファイルの排他作成）。"""
+    os.makedirs(SCHEDULER_DIR, exist_ok=True)
+    marker = os.path.join(SCHEDULER_DIR, f'{cycle_id}_{key}_{date_str.replace("/", "")}')
+    try:
+        fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        f.write(f'{os.getpid()} {datetime.now().isoformat()}\n')
+    return True
+
+def _sched_fire(cycle_id, key, date_str):
+    cycles = load_cycles()
+    cycle  = next((c for c in cycles if c['id'] == cycle_id), None)
+    # 他ワーカーで日程が変わった・削除された・発火済みなら何もしない
+    if not cycle or cycle.get('schedule', {}).get(key) != date_str:
+        return
+    if cycle.get('fired', {}).get(key, {}).get('date') == date_str:
+        return
+    if not _sched_claim(cycle_id, key, date_str):
+        return
+    if key in MISSING_TARGET_STEPS:
+        # リマインド・締切のメールに載せる未提出の部署を、フォルダの最新の状態にしておく
+        if refresh_submissions(cycle_id):
+            cycle = next(c for c in load_cycles() if c['id'] == cycle_id)
+
+    results = {}
+    for name in _SCHED_ACTIONS:
+        fn = _sched_actions.get(name)
+        if fn is None:
+            results[name] = 'unknown action'
+            continue
+        try:
+            results[name] = fn(cycle, key, date_str)
+        except Exception as e:
+            app.logger.exception('scheduler action %s failed for %s %s', name, cycle_id, key)
+            results[name] = f'error: {e}'
+        metric_inc('melmaga_scheduler_actions_total',
+                   {'action': name, 'result': 'error' if results[name].startswith('error') else 'ok'})
+    app.logger.info('scheduler fired %s %s %s: %s', cycle_id, key, date_str, results)
+
+    # 発火記録は最新のデータに書き込む（アクション中に他の保存があっても消さない）
+    cycles = load_cycles()
+    cycle  = next((c for c in cycles if c['id'] == cycle_id), None)
+    if cycle is not None:
+        cycle.setdefault('fired', {})[key] = {
+            'date':    date_str,
+            'at':      datetime.now().isoformat(timespec='seconds'),
+            'actions': results,
+        }
+        save_cycles(cycles)
+
+def _sched_loop():
+    scheduler_rebuild()
+    while True:
+        with _sched_cond:
+            if not _sched_heap:
+                _sched_cond.wait()
+                continue
+            due, cycle_id, key, date_str, gen = _sched_heap[0]
+            wait = (due - datetime.now()).total_seconds()
+            if wait > 0:
+                # 時計のずれに備えて最長 1 時間で起き直す
+                _sched_cond.wait(min(wait, 3600))
+                continue
+            heapq.heappop(_sched_heap)
+            if _sched_gen.get(cycle_id) != gen:
+                continue
+        try:
+            _sched_fire(cycle_id, key, date_str)
+        except Exception:
+            app.logger.exception('scheduler %s %s failed', cycle_id, key)
+
+def scheduler_start():
+    """スケジューラのスレッドを起動する（プロセスごとに 1 回）。"""
+    global _sched_thread
+    with _sched_cond:
+        if _sched_thread is not None or not _SCHED_ENABLED:
+            return
+        _sched_thread = threading.Thread(target=_sched_loop, name='scheduler', daemon=True)
+    _sched_thread.start()
+
+@app.before_request
+def _scheduler_lazy_start():
+    # preload_app の fork 後に各ワーカーで起動する（スレッドは fork で引き継がれない）
+    if _sched_thread is None:
+        scheduler_start()
+
+
+# ── アクション ──
+
+@scheduler_action('dashboard_flag')
+def _action_dashboard_flag(cycle, key, date_str):
+    """ダッシュボードに「本日の予定」として表示する（表示は fired の記録を参照）。"""
+    return 'flagged'
+
+@scheduler_action('webhook')
+def _action_webhook(cycle, key, date_str):
+    if not _SCHED_WEBHOOK_URL:
+        return 'skipped (no url)'
+    if not _REQUESTS_OK:
+        return 'error: requests not installed'
+    import requests
+    r = requests.post(_SCHED_WEBHOOK_URL, timeout=10, json={
+        'event':    key,
+        'label':    SCHEDULE_LABELS.get(key, key),
+        'date':     date_str,
+        'cycle_id': cycle['id'],
+        'vol':      cycle.get('vol'),
+    })
+    return f'http {r.status_code}' if r.ok else f'error: http {r.status_code}'
+
+@scheduler_action('queued_email')
+def _action_queued_email(cycle, key, date_str):
+    """同名のメールテンプレートがあれば展開して data/outbox.json に積む（送信はしない）。"""
+    tmpl = load_templates().get(key)
+    if not tmpl:
+        return 'skipped (no template)'
+    config = load_config()
+    vars   = template_vars(cycle, config)
+    outbox = load_json(OUTBOX_FILE, [])
+    outbox.append({
+        'id':        f'{cycle["id"]}_{key}_{date_str.replace("/", "")}',
+        'cycle_id':  cycle['id'],
+        'step':      key,
+        'to':        render_vars(tmpl.get('to', ''), cycle, config, vars),
+        'cc':        render_vars(tmpl.get('cc', ''), cycle, config, vars),
+        'subject':   render_vars(tmpl.get('subject', ''), cycle, config, vars),
+        'body':      render_vars(tmpl.get('body', ''), cycle, config, vars),
+        'status':    'queued',
+        'queued_at': datetime.now().isoformat(timespec='seconds'),
+    })
+    save_json(OUTBOX_FILE, outbox)
+    return 'queued'
+
+
+def due_flags(cycle):
+    """ダッシュボード表示用: 発火済みで、対応するステップが未完了の予定。"""
+    if 'dashboard_flag' not in _SCHED_ACTIONS:
+        return []
+    steps = cycle.get('steps', {})
+    flags = []
+    for key, rec in cycle.get('fired', {}).items():
+        if rec.get('dismissed') or steps.get(key, {}).get('completed'):
+            continue
+        if rec.get('date') != cycle.get('schedule', {}).get(key):
+            continue
+        flags.append({'key': key, 'label': SCHEDULE_LABELS.get(key, key), 'date': rec['date']})
+    return sorted(flags, key=lambda f: f['date'])
+
+
+@app.route('/cycle/<cycle_id>/flags/<key>/dismiss', methods=['POST'])
+@admin_required
+def dismiss_flag(cycle_id, key):
+    cycles = load_cycles()
+    cycle  = next((c for c in cycles if c['id'] == cycle_id), None)
+    if not cycle or key not in cycle.get('fired', {}):
+        return jsonify({'error': 'not found'}), 404
+    cycle['fired'][key]['dismissed'] = True
+    save_cycles(cycles)
+    return jsonify({'ok': True})
+
+
+@app.route('/api/scheduler')
+@admin_required
+def api_scheduler():
+    return jsonify({'enabled': _SCHED_ENABLED, 'running': _sched_thread is not None,
+                    'actions': _SCHED_ACTIONS, 'upcoming': scheduler_upcoming()})
+
+
+# ─── 閲覧ロール向けの静的スナップショット ─────────────────────────────────────
+# 閲覧ロール（USER_PASSWORD）はダッシュボードと号の詳細を見るだけなので、
+# データが変わるたび（save_json・版の記録）にバックグラウンドで、ダッシュボードと
+# 内容の変わった号（号データ・提出履歴・提出フォルダのハッシュで判定）の HTML と
+# ?format=json の JSON を data/snapshots/ に書き出しておき、閲覧ロールの GET には
+# ファイルをそのまま返す（gunicorn では sendfile）。load_cycles・フォルダのスキャン・
+# テンプレート描画を通らないので、XServer 取得などで片方のワーカーが塞がっていても速く返る。
+# manifest.json に生成時点のデータのバージョン（データファイルの更新時刻・サイズと日付）を
+# 記録し、現在のものと一致しない間は通常どおり描画する（生成し直しも依頼する）。
+# 提出フォルダは中身の追加・削除（フォルダの更新時刻）だけを見る。
+#
+# 環境変数:
+#   SNAPSHOTS_ENABLED … 1 で有効、0 で無効（既定は ADMIN_PASSWORD と USER_PASSWORD が両方あるとき有効）
+
+from flask import send_file
+
+SNAPSHOT_DIR       = os.path.join(DATA_DIR, 'snapshots')
+_SNAPSHOTS_ENABLED = os.environ.get(
+    'SNAPSHOTS_ENABLED', '1' if _AUTH_ENABLED and _USER_PASSWORD else '0') != '0'
+_SNAPSHOT_DEBOUNCE = 0.3               # 連続した保存をまとめる待ち時間（秒）
+_SNAPSHOT_MIMETYPES = {'html': 'text/html; charset=utf-8', 'json': 'application/json'}
+
+_snap_dirty      = threading.Event()
+_snap_start_lock = threading.Lock()
+_snap_build_lock = threading.Lock()
+_snap_pid        = None                # 生成スレッドを起動したプロセス（fork 後は起動し直す）
+
+
+def _snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, name)
+
+@contextmanager
+def _snapshot_locked():
+    """data/snapshots/.lock の排他ロック（ワーカー間で生成が重ならないように）。"""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with _snap_build_lock, open(_snapshot_path('.lock'), 'a') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _file_version(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def snapshot_data_version():
+    """画面の内容を左右するデータのバージョン（ファイルの更新時刻・サイズと今日の日付）。"""
+    return [date.today().isoformat()] + [
+        _file_version(p) for p in (CYCLES_FILE, CONFIG_FILE, TEMPLATES_FILE,
+                                   _rev_path('log.json'))]
+
+def _snapshot_manifest():
+    try:
+        with open(_snapshot_path('manifest.json'), 'rb') as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+def _snapshot_write(name, path, render):
+    """
+    閲覧ロールのリクエストとして render(fmt) を呼び、name.html / name.json に書き出す。
+    render には読み込み済みのデータから応答を作る関数（dashboard_page など）を渡す。
+    """
+    for fmt, query in (('html', ''), ('json', '?format=json')):
+        with app.test_request_context(path + query):
+            flask_session['role'] = 'user'
+            resp = app.make_response(render(fmt))
+            if resp.status_code == 200:
+                _write_local_bytes(_snapshot_path(f'{name}.{fmt}'), resp.get_data())
+
+def _cycle_fingerprint(cycle, history, folder_version):
+    """号の詳細画面の内容を左右するもの（号データ・提出履歴・提出フォルダ）のハッシュ。"""
+    payload = json_dumps_compact({'cycle': cycle, 'history': history, 'folder': folder_version})
+    return hashlib.sha256(payload).hexdigest()
+
+def snapshot_build():
+    """
+    ダッシュボードと、前回から内容の変わった号の詳細（HTML・JSON）を書き出し、manifest.json を更新する。
+    データは 1 度だけ読み込み、画面は保存を伴わない dashboard_page / cycle_detail_page で作る。
+    """
+    started = time.perf_counter()
+    with _snapshot_locked():
+        # 描画中に保存があれば古いバージョンのまま記録され、次の生成まで使われない
+        version  = snapshot_data_version()
+        previous = _snapshot_manifest() or {}
+        if previous.get('version') == version:
+            return   # 他のワーカーが作り直し済み
+        # 日付・設定・メールテンプレートはどの号の画面にも出るので、変わったら全号を作り直す
+        shared   = [version[0], version[2], version[3]]   # 日付・config.json・email_templates.json
+        old_fps  = previous.get('cycles', {}) if previous.get('shared') == shared else {}
+
+        cycles    = load_cycles()
+        config    = load_config()
+        templates = load_templates()
+        log       = _rev_read_json('log.json', {})
+        folders, fps, changed = {}, {}, []
+        for c in cycles:
+            folder = c.get('submissions_folder', '')
+            folders[c['id']] = [folder, _file_version(folder) if folder else None]
+            fps[c['id']] = _cycle_fingerprint(c, log.get(c['id'], {}), folders[c['id']][1])
+            if old_fps.get(c['id']) != fps[c['id']] or not all(
+                    os.path.exists(_snapshot_path(f'cycle/{c["id"]}.{fmt}')) for fmt in _SNAPSHOT_MIMETYPES):
+                changed.append(c)
+
+        _snapshot_write('dashboard', '/', lambda fmt: dashboard_page(cycles, fmt))
+        for c in changed:
+            _snapshot_write(f'cycle/{c["id"]}', f'/cycle/{c["id"]}',
+                            lambda fmt: cycle_detail_page(c, config, templates, log.get(c['id'], {}), fmt))
+
+        # 削除・改名された号のファイルを片付ける
+        cycle_dir = _snapshot_path('cycle')
+        if os.path.isdir(cycle_dir):
+            for fname in os.listdir(cycle_dir):
+                if os.path.splitext(fname)[0] not in fps:
+                    try:
+                        os.remove(os.path.join(cycle_dir, fname))
+                    except OSError:
+                        pass
+
+        _write_local_json(_snapshot_path('manifest.json'), {
+            'version':    version,
+            'shared':     shared,
+            'cycles':     fps,
+            'folders':    folders,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+        })
+    metric_observe('melmaga_snapshot_build_duration_seconds', time.perf_counter() - started)
+    metric_inc('melmaga_snapshot_pages_built_total', value=len(changed) + 1)
+
+def _snapshot_loop():
+    while True:
+        _snap_dirty.wait()
+        time.sleep(_SNAPSHOT_DEBOUNCE)
+        _snap_dirty.clear()
+        try:
+            snapshot_build()
+        except Exception:
+            app.logger.exception('snapshot build failed')
+
+def snapshot_mark_dirty():
+    """データが変わったことを知らせる（生成スレッドはプロセスごとに初回に起動する）。"""
+    global _snap_pid
+    if not _SNAPSHOTS_ENABLED:
+        return
+    _snap_dirty.set()
+    with _snap_start_lock:
+        if _snap_pid == os.getpid():
+            return
+        _snap_pid = os.getpid()
+    threading.Thread(target=_snapshot_loop, name='snapshots', daemon=True).start()
+
+def snapshot_fresh(name):
+    """name（'dashboard' / 'cycle/<id>'）のスナップショットが現在のデータと一致するか。"""
+    manifest = _snapshot_manifest()
+    if not manifest or manifest.get('version') != snapshot_data_version():
+        return False
+    if name.startswith('cycle/'):
+        folder, ver = manifest.get('folders', {}).get(name[len('cycle/'):], ['', None])
+        if folder and _file_version(folder) != ver:
+            return False
+    return True
+
+
+@app.before_request
+def _serve_snapshot():
+    # check_login の後に登録されているので、ここに来るのはログイン済みのセッションだけ
+    if not _SNAPSHOTS_ENABLED or request.method != 'GET' or current_role() != 'user':
+        return
+    if request.endpoint == 'dashboard':
+        name = 'dashboard'
+    elif request.endpoint == 'cycle_detail' and re.fullmatch(r'[\w-]+', request.view_args['cycle_id']):
+        name = f'cycle/{request.view_args["cycle_id"]}'
+    else:
+        return
+    fmt = request.args.get('format') or 'html'
+    if fmt not in _SNAPSHOT_MIMETYPES or set(request.args) - {'format'}:
+        return
+    if flask_session.get('_flashes'):
+        return   # 直前の操作のメッセージはその場で描画して表示する
+    if not snapshot_fresh(name):
+        metric_inc('melmaga_snapshot_responses_total', {'result': 'stale'})
+        snapshot_mark_dirty()
+        return
+    path = _snapshot_path(f'{name}.{fmt}')
+    if not os.path.exists(path):
+        metric_inc('melmaga_snapshot_responses_total', {'result': 'miss'})   # 存在しない号など
+        return
+    metric_inc('melmaga_snapshot_responses_total', {'result': 'hit'})
+    return send_file(path, mimetype=_SNAPSHOT_MIMETYPES[fmt], conditional=True, max_age=0)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,206 @@
+/*
+ * 原稿入力フォーム（form/melmaga.html）の入力遅延ベンチマーク。
+ *
+ *   node bench/bench_editor.js                          # 本文 1,000〜50,000 文字で 1 打鍵あたりの処理時間
+ *   node bench/bench_editor.js --compare old.html       # 別の版と同じ打鍵列で結果（本文・カーソル）を突き合わせる
+ *   node bench/bench_editor.js --file old.html          # 別の版を計測（例: git show HEAD~1:form/melmaga.html > old.html）
+ *
+ * ページのスクリプトを最小限の DOM の代役の上で動かし、本文の中ほどで文字入力・Enter・Backspace を
+ * 打ったときの keydown / input ハンドラの同期処理の時間を測る（描画・アイドル時の処理は含まない）。
+ */
+'use strict';
+const fs   = require('fs');
+const path = require('path');
+const vm   = require('vm');
+const { performance } = require('perf_hooks');
+
+const ROOT = path.dirname(__dirname);
+
+function parseArgs(argv) {
+  const args = { file: path.join(ROOT, 'form', 'melmaga.html'), compare: null,
+                 sizes: [1000, 5000, 20000, 50000], keys: 400 };
+  for (let i = 0; i < argv.length; i++) {
+    if (argv[i] === '--file')    args.file = argv[++i];
+    else if (argv[i] === '--compare') args.compare = argv[++i];
+    else if (argv[i] === '--keys')    args.keys = parseInt(argv[++i], 10);
+    else if (argv[i] === '--sizes') {
+      args.sizes = [];
+      while (i + 1 < argv.length && /^\d+$/.test(argv[i + 1])) args.sizes.push(parseInt(argv[++i], 10));
+    }
+  }
+  return args;
+}
+
+// ── DOM の代役（ページのスクリプトが使う範囲だけ） ──
+class FakeElement {
+  constructor(id) {
+    this.id = id;
+    this.value = '';
+    this.textContent = '';
+    this.innerHTML = '';
+    this.checked = false;
+    this.style = {};
+    this.classList = { toggle() {}, add() {}, remove() {} };
+    this.selectionStart = 0;
+    this.selectionEnd = 0;
+    this.handlers = {};
+  }
+  addEventListener(type, fn) { (this.handlers[type] = this.handlers[type] || []).push(fn); }
+  dispatchEvent(ev) {
+    for (const fn of this.handlers[ev.type] || []) fn.call(this, ev);
+    return !ev.defaultPrevented;
+  }
+  setSelectionRange(a, b) { this.selectionStart = a; this.selectionEnd = b; }
+  setRangeText(text, start, end) {
+    const { selectionStart: s, selectionEnd: e } = this;
+    this.value = this.value.slice(0, start) + text + this.value.slice(end);
+    // 既定の selectMode（preserve）と同じく、置き換え範囲より後ろの選択位置はずらす
+    const d = text.length - (end - start);
+    this.selectionStart = s > end ? s + d : Math.min(s, start + text.length);
+    this.selectionEnd   = e > end ? e + d : Math.min(e, start + text.length);
+  }
+  setAttribute() {}
+  focus() {}
+  scrollIntoView() {}
+  closest() { return null; }
+  querySelector() { return null; }
+}
+
+class FakeEvent {
+  constructor(type, init = {}) { Object.assign(this, init); this.type = type; this.defaultPrevented = false; }
+  preventDefault() { this.defaultPrevented = true; }
+}
+
+function loadPage(file) {
+  const html   = fs.readFileSync(file, 'utf8');
+  const blocks = [...html.matchAll(/<script>([\s\S]*?)<\/script>/g)].map(m => m[1]);
+  const script = blocks[blocks.length - 1];
+
+  const elements = {};
+  const timers   = [];
+  const document = {
+    getElementById: id => elements[id] || (elements[id] = new FakeElement(id)),
+    addEventListener() {},
+    createElement: () => new FakeElement(''),
+    body: { appendChild() {}, removeChild() {} },
+  };
+  const later = fn => { timers.push(fn); return timers.length; };
+  const ctx = {
+    document, console, Event: FakeEvent,
+    navigator: { platform: 'Win32' },
+    sessionStorage: { getItem() { return null; }, setItem() {} },
+    setTimeout: later, clearTimeout() {},
+    requestAnimationFrame: later,
+    TextEncoder, crypto: {},
+  };
+  ctx.window = ctx;
+  vm.createContext(ctx);
+  vm.runInContext(script, ctx, { filename: file });
+  const el = document.getElementById('content');
+  // 溜まった描画前・アイドル時の処理を実行する（計測には含めない）
+  const flush = () => { while (timers.length) timers.shift()(); };
+  return { el, flush };
+}
+
+// ── 打鍵 ──
+// 1 打鍵を再現し、ページのハンドラにかかった時間（ms、ブラウザ側の文字挿入の再現は除く）を返す
+function press(page, key) {
+  const el = page.el;
+  const ev = new FakeEvent('keydown', { key, ctrlKey: false, metaKey: false, shiftKey: false });
+  let t = performance.now();
+  el.dispatchEvent(ev);
+  let spent = performance.now() - t;
+  if (ev.defaultPrevented) return spent;
+  const c = el.selectionStart, e = el.selectionEnd;
+  if (key === 'Backspace') {
+    if (c === 0) return spent;
+    el.value = el.value.slice(0, c - 1) + el.value.slice(e);
+    el.setSelectionRange(c - 1, c - 1);
+  } else {
+    el.value = el.value.slice(0, c) + key + el.value.slice(e);
+    el.setSelectionRange(c + key.length, c + key.length);
+  }
+  t = performance.now();
+  el.dispatchEvent(new FakeEvent('input'));
+  return spent + performance.now() - t;
+}
+
+function makeArticle(n, seed) {
+  const words = ['中小企業診断士', 'の皆様', '本年度', 'も', '研修会', 'を開催', 'いたします', '。',
+                 '詳細は', 'ホームページ', 'をご覧ください', '、', 'セミナー', '参加費は', '無料', 'です'];
+  let x = seed, text = '　', para = 0;
+  while (text.length < n) {
+    x = (x * 1103515245 + 12345) % 2147483648;
+    text += words[x % words.length];
+    if (++para % 25 === 0) text += '\n　';
+    if (para % 120 === 0) text += '\n詳しくは https://example.com/seminar をご覧ください。\n　';
+  }
+  return text;
+}
+
+function keySequence(n) {
+  const keys = [];
+  const chars = 'あいうえおかきくけこ研修会を開催します';
+  for (let i = 0; i < n; i++) {
+    if (i % 60 === 59) keys.push('Enter');
+    else if (i % 17 === 16) keys.push('Backspace');
+    else keys.push(chars[i % chars.length]);
+  }
+  return keys;
+}
+
+function setup(page, text) {
+  page.el.value = text;
+  page.el.setSelectionRange(0, 0);
+  page.el.dispatchEvent(new FakeEvent('input'));   // 読み込み直後の全体整形
+  const mid = Math.floor(page.el.value.length / 2);
+  page.el.setSelectionRange(mid, mid);
+  page.flush();
+}
+
+function percentile(sorted, p) {
+  return sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * p))];
+}
+
+function main() {
+  const args = parseArgs(process.argv.slice(2));
+  const keys = keySequence(args.keys);
+
+  if (args.compare) {
+    let mismatches = 0;
+    for (const n of args.sizes) {
+      const a = loadPage(args.file), b = loadPage(args.compare);
+      const text = makeArticle(n, n);
+      setup(a, text); setup(b, text);
+      keys.forEach((k, i) => {
+        press(a, k); press(b, k);
+        if (a.el.value !== b.el.value || a.el.selectionStart !== b.el.selectionStart) {
+          if (mismatches++ < 5) console.log(`NG size=${n} key#${i} (${k}): cursor ${a.el.selectionStart} / ${b.el.selectionStart}`);
+        }
+        a.flush(); b.flush();
+      });
+      console.log(`size ${n}: ${keys.length} keys compared, final length ${a.el.value.length}`);
+    }
+    console.log(mismatches ? `${mismatches} mismatches` : 'identical');
+    process.exit(mismatches ? 1 : 0);
+  }
+
+  console.log(`${path.relative(ROOT, args.file)}  (${keys.length} keystrokes per size)`);
+  console.log(`${'chars'.padStart(7)} ${'median µs'.padStart(10)} ${'p95 µs'.padStart(10)} ${'max µs'.padStart(10)}`);
+  for (const n of args.sizes) {
+    const page = loadPage(args.file);
+    setup(page, makeArticle(n, n));
+    // ウォームアップ
+    keySequence(50).forEach(k => { press(page, k); page.flush(); });
+    const samples = [];
+    for (const k of keys) {
+      samples.push(press(page, k) * 1000);
+      page.flush();
+    }
+    samples.sort((x, y) => x - y);
+    console.log(`${String(n).padStart(7)} ${percentile(samples, 0.5).toFixed(1).padStart(10)}`
+              + ` ${percentile(samples, 0.95).toFixed(1).padStart(10)} ${samples[samples.length - 1].toFixed(1).padStart(10)}`);
+  }
+}
+
+main();
@@ -0,0 +1,170 @@
+"""
+データ・原稿パース・組版のホットパスのマイクロベンチマーク。
+
+    python bench/bench_hotpaths.py                  # 実行して bench/results/latest.json に保存
+    python bench/bench_hotpaths.py --save-baseline  # 結果を bench/baseline.json として保存
+    python bench/bench_hotpaths.py --scale 0.2      # データ量を縮小して素早く確認
+
+bench/baseline.json があれば比較し、中央値が --threshold（既定 20%）以上
+悪化したケースを表示して終了コード 1 を返す。
+"""
+import argparse, atexit, json, os, platform, shutil, statistics, sys, tempfile, time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR  = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+os.environ.pop('RENDER', None)   # GitHub 同期は行わない
+os.environ.pop('GITHUB_TOKEN', None)
+
+# app の data/ は import 前に一時ディレクトリへ向ける（設定ファイルだけは写しを置く）
+WORK_DIR = tempfile.mkdtemp(prefix='melmaga-bench-')
+for _fname in ('config.json', 'email_templates.json'):
+    _src = os.path.join(os.environ.get('DATA_DIR') or os.path.join(ROOT_DIR, 'data'), _fname)
+    if os.path.exists(_src):
+        shutil.copy(_src, WORK_DIR)
+os.environ['DATA_DIR'] = WORK_DIR
+atexit.register(shutil.rmtree, WORK_DIR, True)
+
+import app as A                 # noqa: E402
+import fixtures as F            # noqa: E402
+
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+RESULTS_DIR   = os.path.join(BENCH_DIR, 'results')
+
+
+def measure(fn, repeat, min_time=0.2):
+    """fn を repeat 回計測する（1 回が短い場合はループ回数を増やして平均する）。"""
+    fn()   # ウォームアップ
+    loops, elapsed = 1, 0.0
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time / repeat or loops >= 1 << 16:
+            break
+        loops *= 2
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - t0) / loops * 1000)
+    return {'median_ms': round(statistics.median(samples), 4),
+            'min_ms':    round(min(samples), 4),
+            'loops':     loops,
+            'repeat':    repeat}
+
+
+def build_cases(workdir, scale):
+    """(name, fn) のリストを返す。fixtures は workdir に生成する。"""
+    n_cycles = max(10, int(3000 * scale))
+    n_files  = max(10, int(300 * scale))
+    cases = []
+
+    # ── cycles.json ──
+    cycles = F.make_cycles(n_cycles)
+    A.save_cycles(cycles)
+    cases.append((f'load_cycles[{n_cycles}]', A.load_cycles))
+    cases.append((f'save_cycles[{n_cycles}]', lambda: A.save_cycles(cycles)))
+
+    # ── 提出フォルダ ──
+    folder = F.make_submission_folder(os.path.join(workdir, 'submissions'), n_files)
+    cycle = {**cycles[-1], 'submissions_folder': folder}
+    cases.append((f'scan_submissions[{n_files}]', lambda: A.scan_submissions(folder)))
+    cases.append((f'load_assemble_articles[{n_files}]', lambda: A.load_assemble_articles(cycle)))
+
+    # ── 原稿パース ──
+    article = F.make_article('広報部', paragraphs=40)
+    cases.append(('parse_article[40para]', lambda: A.parse_article(article)))
+
+    # ── Word 原稿（キャッシュなしの抽出） ──
+    blobs = [F.make_docx(F.make_article(d, paragraphs=10)) for d in A.DEPARTMENTS]
+    def extract_cold():
+        A._docx_cache.clear()
+        return A.extract_docx_batch(blobs)
+    cases.append((f'extract_docx_batch[{len(blobs)}]', extract_cold))
+
+    # ── XServer ZIP ──
+    for n in (max(5, n_files // 10), n_files):
+        zip_bytes = F.make_share_zip(n)
+        cases.append((f'parse_xserver_zip[{n}]',
+                      lambda z=zip_bytes: A.parse_xserver_zip(z)))
+
+    # ── テンプレート展開 ──
+    tmpl   = A.get_default_templates()['request_mail']['body']
+    config = A.load_config()
+    cases.append(('render_vars[request_mail]', lambda: A.render_vars(tmpl, cycle, config)))
+
+    # ── 組版 ──
+    client = A.app.test_client()
+    order = [{'dept': d, 'body': A.parse_article(F.make_article(d, paragraphs=8))[1]}
+             for d in A.DEPARTMENTS]
+    payload = {'order': order, 'header': {'day': '15'}}
+    url = f'/api/cycle/{cycle["id"]}/build-newsletter'
+    cases.append((f'build_newsletter_api[{len(order)}]',
+                  lambda: client.post(url, json=payload)))
+    return cases
+
+
+def compare(results, baseline, threshold):
+    """baseline と比べて悪化したケースを [(name, base, now, ratio)] で返す。"""
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get('results', {}).get(name)
+        if not b:
+            continue
+        ratio = r['median_ms'] / b['median_ms'] if b['median_ms'] else 1.0
+        r['vs_baseline'] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append((name, b['median_ms'], r['median_ms'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument('--scale', type=float, default=1.0, help='データ量の倍率')
+    ap.add_argument('--repeat', type=int, default=7)
+    ap.add_argument('--filter', default='', help='名前に含まれるケースのみ実行')
+    ap.add_argument('--threshold', type=float, default=0.2, help='悪化とみなす割合')
+    ap.add_argument('--save-baseline', action='store_true')
+    ap.add_argument('--output', default=os.path.join(RESULTS_DIR, 'latest.json'))
+    args = ap.parse_args(argv)
+
+    results = {}
+    for name, fn in build_cases(WORK_DIR, args.scale):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(fn, args.repeat)
+        print(f'{name:40s} {results[name]["median_ms"]:10.3f} ms'
+              f'  (min {results[name]["min_ms"]:.3f})')
+
+    report = {
+        'meta': {'timestamp': datetime.now().isoformat(timespec='seconds'),
+                 'python':    platform.python_version(),
+                 'platform':  platform.platform(),
+                 'scale':     args.scale},
+        'results': results,
+    }
+
+    regressions = []
+    if os.path.exists(BASELINE_FILE) and not args.save_baseline:
+        with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'baseline を保存しました: {BASELINE_FILE}')
+
+    for name, base, now, ratio in regressions:
+        print(f'REGRESSION {name}: {base:.3f} ms → {now:.3f} ms (x{ratio:.2f})')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
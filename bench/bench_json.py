@@ -0,0 +1,79 @@
+"""
+大きな cycles.json の読み書きを、シリアライズ方式ごとに比較するベンチマーク。
+
+    python bench/bench_json.py                   # 1,000 / 5,000 / 20,000 号で比較
+    python bench/bench_json.py --sizes 3000      # 件数を指定
+
+各方式について、エンコード（save 相当: ローカル書き込み＋GitHub 用の形式）と
+ファイルからの読み込み（load 相当）の時間、ファイルサイズを表示する。
+  stdlib-indent … 以前の save_json（indent=2 を 2 回エンコード）
+  stdlib        … 標準 json、ローカル compact・GitHub canonical を各 1 回
+  orjson        … orjson、同上（インストールされている場合）
+"""
+import argparse, json, os, shutil, sys, tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import app as A                        # noqa: E402
+import fixtures as F                   # noqa: E402
+from bench_hotpaths import measure     # noqa: E402
+
+
+def strategies():
+    """(名前, save 時のエンコード, ローカル形式のエンコード, 読み込み) のリスト"""
+    def old_save(d):
+        local  = json.dumps(d, ensure_ascii=False, indent=2).encode('utf-8')
+        remote = json.dumps(d, ensure_ascii=False, indent=2).encode('utf-8')
+        return local, remote
+
+    def stdlib_compact(d):
+        return json.dumps(d, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def stdlib_save(d):
+        return stdlib_compact(d), json.dumps(d, ensure_ascii=False, indent=2).encode('utf-8')
+
+    out = [
+        ('stdlib-indent', old_save,
+         lambda d: json.dumps(d, ensure_ascii=False, indent=2).encode('utf-8'), json.loads),
+        ('stdlib', stdlib_save, stdlib_compact, json.loads),
+    ]
+    if A.orjson is not None:
+        out.append(('orjson',
+                    lambda d: (A.json_dumps_compact(d), A.json_dumps_canonical(d)),
+                    A.json_dumps_compact, A.orjson.loads))
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+    ap.add_argument('--repeat', type=int, default=5)
+    args = ap.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='melmaga-bench-json-')
+    try:
+        print(f'{"cycles":>7s} {"method":14s} {"save ms":>9s} {"load ms":>9s} {"file KB":>9s}')
+        for n in args.sizes:
+            cycles = F.make_cycles(n)
+            for name, save, dump_local, loads in strategies():
+                path = os.path.join(workdir, f'{name}-{n}.json')
+                with open(path, 'wb') as f:
+                    f.write(dump_local(cycles))
+
+                def load():
+                    with open(path, 'rb') as f:
+                        return loads(f.read())
+
+                assert load() == cycles
+                s = measure(lambda: save(cycles), args.repeat, min_time=0.5)
+                l = measure(load, args.repeat, min_time=0.5)
+                print(f'{n:7d} {name:14s} {s["median_ms"]:9.2f} {l["median_ms"]:9.2f}'
+                      f' {os.path.getsize(path) / 1024:9.0f}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
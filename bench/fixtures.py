@@ -0,0 +1,123 @@
+"""
+ベンチマーク用の合成データ生成。
+
+- cycles.json（大量の号）
+- 原稿提出フォルダ（.txt を UTF-8 / Shift-JIS 混在、.docx 混在）
+- XServer の一括ダウンロード ZIP
+"""
+import io, os, random, zipfile
+from datetime import datetime, timedelta
+
+import app as A
+
+_SAMPLE = (
+    '板診会では今期も会員の皆さまの活動を支援するため、各種セミナーや'
+    '勉強会を企画しています。中小企業の経営課題に寄り添い、実務に役立つ'
+    '情報を発信してまいります。詳細は https://rmc-itabashi.jp/ をご覧ください。'
+    'ご質問は担当までお気軽にお問い合わせください。'
+)
+
+
+def wrap20(text, width=20):
+    """melmaga.html と同じく 1 行 20 文字で折り返す（段落頭は全角スペース）。"""
+    lines = []
+    for para in text.split('\n'):
+        para = '　' + para.lstrip('　')
+        lines += [para[i:i + width] for i in range(0, len(para), width)] or ['']
+    return '\n'.join(lines)
+
+
+def make_article(dept, paragraphs=6, rnd=None):
+    rnd = rnd or random.Random(0)
+    paras = []
+    for _ in range(paragraphs):
+        start = rnd.randrange(len(_SAMPLE) // 2)
+        paras.append(_SAMPLE[start:] + _SAMPLE[:start])
+    return f'【{dept}】\n\n' + wrap20('\n'.join(paras))
+
+
+def make_docx(text):
+    """最小構成の .docx（word/document.xml のみ）を bytes で返す。"""
+    ns = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+    paras = ''.join(
+        f'<w:p><w:r><w:t xml:space="preserve">{line}</w:t></w:r></w:p>'
+        for line in text.replace('&', '&amp;').replace('<', '&lt;').split('\n')
+    )
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml',
+                    '<?xml version="1.0" encoding="UTF-8"?>'
+                    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                    '<Override PartName="/word/document.xml" ContentType="application/'
+                    'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                    '</Types>')
+        zf.writestr('word/document.xml',
+                    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    f'<w:document xmlns:w="{ns}"><w:body>{paras}</w:body></w:document>')
+    return buf.getvalue()
+
+
+def make_cycles(n):
+    """n 件の号データ（古い号ほど全ステップ完了）を返す。"""
+    cycles = []
+    base_year = 2026 - n // 6
+    for i in range(n):
+        year, month = base_year + i // 6, (i % 6) * 2 + 1
+        done = i < n - 2
+        cycles.append({
+            'id':             f'{year}-{month:02d}',
+            'vol':            i + 1,
+            'delivery_year':  year,
+            'delivery_month': month,
+            'schedule':       A.calc_schedule(year, month),
+            'steps':          {s['key']: {'completed': done,
+                                          'completed_at': '2026-01-01T00:00:00' if done else None}
+                               for s in A.STEPS},
+            'submissions_folder': f'/tmp/submissions/{year}-{month:02d}',
+            'xserver_url':    'https://drive.example.jp/index.php/s/TOKEN',
+            'notes':          'メモ' * 40,
+            'created_at':     datetime(2026, 1, 1).isoformat(),
+        })
+    return cycles
+
+
+def _file_entries(n, rnd):
+    """(filename, bytes, mtime) を n 件返す。1/4 は .docx、.txt の 1/3 は Shift-JIS。"""
+    depts = A.DEPARTMENTS
+    t0 = datetime(2026, 3, 1, 9, 0, 0)
+    for i in range(n):
+        dept = depts[i % len(depts)]
+        text = make_article(dept, paragraphs=rnd.randint(3, 10), rnd=rnd)
+        ts = t0 + timedelta(minutes=i)
+        if i % 4 == 3:
+            yield f'メルマガいたしん原稿用テンプレート_{i}_（{dept}）.docx', make_docx(text), ts
+        else:
+            enc = 'shift-jis' if i % 3 == 0 else 'utf-8'
+            yield f'{ts:%Y%m%d_%H%M%S}_{dept}.txt', text.encode(enc, errors='replace'), ts
+
+
+def make_submission_folder(path, n, seed=0):
+    """原稿提出フォルダを path に n ファイル分作る。"""
+    os.makedirs(path, exist_ok=True)
+    for name, data, ts in _file_entries(n, random.Random(seed)):
+        fpath = os.path.join(path, name)
+        with open(fpath, 'wb') as f:
+            f.write(data)
+        os.utime(fpath, (ts.timestamp(), ts.timestamp()))
+    return path
+
+
+def make_share_files(n, seed=0):
+    """XServer の「原稿提出」フォルダ相当の {パス: bytes} を返す。"""
+    return {f'原稿提出/{name}': data
+            for name, data, _ in _file_entries(n, random.Random(seed))}
+
+
+def make_share_zip(n, seed=0):
+    """XServer（Nextcloud）のフォルダ一括ダウンロード相当の ZIP を返す。"""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('原稿提出/', b'')
+        for path, data in make_share_files(n, seed).items():
+            zf.writestr(path, data)
+    return buf.getvalue()
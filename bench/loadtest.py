@@ -0,0 +1,199 @@
+"""
+締切日のアクセスを想定した負荷試験。
+
+XServer / GitHub のスタンドイン（bench/standins.py）を起動し、アプリを
+render.yaml と同じワーカー数の gunicorn で DATA_DIR を空の一時ディレクトリにして
+起動する（= Render の再起動直後と同じく GitHub からデータを復元する状態）。
+
+    python bench/loadtest.py --duration 30 --concurrency 16
+    python bench/loadtest.py --gh-latency 0.3 --gh-conflict-rate 0.05 --json out.json
+"""
+import argparse, json, os, random, re, shutil, socket, statistics, subprocess, sys
+import tempfile, threading, time
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR  = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import fixtures                                        # noqa: E402
+from standins import GitHubStandin, NextcloudStandin   # noqa: E402
+
+# 締切日のアクセス配分: (重み, 名前, メソッド, パス, 本文)
+# {cid} は対象号の ID、{share} は Nextcloud スタンドインの共有URL に置き換える。
+DEADLINE_DAY_MIX = [
+    (40, 'dashboard',    'GET',  '/',                                None),
+    (25, 'cycle_detail', 'GET',  '/cycle/{cid}',                     None),
+    (8,  'email',        'GET',  '/cycle/{cid}/email/deadline',      None),
+    (7,  'assemble',     'GET',  '/cycle/{cid}/assemble',            None),
+    (10, 'xserver_list', 'POST', '/api/cycle/{cid}/xserver-list',
+     {'url': '{share}', 'password': '{password}'}),
+    (10, 'toggle_step',  'POST', '/cycle/{cid}/step/submissions/toggle', None),
+]
+
+
+def render_workers():
+    """render.yaml の startCommand から --workers / --timeout を読み取る。"""
+    workers, timeout = 2, 120
+    try:
+        with open(os.path.join(ROOT_DIR, 'render.yaml'), 'r', encoding='utf-8') as f:
+            text = f.read()
+        m = re.search(r'--workers\s+(\d+)', text)
+        workers = int(m.group(1)) if m else workers
+        m = re.search(r'--timeout\s+(\d+)', text)
+        timeout = int(m.group(1)) if m else timeout
+    except OSError:
+        pass
+    return workers, timeout
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def start_app(port, workers, timeout, env):
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py',
+           '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+           '--timeout', str(timeout), '--log-level', 'warning']
+    proc = subprocess.Popen(cmd, cwd=ROOT_DIR, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError('gunicorn が起動しませんでした')
+
+
+def worker_loop(base, mix, subst, stop_at, samples, lock, seed):
+    rnd = random.Random(seed)
+    session = requests.Session()
+    weights = [m[0] for m in mix]
+    while time.monotonic() < stop_at:
+        _, name, method, path, body = rnd.choices(mix, weights)[0]
+        url = base + path.format(**subst)
+        if body is not None:
+            body = {k: v.format(**subst) for k, v in body.items()}
+        t0 = time.perf_counter()
+        try:
+            r = session.request(method, url, json=body, timeout=120, allow_redirects=False)
+            status = r.status_code
+        except requests.RequestException:
+            status = 0
+        elapsed = time.perf_counter() - t0
+        with lock:
+            samples.append((name, elapsed, status))
+
+
+def summarize(samples, duration):
+    by_name = {}
+    for name, elapsed, status in samples:
+        by_name.setdefault(name, []).append((elapsed, status))
+    report = {'total': {}, 'routes': {}}
+
+    def stats(rows):
+        lat = [e * 1000 for e, _ in rows]
+        return {'requests':   len(rows),
+                'errors':     sum(1 for _, s in rows if s == 0 or s >= 500),
+                'throughput': round(len(rows) / duration, 2),
+                'p50_ms':     round(percentile(lat, 50), 1),
+                'p95_ms':     round(percentile(lat, 95), 1),
+                'p99_ms':     round(percentile(lat, 99), 1),
+                'mean_ms':    round(statistics.fmean(lat), 1) if lat else 0.0}
+
+    report['total'] = stats([(e, s) for _, e, s in samples])
+    for name, rows in sorted(by_name.items()):
+        report['routes'][name] = stats(rows)
+    return report
+
+
+def main(argv=None):
+    workers, timeout = render_workers()
+    ap = argparse.ArgumentParser(description='締切日トラフィックの負荷試験')
+    ap.add_argument('--duration', type=float, default=20.0, help='計測秒数')
+    ap.add_argument('--concurrency', type=int, default=8, help='同時クライアント数')
+    ap.add_argument('--workers', type=int, default=workers, help='gunicorn ワーカー数')
+    ap.add_argument('--cycles', type=int, default=60, help='cycles.json の号数')
+    ap.add_argument('--files', type=int, default=40, help='共有フォルダの原稿数')
+    ap.add_argument('--password', default='pw')
+    ap.add_argument('--gh-latency', type=float, default=0.15, help='GitHub API の遅延（秒）')
+    ap.add_argument('--gh-conflict-rate', type=float, default=0.0)
+    ap.add_argument('--gh-rate-limit', type=int, default=0, help='1 分あたりの上限（0 で無制限）')
+    ap.add_argument('--nc-latency', type=float, default=0.05, help='XServer の遅延（秒）')
+    ap.add_argument('--json', help='結果を JSON で保存するパス')
+    args = ap.parse_args(argv)
+
+    cycles = fixtures.make_cycles(args.cycles)
+    target = cycles[-1]
+    gh = GitHubStandin(files={'data/cycles.json': cycles},
+                       latency=args.gh_latency, conflict_rate=args.gh_conflict_rate,
+                       rate_limit=args.gh_rate_limit).start()
+    nc = NextcloudStandin(fixtures.make_share_files(args.files),
+                          password=args.password, latency=args.nc_latency).start()
+
+    data_dir = tempfile.mkdtemp(prefix='melmaga-load-')
+    port = free_port()
+    env = {**os.environ,
+           'RENDER': 'true', 'GITHUB_TOKEN': 'standin', 'GITHUB_API_URL': gh.url,
+           'DATA_DIR': data_dir, 'SECRET_KEY': 'loadtest'}
+    for k in ('ADMIN_PASSWORD', 'APP_PASSWORD', 'USER_PASSWORD', 'ACCESS_KEY'):
+        env.pop(k, None)
+
+    proc = start_app(port, args.workers, timeout, env)
+    samples, lock = [], threading.Lock()
+    subst = {'cid': target['id'], 'share': nc.share_url, 'password': args.password}
+    print(f'gunicorn workers={args.workers} concurrency={args.concurrency} '
+          f'duration={args.duration}s target={target["id"]}')
+    try:
+        started = time.monotonic()
+        stop_at = started + args.duration
+        threads = [threading.Thread(target=worker_loop,
+                                    args=(f'http://127.0.0.1:{port}', DEADLINE_DAY_MIX,
+                                          subst, stop_at, samples, lock, i))
+                   for i in range(args.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        gh.stop()
+        nc.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = summarize(samples, elapsed)
+    report['github_standin']  = gh.stats
+    report['xserver_standin'] = nc.stats
+    report['config'] = vars(args)
+
+    t = report['total']
+    print(f'\n{"route":14s} {"req":>6s} {"err":>5s} {"req/s":>7s} {"p50":>8s} {"p95":>8s} {"p99":>8s}')
+    for name, r in list(report['routes'].items()) + [('TOTAL', t)]:
+        print(f'{name:14s} {r["requests"]:6d} {r["errors"]:5d} {r["throughput"]:7.2f} '
+              f'{r["p50_ms"]:7.1f}ms {r["p95_ms"]:7.1f}ms {r["p99_ms"]:7.1f}ms')
+    print(f'\nGitHub stand-in:  {gh.stats}')
+    print(f'XServer stand-in: {nc.stats}')
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
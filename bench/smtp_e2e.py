@@ -0,0 +1,103 @@
+"""
+SMTP 一斉送信のエンドツーエンド確認。
+
+SMTP のスタンドイン（bench/standins.py）を起動し、アプリの送信キューから
+宛先ごとに送って、宛先別の結果・再送・接続の使い回し・送信レートを確かめる。
+
+    python bench/smtp_e2e.py --recipients 40 --rate 20 --transient-rate 0.1
+"""
+import argparse, os, shutil, sys, tempfile, time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR  = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from standins import SmtpStandin   # noqa: E402
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument('--recipients', type=int, default=40)
+    ap.add_argument('--rejects', type=int, default=2, help='550 で拒否される宛先の数')
+    ap.add_argument('--rate', type=float, default=20.0, help='SMTP_RATE（通/秒）')
+    ap.add_argument('--burst', type=int, default=5)
+    ap.add_argument('--pool', type=int, default=2, help='SMTP_POOL_SIZE')
+    ap.add_argument('--transient-rate', type=float, default=0.1)
+    ap.add_argument('--drop-rate', type=float, default=0.02)
+    ap.add_argument('--timeout', type=float, default=60.0)
+    args = ap.parse_args(argv)
+
+    rejected = [f'gone{i}@example.com' for i in range(args.rejects)]
+    smtp = SmtpStandin(reject=rejected, transient_rate=args.transient_rate,
+                       drop_rate=args.drop_rate).start()
+    workdir = tempfile.mkdtemp(prefix='melmaga-smtp-')
+    shutil.copytree(os.path.join(ROOT_DIR, 'data'), workdir, dirs_exist_ok=True)
+    os.environ.update({
+        'DATA_DIR':         workdir,
+        'SMTP_HOST':        '127.0.0.1',
+        'SMTP_PORT':        str(smtp.port),
+        'SMTP_SECURITY':    'none',
+        'SMTP_RATE':        str(args.rate),
+        'SMTP_BURST':       str(args.burst),
+        'SMTP_POOL_SIZE':   str(args.pool),
+        'SMTP_RETRY_DELAY': '0.2',
+        'SCHEDULER_ENABLED': '0',
+    })
+    os.environ.pop('GITHUB_TOKEN', None)
+    import app as A
+
+    try:
+        cycle_id = A.load_cycles()[-1]['id']
+        addrs = [f'member{i}@example.com' for i in range(args.recipients)] + rejected
+        client = A.app.test_client()
+        started = time.perf_counter()
+        r = client.post(f'/cycle/{cycle_id}/email/deadline/send',
+                        data={'recipients': '\n'.join(addrs)})
+        assert r.status_code == 302, r.status_code
+
+        url = f'/api/cycle/{cycle_id}/email/deadline/deliveries'
+        while True:
+            d = client.get(url).get_json()
+            if not d['counts'].get('queued') and not d['counts'].get('retrying'):
+                break
+            if time.perf_counter() - started > args.timeout:
+                print('timeout:', d['counts'])
+                return 1
+            time.sleep(0.1)
+        elapsed = time.perf_counter() - started
+
+        # 号データに保存された結果
+        cycle = next(c for c in A.load_cycles() if c['id'] == cycle_id)
+        recs  = cycle['deliveries']['deadline']['recipients']
+        delivered = {}
+        for _, rcpts, _ in smtp.messages:
+            for a in rcpts:
+                delivered[a] = delivered.get(a, 0) + 1
+
+        errors = []
+        for a in addrs:
+            want = 'failed' if a in rejected else 'sent'
+            if recs.get(a, {}).get('status') != want:
+                errors.append(f'{a}: {recs.get(a)}')
+            if want == 'sent' and delivered.get(a, 0) < 1:
+                errors.append(f'{a}: not delivered')
+        dup = {a: n for a, n in delivered.items() if n > 1}
+
+        sent = sum(1 for r in recs.values() if r['status'] == 'sent')
+        print(f'sent {sent} / failed {len(recs) - sent} in {elapsed:.2f}s '
+              f'({sent / elapsed:.1f} msg/s, limit {args.rate}/s burst {args.burst})')
+        print(f'smtp stand-in: {smtp.stats}')
+        print(f'retries: {sum(r["attempts"] - 1 for r in recs.values())}, '
+              f'duplicates after dropped connections: {len(dup)}')
+        if sent / elapsed > args.rate * 1.2 + args.burst / elapsed:
+            errors.append('rate limit exceeded')
+        for e in errors:
+            print('NG', e)
+        return 1 if errors else 0
+    finally:
+        smtp.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,481 @@
+"""
+ローカルで動く XServer（Nextcloud 公開共有）・GitHub Contents API・SMTP の代役サーバー。
+
+    python bench/standins.py nextcloud --port 8081 --files 120 --password pw
+    python bench/standins.py github    --port 8082 --latency 0.2 --conflict-rate 0.1
+    python bench/standins.py smtp      --port 8025 --transient-rate 0.1
+
+アプリ側は GITHUB_API_URL=http://127.0.0.1:8082 を指定し、共有URLに
+http://127.0.0.1:8081/index.php/s/TOKEN を入力すれば実サーバーなしで動作確認できる。
+SMTP は SMTP_HOST=127.0.0.1 SMTP_PORT=8025 SMTP_SECURITY=none を指定する。
+"""
+import argparse, base64, hashlib, json, os, random, re, secrets, sys, threading, time
+import socketserver, urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads      = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):   # アクセスログは出さない
+        pass
+
+    def _send(self, status, body=b'', ctype='text/plain; charset=utf-8', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _body(self):
+        n = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(n) if n else b''
+
+
+class Standin:
+    """スレッドで起動・停止できるスタンドインサーバーの基底クラス。"""
+
+    handler = _Handler
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.latency = latency
+        self.stats   = {}
+        self._lock   = threading.Lock()
+        handler = type('H', (self.handler,), {'standin': self})
+        self.httpd  = _Server((host, port), handler)
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# ─── Nextcloud 公開共有 ──────────────────────────────────────────────────────
+
+class _NextcloudHandler(_Handler):
+
+    def _authed(self, token):
+        nc = self.standin
+        if not nc.password:
+            return True
+        cookie = self.headers.get('Cookie', '')
+        m = re.search(r'nc_session=([0-9a-f]+)', cookie)
+        return bool(m and m.group(1) in nc.sessions)
+
+    def _share_page(self, token, with_form):
+        form = ''
+        if with_form:
+            form = (f'<form method="post" action="/index.php/s/{token}/authenticate/showShare">'
+                    f'<input type="hidden" name="requesttoken" value="{secrets.token_hex(16)}">'
+                    '<input type="password" name="password" id="password">'
+                    '</form>')
+        return f'<!DOCTYPE html><html><body><h1>原稿提出</h1>{form}</body></html>'
+
+    def do_GET(self):
+        nc = self.standin
+        nc.delay()
+        parsed = urllib.parse.urlparse(self.path)
+        path = parsed.path
+        m = re.match(r'^/index\.php/s/([^/]+)(/download)?$', path)
+        if m and m.group(1) == nc.token:
+            authed = self._authed(m.group(1))
+            if m.group(2):
+                nc.count('download')
+                if not authed:
+                    return self._send(200, self._share_page(nc.token, True), 'text/html')
+                sub = urllib.parse.parse_qs(parsed.query).get('path', [''])[0].strip('/')
+                return self._send(200, nc.zip_for(sub), 'application/zip', {
+                    'Content-Disposition': 'attachment; filename="download.zip"'})
+            nc.count('share_page')
+            return self._send(200, self._share_page(nc.token, not authed), 'text/html')
+
+        m = re.match(r'^/public\.php/webdav/(.+)$', path)
+        if m and self._webdav_authed():
+            nc.count('webdav_get')
+            name = urllib.parse.unquote(m.group(1))
+            data = nc.files.get(name)
+            if data is not None:
+                return self._send(200, data, 'application/octet-stream')
+        self._send(404, 'not found')
+
+    def do_POST(self):
+        nc = self.standin
+        nc.delay()
+        path = urllib.parse.urlparse(self.path).path
+        if path == f'/index.php/s/{nc.token}/authenticate/showShare':
+            nc.count('authenticate')
+            form = urllib.parse.parse_qs(self._body().decode('utf-8'))
+            if not form.get('requesttoken') or form.get('password', [''])[0] != nc.password:
+                return self._send(200, self._share_page(nc.token, True), 'text/html')
+            sid = secrets.token_hex(16)
+            nc.sessions.add(sid)
+            self.send_response(303)
+            self.send_header('Location', f'/index.php/s/{nc.token}')
+            self.send_header('Set-Cookie', f'nc_session={sid}; Path=/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._send(404, 'not found')
+
+    def _webdav_authed(self):
+        nc = self.standin
+        auth = self.headers.get('Authorization', '')
+        if not auth.startswith('Basic '):
+            return False
+        user, _, pw = base64.b64decode(auth[6:]).decode('utf-8').partition(':')
+        return user == nc.token and pw == nc.password
+
+    def do_PROPFIND(self):
+        nc = self.standin
+        nc.delay()
+        if not self._webdav_authed():
+            return self._send(401, 'unauthorized', headers={'WWW-Authenticate': 'Basic realm="share"'})
+        nc.count('propfind')
+        items = ''.join(
+            '<d:response>'
+            f'<d:href>/public.php/webdav/{escape(urllib.parse.quote(name))}</d:href>'
+            '<d:propstat><d:prop>'
+            f'<d:getcontentlength>{len(data)}</d:getcontentlength>'
+            f'<d:getetag>"{hashlib.md5(data).hexdigest()}"</d:getetag>'
+            '</d:prop><d:status>HTTP/1.1 200 OK</d:status></d:propstat>'
+            '</d:response>'
+            for name, data in sorted(nc.files.items())
+        )
+        body = ('<?xml version="1.0"?><d:multistatus xmlns:d="DAV:">'
+                '<d:response><d:href>/public.php/webdav/</d:href></d:response>'
+                f'{items}</d:multistatus>')
+        self._send(207, body, 'application/xml; charset=utf-8')
+
+
+class NextcloudStandin(Standin):
+    """
+    Nextcloud 公開共有リンクの代役。
+    共有ページ（requesttoken フォーム）→ authenticate/showShare → download（ZIP）と、
+    public.php/webdav の PROPFIND / GET に対応する。
+    """
+
+    handler = _NextcloudHandler
+
+    def __init__(self, files, token='TESTSHARE', password='', **kw):
+        super().__init__(**kw)
+        self.token    = token
+        self.password = password
+        self.sessions = set()
+        self.set_files(files)
+
+    def set_files(self, files):
+        """files: {'原稿提出/xxx.txt': bytes}。ZIP を作り直す。"""
+        import io, zipfile
+        self.files = dict(files)
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, data in sorted(self.files.items()):
+                zf.writestr(name, data)
+        self.zip_bytes = buf.getvalue()
+
+    def zip_for(self, sub):
+        """?path= で指定されたサブフォルダだけの ZIP（指定なしなら全体）"""
+        if not sub:
+            return self.zip_bytes
+        import io, zipfile
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, data in sorted(self.files.items()):
+                if name.startswith(sub + '/'):
+                    zf.writestr(name[len(sub) + 1:], data)
+        return buf.getvalue()
+
+    @property
+    def share_url(self):
+        return f'{self.url}/index.php/s/{self.token}'
+
+
+# ─── GitHub Contents API ─────────────────────────────────────────────────────
+
+def _blob_sha(data):
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+class _GitHubHandler(_Handler):
+
+    def _guard(self):
+        """レート制限と遅延を適用する。制限中なら True を返す（応答済み）。"""
+        gh = self.standin
+        gh.delay()
+        with gh._lock:
+            now = time.monotonic()
+            if now - gh.window_start >= gh.rate_window:
+                gh.window_start, gh.window_count = now, 0
+            gh.window_count += 1
+            remaining = gh.rate_limit - gh.window_count if gh.rate_limit else 5000
+        if gh.rate_limit and remaining < 0:
+            gh.count('rate_limited')
+            self._send(403, json.dumps({'message': 'API rate limit exceeded'}),
+                       'application/json', {'X-RateLimit-Remaining': '0'})
+            return True
+        return False
+
+    def _path(self):
+        parsed = urllib.parse.urlparse(self.path)
+        m = re.match(r'^/repos/([^/]+/[^/]+)/contents/(.+)$', parsed.path)
+        if not m:
+            return None
+        return urllib.parse.unquote(m.group(2)).strip('/')
+
+    def do_GET(self):
+        gh = self.standin
+        if self._guard():
+            return
+        path = self._path()
+        if path is None:
+            return self._send(404, json.dumps({'message': 'Not Found'}), 'application/json')
+        gh.count('get')
+        with gh._lock:
+            entry   = gh.files.get(path)
+            listing = [p for p in gh.files if p.startswith(path + '/')]
+        if entry is not None:
+            data, sha = entry
+            return self._send(200, json.dumps({
+                'type': 'file', 'path': path, 'sha': sha, 'size': len(data),
+                'encoding': 'base64', 'content': base64.encodebytes(data).decode('ascii'),
+            }), 'application/json')
+        if listing:
+            return self._send(200, json.dumps([
+                {'type': 'file', 'path': p, 'name': p.rsplit('/', 1)[-1],
+                 'sha': gh.files[p][1], 'size': len(gh.files[p][0])} for p in sorted(listing)
+            ]), 'application/json')
+        self._send(404, json.dumps({'message': 'Not Found'}), 'application/json')
+
+    def do_PUT(self):
+        gh = self.standin
+        if self._guard():
+            return
+        path = self._path()
+        body = json.loads(self._body() or b'{}')
+        if path is None or 'content' not in body:
+            return self._send(422, json.dumps({'message': 'Invalid request'}), 'application/json')
+        gh.count('put')
+        if gh.conflict_rate and random.random() < gh.conflict_rate:
+            gh.count('conflict_injected')
+            return self._send(409, json.dumps({'message': 'injected conflict'}), 'application/json')
+        data = base64.b64decode(body['content'])
+        with gh._lock:
+            current = gh.files.get(path)
+            if current and body.get('sha') != current[1]:
+                gh.stats['conflict'] = gh.stats.get('conflict', 0) + 1
+                status = 409 if body.get('sha') else 422
+                msg = 'sha does not match' if body.get('sha') else '"sha" wasn\'t supplied.'
+                return self._send(status, json.dumps({'message': msg}), 'application/json')
+            sha = _blob_sha(data)
+            gh.files[path] = (data, sha)
+        self._send(200 if current else 201, json.dumps({
+            'content': {'path': path, 'sha': sha},
+            'commit':  {'sha': secrets.token_hex(20), 'message': body.get('message', '')},
+        }), 'application/json')
+
+
+class GitHubStandin(Standin):
+    """
+    GitHub Contents API（GET/PUT /repos/{owner}/{repo}/contents/{path}）の代役。
+    SHA 不一致で 409、SHA なしの上書きで 422 を返す。
+    latency / conflict_rate / rate_limit（rate_window 秒あたりの上限）を注入できる。
+    """
+
+    handler = _GitHubHandler
+
+    def __init__(self, files=None, conflict_rate=0.0, rate_limit=0, rate_window=60.0, **kw):
+        super().__init__(**kw)
+        self.files         = {}
+        self.conflict_rate = conflict_rate
+        self.rate_limit    = rate_limit
+        self.rate_window   = rate_window
+        self.window_start  = time.monotonic()
+        self.window_count  = 0
+        for path, data in (files or {}).items():
+            self.put_file(path, data)
+
+    def put_file(self, path, data):
+        if not isinstance(data, bytes):
+            data = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        self.files[path] = (data, _blob_sha(data))
+
+
+# ─── SMTP ─────────────────────────────────────────────────────────────────────
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, *lines):
+        """複数行の応答は 250-xxx / 250 xxx の形にする。"""
+        out = [(f'{l[:3]}-{l[4:]}' if i < len(lines) - 1 else l) for i, l in enumerate(lines)]
+        self.wfile.write(''.join(l + '\r\n' for l in out).encode('utf-8'))
+
+    def handle(self):
+        st = self.standin
+        st.count('connections')
+        self.reply('220 standin ESMTP')
+        mail_from, rcpts = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd  = line.decode('utf-8', 'replace').rstrip('\r\n')
+            verb = cmd[:4].upper()
+            st.delay()
+            if verb == 'EHLO':
+                self.reply('250 standin', '250 8BITMIME', '250 SMTPUTF8', '250 SIZE 10485760')
+            elif verb == 'HELO':
+                self.reply('250 standin')
+            elif verb == 'MAIL':
+                mail_from, rcpts = _smtp_addr(cmd), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                addr = _smtp_addr(cmd)
+                code = st.rcpt_code(addr)
+                if code == 250:
+                    rcpts.append(addr)
+                self.reply(f'{code} {"OK" if code == 250 else "rejected"}')
+            elif verb == 'DATA':
+                if not rcpts:
+                    self.reply('554 no valid recipients')
+                    continue
+                self.reply('354 end with <CRLF>.<CRLF>')
+                data = []
+                while True:
+                    l = self.rfile.readline()
+                    if not l or l == b'.\r\n':
+                        break
+                    data.append(l[1:] if l.startswith(b'..') else l)
+                if st.drop_rate and random.random() < st.drop_rate:
+                    st.count('dropped')
+                    return   # 応答せずに切断
+                st.accept(mail_from, rcpts, b''.join(data))
+                self.reply('250 queued')
+                mail_from, rcpts = None, []
+            elif verb == 'RSET':
+                mail_from, rcpts = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 not implemented')
+
+
+def _smtp_addr(cmd):
+    m = re.search(r'<([^>]*)>', cmd)
+    return m.group(1) if m else cmd.split(':', 1)[-1].strip()
+
+
+class SmtpStandin(Standin):
+    """
+    SMTP サーバーの代役（EHLO/MAIL/RCPT/DATA/RSET/NOOP/QUIT のみ、認証・TLS なし）。
+    reject の宛先には 550、transient_rate の割合で RCPT に 451 を返し、
+    drop_rate の割合で DATA の後に応答せず切断する。受信したメールは messages に溜める。
+    """
+
+    handler = _SmtpHandler
+
+    def __init__(self, reject=(), transient_rate=0.0, drop_rate=0.0, **kw):
+        super().__init__(**kw)
+        self.reject         = {a.lower() for a in reject}
+        self.transient_rate = transient_rate
+        self.drop_rate      = drop_rate
+        self.messages       = []
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def rcpt_code(self, addr):
+        if addr.lower() in self.reject:
+            self.count('rejected')
+            return 550
+        if self.transient_rate and random.random() < self.transient_rate:
+            self.count('transient')
+            return 451
+        return 250
+
+    def accept(self, mail_from, rcpts, data):
+        with self._lock:
+            self.messages.append((mail_from, list(rcpts), data))
+        self.count('messages')
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='XServer / GitHub スタンドインサーバー')
+    sub = ap.add_subparsers(dest='kind', required=True)
+
+    nc = sub.add_parser('nextcloud')
+    nc.add_argument('--port', type=int, default=8081)
+    nc.add_argument('--files', type=int, default=60, help='合成原稿の件数')
+    nc.add_argument('--token', default='TESTSHARE')
+    nc.add_argument('--password', default='')
+    nc.add_argument('--latency', type=float, default=0.0)
+
+    gh = sub.add_parser('github')
+    gh.add_argument('--port', type=int, default=8082)
+    gh.add_argument('--latency', type=float, default=0.0)
+    gh.add_argument('--conflict-rate', type=float, default=0.0)
+    gh.add_argument('--rate-limit', type=int, default=0)
+    sm = sub.add_parser('smtp')
+    sm.add_argument('--port', type=int, default=8025)
+    sm.add_argument('--latency', type=float, default=0.0)
+    sm.add_argument('--transient-rate', type=float, default=0.0)
+    sm.add_argument('--drop-rate', type=float, default=0.0)
+    sm.add_argument('--reject', action='append', default=[], help='550 を返す宛先')
+    args = ap.parse_args(argv)
+
+    if args.kind == 'nextcloud':
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import fixtures
+        server = NextcloudStandin(fixtures.make_share_files(args.files),
+                                  token=args.token, password=args.password,
+                                  port=args.port, latency=args.latency)
+        print(f'Nextcloud stand-in: {server.share_url}')
+    elif args.kind == 'github':
+        server = GitHubStandin(port=args.port, latency=args.latency,
+                               conflict_rate=args.conflict_rate, rate_limit=args.rate_limit)
+        print(f'GitHub stand-in: GITHUB_API_URL={server.url}')
+    else:
+        server = SmtpStandin(port=args.port, latency=args.latency, reject=args.reject,
+                             transient_rate=args.transient_rate, drop_rate=args.drop_rate)
+        print(f'SMTP stand-in: SMTP_HOST=127.0.0.1 SMTP_PORT={server.port} SMTP_SECURITY=none')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+# gunicorn 設定（Render.com 用）
+# app を親プロセスで 1 度だけ読み込み（preload）、ワーカーを起動する前に
+# GitHub から data/ を並列取得しておく。再起動直後の最初のアクセスが
+# GitHub API の逐次呼び出しを待たずに済む。
+
+import time
+
+preload_app = True
+
+
+def when_ready(server):
+    from app import warm_data_cache, metrics_fold_dead
+    started = time.perf_counter()
+    warm_data_cache()
+    server.log.info('data cache warmed in %.2fs', time.perf_counter() - started)
+    # 前回の起動で強制終了したワーカーのメトリクスファイルを archived.json に畳み込む
+    metrics_fold_dead()
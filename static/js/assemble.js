@@ -0,0 +1,320 @@
+// 組版ツール（templates/assemble.html）
+// 号の ID は読み込み元の <script data-cycle-id> から受け取る。
+const CYCLE_ID = document.currentScript.dataset.cycleId;
+
+let _newsletterText = '';
+let _xsHost = '', _xsToken = '', _xsPw = '';
+
+// ── ドラッグ＆ドロップ初期化 ──
+const listEl = document.getElementById('article-list');
+if (listEl) {
+  Sortable.create(listEl, {
+    animation: 150,
+    handle: '.drag-handle',
+    ghostClass: 'sortable-ghost',
+    dragClass: 'sortable-drag',
+  });
+
+  // チェックボックスのON/OFFで記事を薄表示
+  listEl.addEventListener('change', e => {
+    if (!e.target.classList.contains('include-check')) return;
+    const item = e.target.closest('.article-item');
+    item.classList.toggle('excluded', !e.target.checked);
+  });
+}
+
+// ── XServer から取得 ────────────────────────────────────────────────────────
+async function fetchFromXServer() {
+  const url      = document.getElementById('xs-url').value.trim();
+  const pw       = document.getElementById('xs-pw').value;
+  const statusEl = document.getElementById('xs-status');
+  if (!url) { alert('URLを入力してください'); return; }
+
+  statusEl.style.display = 'block';
+  statusEl.innerHTML = '<div class="spinner-border spinner-border-sm me-2"></div>XServerに接続中...';
+
+  // URLをサーバーに保存（次回自動入力用）
+  fetch(`/api/cycle/${CYCLE_ID}/xserver-save-url`, {
+    method: 'POST', headers: {'Content-Type': 'application/json'},
+    body: JSON.stringify({ url }),
+  });
+
+  statusEl.innerHTML = '<span class="spinner-border spinner-border-sm me-2"></span>XServerからZIPをダウンロード中...（数秒かかります）';
+
+  // ZIP一括取得 → 一覧にある版（key と rev）からの差分（追加・変更・削除）だけが返る。本文は必要になったときに取得する
+  const known = {};
+  document.querySelectorAll('#article-list .article-item[data-key]').forEach(el => { known[el.dataset.key] = el.dataset.rev; });
+  let result;
+  try {
+    const res = await fetch(`/api/cycle/${CYCLE_ID}/xserver-list`, {
+      method: 'POST', headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({ url, password: pw, known, previews_only: true }),
+    });
+    result = await res.json();
+  } catch (e) {
+    statusEl.innerHTML = `<div class="alert alert-danger py-2 mb-0">通信エラー: ${e}</div>`;
+    return;
+  }
+
+  if (result.error) {
+    statusEl.innerHTML = `<div class="alert alert-danger py-2 mb-0"><i class="bi bi-exclamation-triangle me-1"></i>${result.error}</div>`;
+    return;
+  }
+
+  const shareNote = xsShareSummary(result.shares);
+  let msg;
+  if (result.full) {
+    result.articles.forEach(a => addXServerArticle(a));
+    msg = `<strong>${result.articles.length}件</strong>の原稿を読み込みました`;
+  } else {
+    result.added.forEach(a => addXServerArticle(a));
+    result.changed.forEach(a => updateXServerArticle(a));
+    result.removed.forEach(key => {
+      const el = document.querySelector(`#article-list .article-item[data-key="${CSS.escape(key)}"]`);
+      if (el) el.remove();
+    });
+    const n = result.added.length + result.changed.length + result.removed.length;
+    msg = n ? `追加 ${result.added.length}件・更新 ${result.changed.length}件・削除 ${result.removed.length}件`
+            : '前回から変更はありません';
+  }
+  updateArticleCount();
+
+  // 削除を反映してから、共有が空になったことを知らせる
+  if (result.count === 0) {
+    statusEl.innerHTML = `<div class="alert alert-warning py-2 mb-0">原稿ファイル（.txt / .docx）が見つかりませんでした。「原稿提出」フォルダに原稿が保存されているか確認してください。${shareNote}</div>`;
+    return;
+  }
+  const noMsg = document.getElementById('no-articles-msg');
+  if (noMsg) noMsg.style.display = 'none';
+
+  statusEl.innerHTML = `<div class="alert alert-success py-2 mb-0">
+    <i class="bi bi-check-circle me-1"></i>${msg}${shareNote}
+  </div>`;
+}
+
+// 共有が複数のときだけ、共有ごとの件数・所要時間・エラーを表示する
+function xsShareSummary(shares) {
+  if (!shares || shares.length < 2) return '';
+  const esc = t => String(t).replace(/[&<>"]/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'}[c]));
+  const rows = shares.map(r => r.error
+    ? `<li class="text-danger">${esc(r.label)}：${esc(r.error)}</li>`
+    : `<li>${esc(r.label)}：${r.count}件（${r.seconds.toFixed(1)}秒）</li>`);
+  return `<ul class="small mb-0 mt-1">${rows.join('')}</ul>`;
+}
+
+function addXServerArticle(a) {
+  const div = addArticleItemToList(a.filename, a.dept, a.body ?? null, a.preview, a.rev);
+  if (div) div.dataset.key = a.key;
+}
+
+function updateXServerArticle(a) {
+  const div = document.querySelector(`#article-list .article-item[data-key="${CSS.escape(a.key)}"]`);
+  if (!div) { addXServerArticle(a); return; }
+  div.dataset.dept = a.dept || a.filename;
+  div.dataset.rev  = a.rev;
+  if (a.body != null) div.dataset.body = a.body; else delete div.dataset.body;
+  div.querySelector('.article-dept').textContent = a.dept || a.filename;
+  div.querySelector('.article-prev').textContent = (a.preview || '').replace(/\n/g, ' ') + '…';
+  const details = div.querySelector('details');
+  details.querySelector('pre').textContent = a.body ?? '';
+  if (details.open) loadArticleBody(div);
+  div.classList.add('border-warning');
+}
+
+// 本文が未取得の記事は保存済みの版から取得する
+async function loadArticleBody(div) {
+  if (div.dataset.body !== undefined) return;
+  const res  = await fetch(`/api/cycle/${CYCLE_ID}/revisions/${div.dataset.rev}`);
+  const data = await res.json();
+  if (data.error) throw new Error(data.error);
+  div.dataset.body = data.body;
+  div.querySelector('pre').textContent = data.body;
+}
+
+function addArticleItemToList(filename, dept, body, preview, rev) {
+  if (document.querySelector('[data-id="' + filename + '"]')) return null;  // 重複スキップ
+
+  const div = document.createElement('div');
+  div.className   = 'article-item';
+  div.dataset.id   = filename;
+  div.dataset.dept = dept || filename;
+  if (body !== null) div.dataset.body = body;
+  if (rev) div.dataset.rev = rev;
+
+  const esc   = t => t.replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;');
+  const prev  = esc((preview || (body || '').substring(0, 80)).replace(/\n/g, ' '));
+  const bodyH = body !== null ? esc(body) : '';
+
+  div.innerHTML = `
+    <div class="d-flex align-items-start gap-2">
+      <div class="drag-handle" title="ドラッグで並び替え"><i class="bi bi-grip-vertical"></i></div>
+      <div class="flex-grow-1 min-w-0">
+        <div class="d-flex justify-content-between align-items-center">
+          <span class="fw-semibold small"><span class="article-dept">${esc(dept || filename)}</span>
+            <span class="badge bg-info text-dark ms-1" style="font-size:10px;">XServer</span>
+          </span>
+          <div class="form-check mb-0">
+            <input class="form-check-input include-check" type="checkbox" checked>
+          </div>
+        </div>
+        <div class="article-prev text-muted small text-truncate mt-1" style="font-size:11px;">${prev}…</div>
+      </div>
+    </div>
+    <details class="mt-1">
+      <summary class="text-muted" style="font-size:11px;cursor:pointer;">本文を確認する</summary>
+      <pre class="article-preview-text mt-1">${bodyH}</pre>
+    </details>`;
+
+  div.querySelector('.include-check').addEventListener('change', e => {
+    div.classList.toggle('excluded', !e.target.checked);
+  });
+  div.querySelector('details').addEventListener('toggle', e => {
+    if (e.target.open) loadArticleBody(div).catch(err => alert(err.message));
+  });
+  document.getElementById('article-list').appendChild(div);
+  return div;
+}
+
+// ── 保存済みの版を一覧に追加 ──
+async function addRevision(btn) {
+  const sel  = btn.parentElement.querySelector('.rev-select');
+  const hash = sel.value;
+  const opt  = sel.selectedOptions[0];
+  const res  = await fetch(`/api/cycle/${CYCLE_ID}/revisions/${hash}`);
+  const data = await res.json();
+  if (data.error) { alert(data.error); return; }
+  addArticleItemToList(`${opt.dataset.filename}@${hash.substring(0, 8)}`,
+                       sel.dataset.dept, data.body, null);
+  updateArticleCount();
+  const noMsg = document.getElementById('no-articles-msg');
+  if (noMsg) noMsg.style.display = 'none';
+}
+
+function updateArticleCount() {
+  const n = document.querySelectorAll('#article-list .article-item').length;
+  const b = document.getElementById('article-count');
+  if (b) b.textContent = n + '件';
+}
+
+// ── 組版実行 ──
+async function buildNewsletter() {
+  const items = document.querySelectorAll('#article-list .article-item');
+  const order = [];
+
+  // 本文を未取得の記事（XServer から一覧だけ取得したもの）を先に読み込む
+  try {
+    await Promise.all([...items]
+      .filter(item => item.querySelector('.include-check')?.checked)
+      .map(item => loadArticleBody(item)));
+  } catch (e) {
+    alert('本文の取得に失敗しました: ' + e.message);
+    return;
+  }
+
+  items.forEach(item => {
+    const chk = item.querySelector('.include-check');
+    if (!chk || !chk.checked) return;  // 除外チェックされているものはスキップ
+
+    order.push({
+      id:   item.dataset.id,
+      dept: item.dataset.dept,
+      body: item.dataset.body,
+    });
+  });
+
+  if (order.length === 0) {
+    alert('掲載する記事が選択されていません。チェックボックスをONにしてください。');
+    return;
+  }
+
+  const header = {
+    vol:            document.getElementById('hdr-vol').value,
+    year:           document.getElementById('hdr-year').value,
+    month:          document.getElementById('hdr-month').value,
+    day:            document.getElementById('hdr-day').value,
+    intro_fallback: document.getElementById('hdr-intro').value,
+  };
+
+  const btn = document.querySelector('button[onclick="buildNewsletter()"]');
+  btn.disabled = true;
+  btn.innerHTML = '<span class="spinner-border spinner-border-sm me-1"></span>組版中...';
+
+  try {
+    const res = await fetch(`/api/cycle/${CYCLE_ID}/build-newsletter`, {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({ order, header }),
+    });
+    const data = await res.json();
+
+    _newsletterText = data.text;
+    document.getElementById('preview-placeholder').style.display = 'none';
+    document.getElementById('preview-area').style.display = 'flex';
+    document.getElementById('preview-text').textContent = _newsletterText;
+    document.getElementById('export-btns').style.display = 'flex';
+    const archiveBtn = document.getElementById('archive-btn');
+    if (archiveBtn) {
+      archiveBtn.disabled = false;
+      archiveBtn.innerHTML = '<i class="bi bi-archive me-1"></i>確定してアーカイブ';
+    }
+
+    // スクロールをプレビュートップへ
+    document.getElementById('preview-text').scrollTop = 0;
+
+  } catch (err) {
+    alert('エラーが発生しました: ' + err);
+  } finally {
+    btn.disabled = false;
+    btn.innerHTML = '<i class="bi bi-play-fill me-1"></i>組版を実行';
+  }
+}
+
+// ── コピー ──
+function copyNewsletter() {
+  if (!_newsletterText) return;
+  navigator.clipboard.writeText(_newsletterText).then(() => {
+    const toast = document.getElementById('copy-toast');
+    toast.style.display = 'block';
+    setTimeout(() => { toast.style.display = 'none'; }, 2500);
+  });
+}
+
+// ── 確定版のアーカイブ（過去号の検索に登録） ──
+async function archiveNewsletter() {
+  if (!_newsletterText) return;
+  if (!confirm('この組版結果を確定版としてアーカイブに登録しますか？\n（同じ号の登録済みの内容は置き換えられます）')) return;
+  const btn = document.getElementById('archive-btn');
+  btn.disabled = true;
+  try {
+    const res  = await fetch(`/api/cycle/${CYCLE_ID}/archive`, {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({ text: _newsletterText }),
+    });
+    const data = await res.json();
+    if (!res.ok) throw new Error(data.error || res.status);
+    btn.innerHTML = `<i class="bi bi-check2 me-1"></i>登録済み（${data.sections}セクション）`;
+  } catch (err) {
+    alert('アーカイブに登録できませんでした: ' + err.message);
+    btn.disabled = false;
+  }
+}
+
+// ── ダウンロード ──
+function downloadNewsletter() {
+  if (!_newsletterText) return;
+  const vol   = document.getElementById('hdr-vol').value;
+  const year  = document.getElementById('hdr-year').value;
+  const month = String(document.getElementById('hdr-month').value).padStart(2, '0');
+  const day   = String(document.getElementById('hdr-day').value).padStart(2, '0');
+  const fname = `melmaga_vol${vol}_${year}${month}${day}.txt`;
+
+  const blob = new Blob([_newsletterText], { type: 'text/plain;charset=utf-8' });
+  const url  = URL.createObjectURL(blob);
+  const a    = document.createElement('a');
+  a.href = url; a.download = fname;
+  document.body.appendChild(a);
+  a.click();
+  document.body.removeChild(a);
+  URL.revokeObjectURL(url);
+}
@@ -0,0 +1,194 @@
+// 号の詳細（templates/cycle_detail.html）
+// 号の ID と原稿の版の一覧は読み込み元の <script data-cycle-id data-revisions> から受け取る。
+const CYCLE_ID = document.currentScript.dataset.cycleId;
+
+// ── ステップの完了切り替え ──
+// 連続したクリックは画面だけ先に切り替え、少し待ってから /api/batch にまとめて送る。
+const _pendingSteps = {};   // stepKey -> 完了にするか
+let _stepTimer = null;
+
+function setStepButton(btn, completed) {
+  const row  = btn.closest('.step-row');
+  const icon = btn.querySelector('i');
+  btn.classList.toggle('done', completed);
+  icon.className = completed ? 'bi bi-check-circle-fill' : 'bi bi-circle';
+  row.classList.toggle('step-done', completed);
+  if (completed) row.classList.remove('step-today');
+  btn.title = completed ? '完了済み（クリックで戻す）' : '完了にする';
+}
+
+function toggleStep(cycleId, stepKey, btn) {
+  const completed = !btn.classList.contains('done');
+  setStepButton(btn, completed);
+  _pendingSteps[stepKey] = completed;
+  clearTimeout(_stepTimer);
+  _stepTimer = setTimeout(() => flushSteps(cycleId), 400);
+}
+
+async function flushSteps(cycleId) {
+  const ops = Object.entries(_pendingSteps).map(([step, completed]) =>
+    ({cycle_id: cycleId, op: 'set_step', step, completed}));
+  Object.keys(_pendingSteps).forEach(k => delete _pendingSteps[k]);
+  if (!ops.length) return;
+  let data;
+  try {
+    const res = await fetch('/api/batch', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({ops}),
+    });
+    data = await res.json();
+  } catch (e) {
+    data = {error: String(e)};
+  }
+  if (data.error) {
+    alert('保存に失敗しました: ' + data.error);
+    location.reload();
+    return;
+  }
+  applyCycleState(data.cycles[cycleId]);
+}
+
+function applyCycleState(state) {
+  // 保存後の状態に合わせる（送信中に押されたボタンはそのまま）
+  document.querySelectorAll('.btn-toggle[data-step]').forEach(btn => {
+    const key = btn.dataset.step;
+    if (key in _pendingSteps || !state.steps[key]) return;
+    setStepButton(btn, !!state.steps[key].completed);
+  });
+  const p = state.progress;
+  document.getElementById('progress-pct').textContent   = p.pct;
+  document.getElementById('progress-bar').style.width   = p.pct + '%';
+  document.getElementById('progress-count').textContent = `${p.completed}/${p.total}`;
+}
+
+// 再スキャンの結果は提出状況の索引に保存される（ページの表示だけでは保存しない）
+async function refreshSubmissions() {
+  const res = await fetch(`/api/cycle/${CYCLE_ID}/submissions/refresh`, { method: 'POST' });
+  if (!res.ok) { alert('再スキャンに失敗しました'); return; }
+  location.reload();
+}
+
+// ── XServer 確認 ────────────────────────────────────────
+let _xsHost = '', _xsToken = '';
+let _xsFiles = {};   // 前回取得した一覧（差分の適用先）
+
+async function xsCheck() {
+  const url = document.getElementById('xs-url').value.trim();
+  const pw  = document.getElementById('xs-pw').value;
+  const statusEl = document.getElementById('xs-status');
+  const listEl   = document.getElementById('xs-file-list');
+
+  if (!url) { alert('URLを入力してください'); return; }
+
+  statusEl.style.display = 'block';
+  statusEl.innerHTML = '<span class="spinner-border spinner-border-sm me-2"></span>XServerからZIPを取得中...（数秒かかります）';
+  listEl.style.display = 'none';
+
+  // URLを保存
+  fetch(`/api/cycle/${CYCLE_ID}/xserver-save-url`, {
+    method: 'POST',
+    headers: {'Content-Type': 'application/json'},
+    body: JSON.stringify({ url }),
+  });
+
+  let result;
+  try {
+    const res = await fetch(`/api/cycle/${CYCLE_ID}/xserver-list`, {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      // 一覧表示だけなので本文は不要。手元の一覧（key と rev）からの差分だけを受け取る
+      body: JSON.stringify({ url, password: pw, previews_only: true,
+                             known: Object.fromEntries(Object.values(_xsFiles).map(f => [f.key, f.rev])) }),
+    });
+    result = await res.json();
+  } catch (e) {
+    statusEl.innerHTML = `<div class="alert alert-danger py-2 mb-0">通信エラー: ${e}</div>`;
+    return;
+  }
+
+  if (result.error) {
+    statusEl.innerHTML = `<div class="alert alert-danger py-2 mb-0"><i class="bi bi-exclamation-triangle me-1"></i>${result.error}</div>`;
+    return;
+  }
+
+  let note = '';
+  if (result.full) {
+    _xsFiles = {};
+    result.articles.forEach(f => { _xsFiles[f.key] = f; });
+  } else {
+    result.added.concat(result.changed).forEach(f => { _xsFiles[f.key] = f; });
+    result.removed.forEach(key => { delete _xsFiles[key]; });
+    const n = result.added.length + result.changed.length + result.removed.length;
+    note = n ? `（前回から 追加 ${result.added.length}・更新 ${result.changed.length}・削除 ${result.removed.length}）`
+             : '（前回から変更なし）';
+  }
+  const changedKeys = new Set(result.full ? [] : result.added.concat(result.changed).map(f => f.key));
+  const count = result.count;
+  const esc = t => String(t).replace(/[&<>"]/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'}[c]));
+  // 共有が複数のときは共有ごとの件数・所要時間・エラーも表示する
+  let shareNote = '';
+  if (result.shares && result.shares.length > 1) {
+    shareNote = '<ul class="small mb-0 mt-1">' + result.shares.map(r => r.error
+      ? `<li class="text-danger">${esc(r.label)}：${esc(r.error)}</li>`
+      : `<li>${esc(r.label)}：${r.count}件（${r.seconds.toFixed(1)}秒）</li>`).join('') + '</ul>';
+  }
+  statusEl.innerHTML = `<div class="alert alert-success py-2 mb-0"><i class="bi bi-check-circle me-1"></i>取得成功 — <strong>${count}件</strong>の原稿ファイルを確認${note}${shareNote}</div>`;
+
+  if (count === 0) { return; }
+
+  // ファイル一覧表示
+  let html = '<ul class="list-group list-group-flush">';
+  Object.values(_xsFiles).forEach(f => {
+    html += `<li class="list-group-item py-1 px-2 d-flex justify-content-between align-items-center">
+      <span><i class="bi bi-file-earmark-text text-primary me-2"></i>
+        <strong>${esc(f.dept)}</strong>
+        <span class="text-muted ms-2" style="font-size:11px;">${esc(f.filename)}</span>
+        ${changedKeys.has(f.key) ? '<span class="badge bg-warning text-dark ms-1">新着</span>' : ''}
+      </span>
+      <span class="text-muted small">${f.size_kb} KB</span>
+    </li>`;
+  });
+  html += '</ul>';
+
+  document.getElementById('xs-files-inner').innerHTML = html;
+  listEl.style.display = 'block';
+}
+// ── 原稿の版の比較 ──
+const REVISIONS = JSON.parse(document.currentScript.dataset.revisions || '{}');
+
+function diffDeptChanged() {
+  const dept = document.getElementById('diff-dept').value;
+  const hist = (REVISIONS[dept] || []).slice().reverse();
+  const opts = hist.map(r =>
+    `<option value="${r.hash}">${r.recorded_at.replace('T', ' ')}（${r.source === 'xserver' ? 'XServer' : 'フォルダ'}・${r.size}文字）</option>`
+  ).join('');
+  const a = document.getElementById('diff-a'), b = document.getElementById('diff-b');
+  a.innerHTML = opts;
+  b.innerHTML = opts;
+  if (hist.length > 1) a.selectedIndex = 1;
+  document.getElementById('diff-result').innerHTML = '';
+  document.getElementById('diff-stats').textContent = '';
+}
+
+async function showRevisionDiff() {
+  const a = document.getElementById('diff-a').value;
+  const b = document.getElementById('diff-b').value;
+  const out = document.getElementById('diff-result');
+  if (!a || !b) return;
+  const res  = await fetch(`/api/cycle/${CYCLE_ID}/diff?a=${a}&b=${b}`);
+  const data = await res.json();
+  if (data.error) { out.textContent = data.error; return; }
+  const esc = t => t.replace(/[&<>"]/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'}[c]));
+  const seg = (op, t) => op === 'insert' ? `<ins class="bg-success-subtle text-decoration-none">${esc(t)}</ins>`
+                       : op === 'delete' ? `<del class="bg-danger-subtle">${esc(t)}</del>` : esc(t);
+  out.innerHTML = data.blocks.map(bl => {
+    if (bl.op === 'change') return `<div class="py-1">${bl.segments.map(s => seg(s[0], s[1])).join('')}</div>`;
+    const cls = bl.op === 'insert' ? 'bg-success-subtle' : bl.op === 'delete' ? 'bg-danger-subtle' : '';
+    return `<div class="py-1 ${cls}">${seg(bl.op, bl.text) || '&nbsp;'}</div>`;
+  }).join('');
+  document.getElementById('diff-stats').textContent =
+    a === b ? '同じ版です' : `追加 ${data.stats.inserted}文字 ／ 削除 ${data.stats.deleted}文字`;
+}
+
+if (document.getElementById('diff-dept')) diffDeptChanged();